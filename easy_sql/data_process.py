@@ -69,15 +69,28 @@ def _data_process(sql_file: str, vars: Optional[str], dry_run: Optional[str], pr
                           for v in vars.split(',') if v.strip()] if vars else [])
         variables.update(vars_dict)
 
-        sql_processor = SqlProcessor(backend, config.sql, variables=variables)
+        sql_processor = SqlProcessor(backend, config.sql, variables=variables, parse_cache_dir=config.parse_cache_dir)
         if config.udf_file_path:
             sql_processor.register_udfs_from_pyfile(resolve_file(config.udf_file_path) if '/' in config.udf_file_path else config.udf_file_path)
         if config.func_file_path:
             sql_processor.register_funcs_from_pyfile(resolve_file(config.func_file_path) if '/' in config.func_file_path else config.func_file_path)
 
-        sql_processor.run(dry_run=dry_run)
-
-    backend: Backend = create_sql_processor_backend(config.backend, config.sql, config.task_name)
+        if config.checkpoint_dir:
+            sql_processor.enable_checkpoint(config.checkpoint_dir)
+        if config.result_cache_dir:
+            sql_processor.enable_result_cache(config.result_cache_dir)
+        profiler = sql_processor.enable_profiling() if config.profile_dir else None
+        try:
+            sql_processor.run(dry_run=dry_run, parallelism=config.parallelism)
+        finally:
+            if profiler is not None:
+                os.makedirs(config.profile_dir, exist_ok=True)
+                profile_file_prefix = path.join(config.profile_dir, config.task_name)
+                profiler.export_json(f'{profile_file_prefix}.profile.json')
+                profiler.export_chrome_trace(f'{profile_file_prefix}.trace.json')
+                print(f'profiles of the steps are exported to {profile_file_prefix}.profile.json and {profile_file_prefix}.trace.json')
+
+    backend: Backend = create_sql_processor_backend(config.backend, config.sql, config.task_name, config.parallelism)
 
     backend_is_bigquery = config.backend == 'bigquery'
     pre_defined_vars = {'temp_db': backend.temp_schema if backend_is_bigquery else None}
@@ -87,7 +100,7 @@ def _data_process(sql_file: str, vars: Optional[str], dry_run: Optional[str], pr
         backend.clean()
 
 
-def create_sql_processor_backend(backend: str, sql: str, task_name: str) -> 'Backend':
+def create_sql_processor_backend(backend: str, sql: str, task_name: str, parallelism: int = 1) -> 'Backend':
     if backend == 'spark':
         from easy_sql.spark_optimizer import get_spark
         from easy_sql.sql_processor.backend import SparkBackend
@@ -102,13 +115,13 @@ def create_sql_processor_backend(backend: str, sql: str, task_name: str) -> 'Bac
         from easy_sql.sql_processor.backend.rdb import RdbBackend, _exec_sql
         if backend == 'postgres':
             assert 'PG_URL' in os.environ, 'Must set PG_URL env var to run an ETL with postgres backend.'
-            backend = RdbBackend(os.environ['PG_URL'])
+            backend = RdbBackend(os.environ['PG_URL'], pool_size=parallelism)
         elif backend == 'clickhouse':
             assert 'CLICKHOUSE_URL' in os.environ, 'Must set CLICKHOUSE_URL env var to run an ETL with Clickhouse backend.'
-            backend = RdbBackend(os.environ['CLICKHOUSE_URL'])
+            backend = RdbBackend(os.environ['CLICKHOUSE_URL'], pool_size=parallelism)
         elif backend == 'bigquery':
             assert 'BIGQUERY_CREDENTIAL_FILE' in os.environ, 'Must set BIGQUERY_CREDENTIAL_FILE env var to run an ETL with BigQuery backend.'
-            backend = RdbBackend('bigquery://', credentials=os.environ['BIGQUERY_CREDENTIAL_FILE'])
+            backend = RdbBackend('bigquery://', credentials=os.environ['BIGQUERY_CREDENTIAL_FILE'], pool_size=parallelism)
         else:
             raise Exception(f'unsupported backend: {backend}')
         exec_sql = lambda sql: _exec_sql(backend.conn, sql)
@@ -171,6 +184,46 @@ class EasySqlConfig:
                 spark_submit = c[c.index('=') + 1:].strip()
         return spark_submit
 
+    @property
+    def parallelism(self) -> int:
+        parallelism = 1
+        for c in self.customized_easy_sql_conf:
+            if c.startswith("parallelism"):
+                parallelism = int(c[c.index('=') + 1:].strip())
+        return parallelism
+
+    @property
+    def parse_cache_dir(self) -> Optional[str]:
+        parse_cache_dir = None
+        for c in self.customized_easy_sql_conf:
+            if c.startswith("parse_cache_dir"):
+                parse_cache_dir = c[c.index('=') + 1:].strip()
+        return parse_cache_dir
+
+    @property
+    def profile_dir(self) -> Optional[str]:
+        profile_dir = None
+        for c in self.customized_easy_sql_conf:
+            if c.startswith("profile_dir"):
+                profile_dir = c[c.index('=') + 1:].strip()
+        return profile_dir
+
+    @property
+    def checkpoint_dir(self) -> Optional[str]:
+        checkpoint_dir = None
+        for c in self.customized_easy_sql_conf:
+            if c.startswith("checkpoint_dir"):
+                checkpoint_dir = c[c.index('=') + 1:].strip()
+        return checkpoint_dir
+
+    @property
+    def result_cache_dir(self) -> Optional[str]:
+        result_cache_dir = None
+        for c in self.customized_easy_sql_conf:
+            if c.startswith("result_cache_dir"):
+                result_cache_dir = c[c.index('=') + 1:].strip()
+        return result_cache_dir
+
     @property
     def task_name(self):
         sql_name = path.basename(self.sql_file)[:-4]
@@ -13,6 +13,39 @@ class EasySqlConfigTest(unittest.TestCase):
 -- config: spark.files=test/sample_etl.spark.sql,test/sample_etl.postgres.sql,
         ''', sql_file='')
         self.assertEqual(config.spark_submit, '/my/custom/spark-submit')
+        self.assertEqual(config.parallelism, 1)
         print(config.spark_conf_command_args())
         self.assertEqual(config.spark_conf_command_args()[-1].count(','), 3)
         self.assertEqual(config.spark_submit, '/my/custom/spark-submit')
+
+    def test_parse_parallelism_config(self):
+        config = EasySqlConfig.from_sql(sql='''
+-- config: easy_sql.parallelism=4
+        ''', sql_file='')
+        self.assertEqual(config.parallelism, 4)
+        self.assertIsNone(config.parse_cache_dir)
+
+    def test_parse_parse_cache_dir_config(self):
+        config = EasySqlConfig.from_sql(sql='''
+-- config: easy_sql.parse_cache_dir=/tmp/easy_sql_cache
+        ''', sql_file='')
+        self.assertEqual(config.parse_cache_dir, '/tmp/easy_sql_cache')
+
+    def test_parse_profile_dir_config(self):
+        config = EasySqlConfig.from_sql(sql='''
+-- config: easy_sql.profile_dir=/tmp/easy_sql_profiles
+        ''', sql_file='')
+        self.assertEqual(config.profile_dir, '/tmp/easy_sql_profiles')
+
+    def test_parse_checkpoint_dir_config(self):
+        config = EasySqlConfig.from_sql(sql='''
+-- config: easy_sql.checkpoint_dir=/tmp/easy_sql_checkpoints/etl_a
+        ''', sql_file='')
+        self.assertEqual(config.checkpoint_dir, '/tmp/easy_sql_checkpoints/etl_a')
+
+    def test_parse_result_cache_dir_config(self):
+        config = EasySqlConfig.from_sql(sql='''
+-- config: easy_sql.result_cache_dir=/tmp/easy_sql_results
+        ''', sql_file='')
+        self.assertEqual(config.result_cache_dir, '/tmp/easy_sql_results')
+        self.assertIsNone(config.checkpoint_dir)
@@ -1,8 +1,9 @@
+import contextlib
 from enum import Enum
-from typing import Dict, Callable, List, Tuple, Any, Union
+from typing import Dict, Callable, List, Tuple, Any, Union, Iterator, ContextManager, Optional
 
 __all__ = [
-    'Backend', 'Table', 'Row', 'TableMeta', 'Partition', 'SaveMode'
+    'Backend', 'Table', 'Row', 'RowSchema', 'SchemaRow', 'TableMeta', 'Partition', 'SaveMode', 'QueryPlan'
 ]
 
 
@@ -39,6 +40,29 @@ class Backend:
     def reset(self):
         raise NotImplementedError()
 
+    def support_concurrent_execution(self) -> bool:
+        return False
+
+    def explain(self, table: 'Table', analyze: bool = False) -> Optional['QueryPlan']:
+        """
+        Returns the plan of the query of the table, or None if the backend could not explain it.
+        When analyze is True, the query may be executed to collect the actual metrics, where the backend supports it.
+        """
+        return None
+
+    def catalog_cache_scope(self) -> ContextManager:
+        """
+        Metadata of tables could be cached within the returned context, e.g. during one run of the sql processor.
+        """
+        return contextlib.nullcontext()
+
+    def progress_scope(self, listener: Callable[[str], None]) -> ContextManager:
+        """
+        Messages about the progress of the queries submitted within the returned context are sent to listener,
+        for backends running queries as remote jobs.
+        """
+        return contextlib.nullcontext()
+
     def init_udfs(self, *args, **kwargs):
         raise NotImplementedError()
 
@@ -63,7 +87,11 @@ class Backend:
     def clear_temp_tables(self, exclude: List[str] = None):
         raise NotImplementedError()
 
-    def create_temp_table(self, table: 'Table', name: str):
+    def create_temp_table(self, table: 'Table', name: str, materialize: bool = False):
+        """
+        :param materialize: for backends creating temp tables as views, create a physical table instead,
+            so that the query is executed only once no matter how many times the table is read
+        """
         raise NotImplementedError()
 
     def create_cache_table(self, table: 'Table', name: str):
@@ -78,12 +106,42 @@ class Backend:
     def refresh_table_partitions(self, table: 'TableMeta'):
         raise NotImplementedError()
 
-    def save_table(self, source_table: 'TableMeta', target_table: 'TableMeta', save_mode: 'SaveMode', create_target_table: bool):
+    def save_table(self, source_table: 'TableMeta', target_table: 'TableMeta', save_mode: 'SaveMode', create_target_table: bool,
+                   staged: bool = False):
+        """
+        :param staged: write to a staging location first and then switch the target table to it,
+            so that readers never observe partially written data. Backends not supporting it save the table directly.
+        """
         raise NotImplementedError()
 
     def clean(self):
         raise NotImplementedError()
 
+    def materialize_table(self, table_name: str, data_dir: str, data_id: str) -> str:
+        """
+        Persist the data of the temp table, so that it could be restored in another run by load_materialized_table.
+        :param data_dir: the directory to keep the data, e.g. the directory of the checkpoint, backends storing data in files should put the data under it
+        :param data_id: an id of the data unique in all the data directories, the same id refers to the same data
+        :return: the location of the persisted data
+        """
+        raise NotImplementedError()
+
+    def load_materialized_table(self, location: str, table_name: str):
+        """
+        Create the temp table from the data persisted by materialize_table.
+        """
+        raise NotImplementedError()
+
+    def drop_materialized_table(self, location: str):
+        raise NotImplementedError()
+
+    def table_version(self, table_name: str) -> Optional[str]:
+        """
+        Returns a version of the data of the table which changes whenever the data changes,
+        or None if the version could not be decided (e.g. the table does not exist or it is a temp table).
+        """
+        return None
+
     def create_table_with_data(self, full_table_name: str, values: List[List[Any]], schema: Union['StructType', List[Col]], partitions: List['Partition']):
         raise NotImplementedError()
 
@@ -91,6 +149,16 @@ class Backend:
         raise NotImplementedError()
 
 
+class QueryPlan:
+
+    def __init__(self, plan: str, metrics: Dict[str, Any] = None):
+        self.plan = plan
+        self.metrics = metrics or {}
+
+    def __repr__(self):
+        return f'QueryPlan(metrics={self.metrics}, plan={self.plan})'
+
+
 class Partition:
     def __init__(self, field: str, value=None):
         self.field = field
@@ -179,6 +247,22 @@ class Table:
     def collect(self) -> List['Row']:
         raise NotImplementedError()
 
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[List['Row']]:
+        """
+        Iterate all the rows of the table in batches of at most batch_size rows,
+        rows are fetched from the backend lazily so that large tables could be consumed with bounded memory.
+        """
+        raise NotImplementedError()
+
+    def iter_column_batches(self, batch_size: int = 1000) -> Iterator[List[tuple]]:
+        """
+        The same as `iter_batches`, but every batch is a list of columns in the order of `field_names`,
+        which avoids creating row objects when the values are consumed by column.
+        """
+        field_count = len(self.field_names())
+        for rows in self.iter_batches(batch_size):
+            yield [tuple([row[i] for row in rows]) for i in range(field_count)]
+
     def show(self, count: int):
         raise NotImplementedError()
 
@@ -187,6 +271,7 @@ class Table:
 
 
 class Row:
+    __slots__ = ()
 
     def as_dict(self) -> Dict[str, Any]:
         raise NotImplementedError()
@@ -199,3 +284,70 @@ class Row:
 
     def as_tuple(self) -> Tuple:
         raise NotImplementedError()
+
+
+class RowSchema:
+    """
+    Names (and optionally types) of the columns of a result, created once and shared by all the rows of the result.
+    """
+    __slots__ = ('names', 'types', '_indexes')
+
+    def __init__(self, names: List[str], types: List[str] = None):
+        self.names = list(names)
+        self.types = None if types is None else list(types)
+        self._indexes = None
+
+    def index(self, name: str) -> int:
+        if self._indexes is None:
+            self._indexes = dict([(name, i) for i, name in enumerate(self.names)])
+        return self._indexes[name]
+
+    def __eq__(self, other: 'RowSchema'):
+        return isinstance(other, RowSchema) and (self is other or self.names == other.names)
+
+    def __hash__(self):
+        return hash(tuple(self.names))
+
+    def __repr__(self):
+        return f'RowSchema({self.names})'
+
+
+class SchemaRow(Row):
+    """
+    A row holding only its values, with the column names in the schema shared by the rows of the same result.
+    """
+    __slots__ = ('schema', 'values')
+
+    def __init__(self, schema: RowSchema, values: Optional[Tuple]):
+        self.schema = schema
+        self.values = values
+
+    def as_dict(self) -> Optional[Dict[str, Any]]:
+        return None if self.values is None else dict(zip(self.schema.names, self.values))
+
+    def as_tuple(self) -> Optional[Tuple]:
+        return self.values
+
+    def __getitem__(self, i):
+        return self.values[self.schema.index(i) if isinstance(i, str) else i]
+
+    def __len__(self):
+        return 0 if self.values is None else len(self.values)
+
+    def __iter__(self):
+        return iter(self.values or ())
+
+    def __eq__(self, other):
+        if isinstance(other, SchemaRow):
+            return self.schema == other.schema and self.values == other.values
+        if isinstance(other, tuple):
+            return self.values == other
+        return False
+
+    __hash__ = None
+
+    def __str__(self):
+        return f'({", ".join([f"{k}={v!r}" for k, v in zip(self.schema.names, self.values or ())])})'
+
+    def __repr__(self):
+        return f'{type(self).__name__}{self}'
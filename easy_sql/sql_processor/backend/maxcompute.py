@@ -1,9 +1,12 @@
+import contextlib
+import threading
 import time
+import uuid
 from enum import Enum
-from random import random
-from typing import Dict, Callable, List, Any, Tuple, Optional
+from typing import Dict, Callable, List, Any, Tuple, Optional, Iterator, Iterable, ContextManager
 
 from .base import *
+from ..common import extract_table_names, has_unparsed_table_list
 from ...logger import logger
 # TODO: SqlExpr should be a common class
 from .rdb import SqlExpr
@@ -14,20 +17,158 @@ def _exec_sql(conn, sql: str):
     conn.execute_sql(sql)
 
 
+class _PendingInstance:
+
+    def __init__(self, sql: str, instance, listener: Optional[Callable[[str], None]]):
+        self.sql = sql
+        self.instance = instance
+        self.listener = listener
+        self.submit_time = time.time()
+        self.finished = False
+        self.error: Optional[Exception] = None
+
+
+class InstancePoller:
+    """
+    Submit sqls as ODPS instances without waiting for them, so that independent jobs are queued and run together.
+
+    An instance creating a table (e.g. a view) is pending until it is waited, and any sql reading the table submitted later
+    waits for it first. Pending instances are polled every poll_interval seconds,
+    and a message is sent to the progress listener of the submitting thread when an instance finishes.
+    The error of a failed instance is kept with the instance, and raised only when the instance (or the table it creates) is waited.
+    """
+
+    def __init__(self, conn, poll_interval: float = 1.0):
+        self.conn = conn
+        self.poll_interval = poll_interval
+        self._pending: Dict[str, _PendingInstance] = {}
+        self._lock = threading.Lock()
+        # sqls creating the same table are submitted one by one, so that the last submitted decides the table
+        self._create_locks: Dict[str, threading.Lock] = {}
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def progress_scope(self, listener: Callable[[str], None]):
+        previous_listener = getattr(self._local, 'listener', None)
+        self._local.listener = listener
+        try:
+            yield
+        finally:
+            self._local.listener = previous_listener
+
+    def submit(self, sql: str, creates: str = None) -> _PendingInstance:
+        """
+        Submit the sql after the tables it reads are created.
+        :param creates: name of the table created by the sql, sqls reading the table will wait for the instance
+        """
+        if has_unparsed_table_list(sql):
+            self.wait_all()
+        else:
+            self.wait_for_tables(extract_table_names(sql))
+        if not creates:
+            return self._run_sql(sql)
+        with self._lock:
+            create_lock = self._create_locks.setdefault(creates.lower(), threading.Lock())
+        with create_lock:
+            with self._lock:
+                previous_instance = self._pending.get(creates.lower())
+            if previous_instance is not None:
+                # the error of the previous instance is not relevant any more, since the table is created again
+                self.wait([previous_instance], raise_error=False)
+            pending_instance = self._run_sql(sql)
+            with self._lock:
+                self._pending[creates.lower()] = pending_instance
+        return pending_instance
+
+    def _run_sql(self, sql: str) -> _PendingInstance:
+        logger.info(f'submit sql: {sql}')
+        return _PendingInstance(sql, self.conn.run_sql(sql), getattr(self._local, 'listener', None))
+
+    def execute(self, sql: str):
+        """
+        Submit the sql and wait for it, returns the instance.
+        """
+        pending_instance = self.submit(sql)
+        self.wait([pending_instance])
+        return pending_instance.instance
+
+    def wait_for_tables(self, table_names: Iterable[str]):
+        with self._lock:
+            pending_instances = [self._pending[name.lower()] for name in table_names if name.lower() in self._pending]
+        self.wait(pending_instances)
+
+    def wait_all(self):
+        """
+        Wait for all the pending instances, errors of the failed instances are raised when they are waited by the sqls reading their tables.
+        """
+        with self._lock:
+            pending_instances = list(self._pending.values())
+        self.wait(pending_instances, raise_error=False)
+
+    def wait(self, pending_instances: List[_PendingInstance], raise_error: bool = True):
+        pending_instances = list(pending_instances)
+        running_instances = [p for p in pending_instances if not p.finished]
+        while running_instances:
+            for pending_instance in [p for p in running_instances if p.instance.is_terminated()]:
+                running_instances.remove(pending_instance)
+                self._finish(pending_instance)
+            if running_instances:
+                logger.info(f'waiting for {len(running_instances)} instances: {", ".join([p.instance.id for p in running_instances])}')
+                time.sleep(self.poll_interval)
+        if raise_error:
+            for pending_instance in pending_instances:
+                if pending_instance.error is not None:
+                    raise pending_instance.error
+
+    def _finish(self, pending_instance: _PendingInstance):
+        try:
+            pending_instance.instance.wait_for_success()
+        except Exception as e:
+            error = e
+        else:
+            error = None
+        with self._lock:
+            if pending_instance.finished:
+                return
+            pending_instance.finished, pending_instance.error = True, error
+            # failed instances are kept, so that the sqls reading their tables raise the error
+            if error is None:
+                for name in [name for name, p in self._pending.items() if p is pending_instance]:
+                    del self._pending[name]
+        status = 'finished' if error is None else f'failed ({error})'
+        message = f'instance {pending_instance.instance.id} {status} in {time.time() - pending_instance.submit_time:.1f}s: ' \
+                  f'{pending_instance.sql.strip()[:200]}'
+        if error is None:
+            logger.info(message)
+        else:
+            logger.warning(message)
+        if pending_instance.listener is not None:
+            pending_instance.listener(message)
+
+
 class PartitionMode(Enum):
     ALL_DYNAMIC = 0,
     ALL_STATIC = 1,
     HYBRID = 2
 
 
-class MaxComputeRow(Row):
+def _row_schema(odps_schema) -> RowSchema:
+    return RowSchema([c.name for c in odps_schema.columns], [c.type.name for c in odps_schema.columns])
+
+
+class MaxComputeRow(SchemaRow):
+    __slots__ = ()
 
     def __init__(self, schema, values: Optional[Tuple]):
-        from odps.types import Record
-        self.row = Record(schema=schema, values=values)
-        self.columns = [c.name for c in schema.columns]
-        self.types = [c.type.name for c in schema.columns]
-        self.values = self.row.values
+        """
+        :param schema: the OdpsSchema of the row, or the RowSchema shared by the rows of a result
+        """
+        if not isinstance(schema, RowSchema):
+            from odps.types import Record
+            # values are validated and converted by the record, e.g. when created from literal values in tests
+            values = None if values is None else tuple(Record(schema=schema, values=values).values)
+            schema = _row_schema(schema)
+        super().__init__(schema, values)
 
     @staticmethod
     def from_schema_meta(cols: List[str], types: List[str], values: Optional[Tuple],
@@ -36,25 +177,27 @@ class MaxComputeRow(Row):
         schema = OdpsSchema.from_lists(cols, types, partition_names=pt_cols, partition_types=pt_types)
         return MaxComputeRow(schema=schema, values=values)
 
-    def as_dict(self):
-        return dict(self.row)
+    @property
+    def columns(self) -> List[str]:
+        return self.schema.names
 
-    def as_tuple(self) -> Tuple:
-        return self.row
+    @property
+    def types(self) -> List[str]:
+        return self.schema.types
 
     def __eq__(self, other):
         if not isinstance(other, MaxComputeRow):
             return False
         return self.columns == other.columns and self.values == other.values
 
-    def __str__(self):
-        return str(self.row)[12:]
-
-    def __getitem__(self, i):
-        return self.row[i]
+    __hash__ = None
 
-    def __repr__(self):
-        return self.row.__repr__()
+    def __str__(self):
+        # the same as the format of odps records, without the leading `odps.Record `
+        space = 2 * max([len(name) for name in self.columns] or [0])
+        values = self.values if self.values is not None else (None,) * len(self.columns)
+        lines = '\n'.join([f'{name.ljust(space)}{value!r}' for name, value in zip(self.columns, values)]).split('\n')
+        return '{\n' + '\n'.join([f'  {line}' if line else line for line in lines]) + '\n}'
 
 
 class MaxComputeTable(Table):
@@ -65,13 +208,31 @@ class MaxComputeTable(Table):
         # TODO: consider and the job id, for batch delete views
         # TODO: eg. backend.job_id, as to the part of temp table name
         # TODO: table_name need with suffix to avoid parallel run
-        self.table_name = table_name or f"t_{int(time.mktime(time.gmtime()))}_{int(random() * 10000):04d}"
-        self.backend.conn.execute_sql(f"create or replace view {self.table_name} as {sql}")
-        # The MaxCompute view can not be read when using table frame, must transform to dataframe
-        self.df = self.backend.get_table(self.table_name).to_df()
+        self.table_name = table_name or f't_{uuid.uuid4().hex}'
+        # the view is created asynchronously, the data frame is created when the view is first read
+        self.backend.poller.submit(f"create or replace view {self.table_name} as {sql}", creates=self.table_name)
         self.backend.append_temp_view(self.table_name)
-        from odps.types import OdpsSchema
-        self.schema = OdpsSchema.from_lists(self.df.data.schema.names, self.df.data.schema.types)
+        self._df, self._schema, self._row_schema = None, None, None
+
+    @property
+    def df(self):
+        if self._df is None:
+            # The MaxCompute view can not be read when using table frame, must transform to dataframe
+            self._df = self.backend.get_table(self.table_name).to_df()
+        return self._df
+
+    @property
+    def schema(self):
+        if self._schema is None:
+            from odps.types import OdpsSchema
+            self._schema = OdpsSchema.from_lists(self.df.data.schema.names, self.df.data.schema.types)
+        return self._schema
+
+    @property
+    def row_schema(self) -> RowSchema:
+        if self._row_schema is None:
+            self._row_schema = _row_schema(self.schema)
+        return self._row_schema
 
     @staticmethod
     def from_table_meta(backend, table_meta: TableMeta):
@@ -87,7 +248,7 @@ class MaxComputeTable(Table):
         return table
 
     def is_empty(self) -> bool:
-        return 0 == self.count()
+        return len(self.df.head(1)) == 0
 
     def field_names(self) -> List[str]:
         return self.schema.names
@@ -99,8 +260,8 @@ class MaxComputeTable(Table):
         import numpy
         row = [x.values for x in self.df.head(1)]
         value = row[0] if row else None
-        value = [bool(v) if isinstance(v, numpy.bool_) else v for v in value]
-        return MaxComputeRow(schema=self.schema, values=tuple(value))
+        value = None if value is None else tuple([bool(v) if isinstance(v, numpy.bool_) else v for v in value])
+        return MaxComputeRow(schema=self.row_schema, values=value)
 
     def limit(self, count: int) -> 'MaxComputeTable':
         return MaxComputeTable(self.backend, f"select * from {self.table_name} limit {count}")
@@ -110,7 +271,19 @@ class MaxComputeTable(Table):
         return MaxComputeTable(self.backend, f"select *, {value_expr} as {name} from {self.table_name}")
 
     def collect(self, count: int = 1000) -> List['Row']:
-        return [MaxComputeRow(schema=self.schema, values=tuple(r.values)) for r in self.df.head(count)]
+        return [MaxComputeRow(schema=self.row_schema, values=tuple(r.values)) for r in self.df.head(count)]
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[List['Row']]:
+        instance = self.backend.poller.execute(f'select * from {self.table_name}')
+        with instance.open_reader(tunnel=True) as reader:
+            batch = []
+            for record in reader:
+                batch.append(MaxComputeRow(schema=self.row_schema, values=tuple(record.values)))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
 
     def show(self, count: int = 20):
         print('\t'.join(self.field_names()))
@@ -172,9 +345,16 @@ class MaxComputeTable(Table):
 
 class MaxComputeBackend(Backend):
 
-    def __init__(self, sql_expr: SqlExpr, **kwargs):
+    # max number of drop instances running at the same time when clearing temp views
+    CLEAR_TEMP_VIEWS_PARALLELISM = 20
+
+    def __init__(self, sql_expr: SqlExpr, poll_interval: float = 1.0, **kwargs):
+        """
+        :param poll_interval: seconds between two polls of the status of the submitted instances
+        """
         from odps import ODPS
         self.conn = ODPS(**kwargs)
+        self.poller = InstancePoller(self.conn, poll_interval)
         self.temp_views = []
         self.sql_expr = sql_expr or SqlExpr()
 
@@ -185,8 +365,15 @@ class MaxComputeBackend(Backend):
         options.sql.settings = {'odps.sql.allow.fullscan': True}
 
     def get_table(self, table_name):
+        self.poller.wait_for_tables([table_name])
         return self.conn.get_table(table_name)
 
+    def support_concurrent_execution(self) -> bool:
+        return True
+
+    def progress_scope(self, listener: Callable[[str], None]) -> ContextManager:
+        return self.poller.progress_scope(listener)
+
     def init_udfs(self, *args, **kwargs):
         pass
 
@@ -198,8 +385,9 @@ class MaxComputeBackend(Backend):
         return MaxComputeTable(self, 'select 1 as a')
 
     def exec_native_sql(self, sql: str) -> Any:
-        logger.info(f"will exec sql: {sql}")
-        return self.conn.execute_sql(sql)
+        # the tables read by native sql could not be decided reliably, wait for all the pending instances
+        self.poller.wait_all()
+        return self.poller.execute(sql)
 
     def exec_sql(self, sql: str) -> 'MaxComputeTable':
         # TODO: extract all temp table names and replace as the mapped temp view name
@@ -218,41 +406,48 @@ class MaxComputeBackend(Backend):
         self.clear_temp_tables()
 
     def _clear_temp_views(self, exclude: List[str] = None):
-        # TODO: consider view dependencies
-        for temp_view in self.temp_views:
-            if exclude and temp_view in exclude:
-                continue
-            self.conn.execute_sql(f'drop view if exists {temp_view}')
+        self.poller.wait_all()
+        # drop in the reverse order of creation, since later views may depend on earlier ones
+        temp_views = [temp_view for temp_view in dict.fromkeys(reversed(self.temp_views)) if not (exclude and temp_view in exclude)]
+        # every statement runs as an instance, submit them without waiting so that they run concurrently
+        for i in range(0, len(temp_views), self.CLEAR_TEMP_VIEWS_PARALLELISM):
+            batch = temp_views[i:i + self.CLEAR_TEMP_VIEWS_PARALLELISM]
+            logger.info(f'dropping temp views: {batch}')
+            self.poller.wait([self.poller.submit(f'drop view if exists {temp_view}') for temp_view in batch])
+        self.temp_views = [temp_view for temp_view in self.temp_views if temp_view not in temp_views]
 
     def clear_temp_tables(self, exclude: List[str] = None):
         self._clear_temp_views(exclude)
 
-    def create_temp_table(self, table: 'MaxComputeTable', name: str):
+    def create_temp_table(self, table: 'MaxComputeTable', name: str, materialize: bool = False):
         logger.info(f'create_temp_table with: table={table}, name={name}')
-        self.conn.execute_sql(f'create or replace view {name} as select * from {table.table_name}')
+        self.poller.submit(f'create or replace view {name} as select * from {table.table_name}', creates=name)
         self.append_temp_view(name)
 
     def create_cache_table(self, table: 'MaxComputeTable', name: str):
         logger.info(f'create_cache_table with: table={table}, name={name}')
-        self.conn.execute_sql(f'create or replace view {name} as select * from {table.table_name}')
+        self.poller.submit(f'create or replace view {name} as select * from {table.table_name}', creates=name)
         self.append_temp_view(name)
 
     def broadcast_table(self, table: 'MaxComputeTable', name: str):
         logger.info(f'broadcast_table with: table={table}, name={name}')
-        self.conn.execute_sql(f'create or replace view {name} as select * from {table.table_name}')
+        self.poller.submit(f'create or replace view {name} as select * from {table.table_name}', creates=name)
         self.append_temp_view(name)
 
     def table_exists(self, table: 'TableMeta'):
+        self.poller.wait_for_tables([table.table_name])
         return self.conn.exist_table(table.table_name)
 
     def refresh_table_partitions(self, table: 'TableMeta'):
         pass
 
     def save_table(self, source_table_meta: 'TableMeta', target_table_meta: 'TableMeta', save_mode: 'SaveMode',
-                   create_target_table: bool):
+                   create_target_table: bool, staged: bool = False):
         logger.info(f'save table with: source_table={source_table_meta.table_name}, '
                     f'target_table={target_table_meta.table_name}, '
                     f'save_mode={save_mode}, create_target_table={create_target_table}')
+        if staged:
+            logger.info('staged write is not supported for maxcompute backend, will save table directly')
         if not self.table_exists(target_table_meta) and not create_target_table:
             raise Exception(f'target table {target_table_meta.table_name} does not exist, '
                             f'and create_target_table is False, '
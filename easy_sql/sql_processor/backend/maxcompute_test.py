@@ -0,0 +1,104 @@
+import unittest
+
+from easy_sql.sql_processor.backend import RowSchema
+from easy_sql.sql_processor.backend.maxcompute import InstancePoller, MaxComputeRow
+
+
+class _FakeInstance:
+
+    def __init__(self, id: str, polls_to_finish: int, failed: bool = False):
+        self.id = id
+        self.polls_to_finish = polls_to_finish
+        self.failed = failed
+
+    def is_terminated(self):
+        self.polls_to_finish -= 1
+        return self.polls_to_finish <= 0
+
+    def wait_for_success(self):
+        if self.failed:
+            raise Exception(f'instance {self.id} failed')
+
+
+class _FakeConn:
+
+    def __init__(self):
+        self.submitted, self.instances = [], []
+
+    def run_sql(self, sql: str):
+        self.submitted.append(sql)
+        failed = 'fail' in sql
+        self.instances.append(_FakeInstance(f'i{len(self.instances)}', 2, failed))
+        return self.instances[-1]
+
+
+class InstancePollerTest(unittest.TestCase):
+
+    def test_should_wait_for_the_tables_read_before_submitting(self):
+        conn, messages = _FakeConn(), []
+        poller = InstancePoller(conn, poll_interval=0)
+        with poller.progress_scope(messages.append):
+            poller.submit('create or replace view a as select * from db.t', creates='a')
+            poller.submit('create or replace view b as select * from db.t', creates='b')
+            # views a and b are created concurrently
+            self.assertEqual([instance.polls_to_finish for instance in conn.instances], [2, 2])
+            poller.submit('create or replace view c as select * from a', creates='c')
+        self.assertEqual([instance.polls_to_finish for instance in conn.instances], [0, 2, 2])
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0].startswith('instance i0 finished'))
+
+        poller.wait_all()
+        self.assertEqual(len(messages), 3)
+        self.assertTrue(all(instance.polls_to_finish <= 0 for instance in conn.instances))
+
+    def test_should_submit_sqls_creating_the_same_table_in_order(self):
+        conn = _FakeConn()
+        poller = InstancePoller(conn, poll_interval=0)
+        poller.submit('create or replace view a as select 1 as id', creates='a')
+        poller.submit('create or replace view a as select 2 as id', creates='A')
+        # the first instance finished before the second one is submitted
+        self.assertEqual([instance.polls_to_finish for instance in conn.instances], [0, 2])
+
+    def test_should_wait_for_all_when_tables_read_are_not_parsed(self):
+        conn = _FakeConn()
+        poller = InstancePoller(conn, poll_interval=0)
+        poller.submit('create or replace view b as select * from db.t', creates='b')
+        poller.submit('create or replace view c as select * from (select * from db.t) t, b', creates='c')
+        self.assertEqual([instance.polls_to_finish for instance in conn.instances], [0, 2])
+
+    def test_should_raise_when_instance_failed(self):
+        poller = InstancePoller(_FakeConn(), poll_interval=0)
+        poller.submit('create or replace view a as select fail from db.t', creates='a')
+        with self.assertRaisesRegex(Exception, 'instance i0 failed'):
+            poller.execute('select * from a')
+        # the failed instance is not waited again
+        poller.wait_all()
+
+    def test_should_raise_error_only_when_the_failed_instance_is_waited(self):
+        conn, messages = _FakeConn(), []
+        poller = InstancePoller(conn, poll_interval=0)
+        with poller.progress_scope(messages.append):
+            poller.submit('create or replace view a as select fail from db.t', creates='a')
+        poller.submit('create or replace view b as select * from db.t', creates='b')
+        poller.execute('select * from b')
+        poller.wait_all()
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0].startswith('instance i0 failed'))
+
+        with self.assertRaisesRegex(Exception, 'instance i0 failed'):
+            poller.execute('select * from a')
+        # the view is created again
+        poller.submit('create or replace view a as select * from db.t', creates='a')
+        poller.execute('select * from a')
+
+
+class MaxComputeRowTest(unittest.TestCase):
+
+    def test_should_format_row_as_odps_record(self):
+        row = MaxComputeRow(RowSchema(['id', 'val'], ['bigint', 'string']), (1, 'a'))
+        self.assertEqual(str(row), "{\n  id    1\n  val   'a'\n}")
+        self.assertEqual(str(MaxComputeRow(RowSchema(['id'], ['bigint']), None)), '{\n  id  None\n}')
+
+
+if __name__ == '__main__':
+    unittest.main()
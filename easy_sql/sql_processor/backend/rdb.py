@@ -1,8 +1,13 @@
+import contextlib
+import itertools
 import re
+import threading
 import time
+import uuid
 from datetime import datetime
+from decimal import Decimal
 from random import random
-from typing import Dict, Callable, List, Tuple, Optional, Any, Union
+from typing import Dict, Callable, List, Tuple, Optional, Any, Union, Iterator, ContextManager, Set
 
 from .base import *
 from .sql_dialect import SqlDialect, SqlExpr
@@ -56,6 +61,51 @@ def _exec_sql(conn, sql: Union[str, 'sqlalchemy.sql.elements.TextClause', List[s
 
 _quote_str = lambda x: f"'{x}'" if isinstance(x, str) else f'{x}'
 
+_QUERY_SQL_PATTERN = re.compile(r'^\s*(select|with|show|describe|desc|explain)\b', flags=re.IGNORECASE)
+
+
+def _is_query_sql(sql: Union[str, List[str]]) -> bool:
+    sqls = sql if isinstance(sql, list) else [sql]
+    return all(isinstance(each_sql, str) and _QUERY_SQL_PATTERN.match(each_sql) for each_sql in sqls)
+
+
+_PG_ANALYZED_ROWS_PATTERN = re.compile(r'\(actual time=[\d.]+\.\.([\d.]+) rows=(\d+)')
+_PG_BUFFERS_PATTERN = re.compile(r'Buffers: shared(?: hit=(\d+))?(?: read=(\d+))?')
+_PG_BLOCK_SIZE = 8192
+
+
+def _pg_analyzed_plan_metrics(plan: str) -> Dict[str, Any]:
+    # the first node in the plan is the root node, whose metrics cover the whole query
+    metrics = {}
+    rows_match = _PG_ANALYZED_ROWS_PATTERN.search(plan)
+    if rows_match:
+        metrics['execution_time_ms'] = float(rows_match.group(1))
+        metrics['rows'] = int(rows_match.group(2))
+    buffers_match = _PG_BUFFERS_PATTERN.search(plan)
+    if buffers_match:
+        metrics['bytes_scanned'] = sum([int(blocks or 0) for blocks in buffers_match.groups()]) * _PG_BLOCK_SIZE
+    return metrics
+
+
+def _is_pg_copy_value(value: Any) -> bool:
+    from decimal import Decimal
+    from datetime import date
+    return value is None or isinstance(value, (str, int, float, Decimal, date))
+
+
+def _to_pg_copy_value(value: Any) -> str:
+    # in csv format, an unquoted empty value is null and a quoted empty value is an empty string
+    from datetime import date
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
 
 class RdbTable(Table):
 
@@ -66,7 +116,8 @@ class RdbTable(Table):
         self._exec_sql = lambda sql: _exec_sql(self.backend.conn, sql)
         self._actions = actions or []
 
-        self._temp_table_time_prefix = lambda: f't_{round(time.time() * 1000)}_{int(random() * 100000):04d}'
+        # names are unique even if created concurrently by steps running at the same time
+        self._temp_table_time_prefix = lambda: f't_{uuid.uuid4().hex}'
         self._is_simple_query = lambda sql: re.match(r'^select \* from [\w.]+$', sql)
         self._table_name_of_simple_query = lambda sql: re.match(r'select \* from ([\w.]+)', sql).group(1)
 
@@ -84,49 +135,27 @@ class RdbTable(Table):
         return table
 
     def _execute_actions(self):
+        # actions are composed into the select sql, so that no database objects are created for them
         for action in self._actions:
             if action[0] == 'limit':
                 count = action[1]
-                with TimeLog(f'start to execute action: {action}',
-                             f'end to execute action({TimeLog.time_took_tpl}): {action}'):
-                    prefix = f'{self._temp_table_time_prefix()}'
-                    limit_result_table_name = f'{prefix}_limit_{count}'
-                    if self._is_simple_query(self.sql):
-                        temp_table_name = self._table_name_of_simple_query(self.sql)
-                        self._exec_sql(self.backend.sql_dialect.create_view_sql(limit_result_table_name,
-                                                                              f'select * from {temp_table_name} limit {count}'))
-                    else:
-                        temp_table_name = f'{prefix}_limit_{count}_source'
-                        self._exec_sql(self.backend.sql_dialect.create_view_sql(temp_table_name, self.sql))
-                        self._exec_sql(self.backend.sql_dialect.create_view_sql(limit_result_table_name,
-                                                                              f'select * from {self.backend.temp_schema}.{temp_table_name} limit {count}'))
-                    self.sql = f'select * from {self.backend.temp_schema}.{limit_result_table_name}'
+                if self._is_simple_query(self.sql):
+                    self.sql = f'{self.sql} limit {count}'
+                else:
+                    self.sql = f'select * from (\n{self.sql}\n) as limit_source limit {count}'
             elif action[0] == 'newcol':
                 name, value = action[1], action[2]
-                with TimeLog(f'start to execute action: {action}',
-                             f'end to execute action({TimeLog.time_took_tpl}): {action}'):
-                    prefix = self._temp_table_time_prefix()
-                    # for pg: max table name chars allowed is 63, the max length is 55 for newcol_table_name
-                    newcol_table_name = f'{prefix}_newcol_{name[:30]}'
-                    if self._is_simple_query(self.sql):
-                        temp_table_name = self._table_name_of_simple_query(self.sql)
-                        field_names = self._field_names(f"select * from {temp_table_name}")
-                        select_sql = f'select {", ".join(field_names)}, {value} as {name} from {temp_table_name}'
-                    else:
-                        # for pg: max table name chars allowed is 63, the max length is 62 for newcol_table_name
-                        temp_table_name = f'{prefix}_newcol_{name[:30]}_source'
-                        self._exec_sql(self.db_config.create_view_sql(temp_table_name, self.sql))
-                        field_names = self._field_names(f"select * from {self.backend.temp_schema}.{temp_table_name}")
-                        select_sql = f'select {", ".join(field_names)}, {value} as {name} from {self.backend.temp_schema}.{temp_table_name}'
-
-                    self._exec_sql(self.db_config.create_view_sql(newcol_table_name, select_sql))
-                    self.sql = f'select * from {self.backend.temp_schema}.{newcol_table_name}'
+                if self._is_simple_query(self.sql):
+                    self.sql = f'select *, {value} as {name} from {self._table_name_of_simple_query(self.sql)}'
+                else:
+                    self.sql = f'select *, {value} as {name} from (\n{self.sql}\n) as newcol_source'
             else:
                 raise SqlProcessorAssertionError(f'unsupported action: {action}')
         self._actions = []
 
     def is_empty(self) -> bool:
-        return self.count() == 0
+        # fetch at most one row instead of counting all the rows
+        return len(self.limit(1).collect()) == 0
 
     def field_names(self) -> List[str]:
         self._execute_actions()
@@ -187,10 +216,54 @@ class RdbTable(Table):
         if row_count is None and len(rows) == max_rows:
             logger.warning(
                 f'found {max_rows} items, but there may be more, will only fetch {max_rows} items at most for sql: {self.sql}')
-        rows = [RdbRow(result.keys(), row) for row in rows]
+        schema = RowSchema(result.keys())
+        rows = _rows_from_columns(schema, _columns_from_rows(rows, len(schema.names)))
         result.close()
         return rows
 
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[List['RdbRow']]:
+        for schema, columns in self._iter_raw_column_batches(batch_size):
+            yield _rows_from_columns(schema, columns)
+
+    def iter_column_batches(self, batch_size: int = 1000) -> Iterator[List[tuple]]:
+        for _, columns in self._iter_raw_column_batches(batch_size):
+            yield columns
+
+    def _iter_raw_column_batches(self, batch_size: int) -> Iterator[Tuple[RowSchema, List[tuple]]]:
+        self._execute_actions()
+        if self.backend.is_pg:
+            yield from self._iter_column_batches_with_pg_cursor(batch_size)
+            return
+        from sqlalchemy.engine.result import ResultProxy
+        result: ResultProxy = _exec_sql(self.backend.conn.execution_options(stream_results=True), self.sql)
+        try:
+            if not result.returns_rows:
+                return
+            schema = RowSchema(result.keys())
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield schema, _columns_from_rows(rows, len(schema.names))
+        finally:
+            result.close()
+
+    def _iter_column_batches_with_pg_cursor(self, batch_size: int) -> Iterator[Tuple[RowSchema, List[tuple]]]:
+        # the connection is in autocommit mode, a named cursor is required to be declared `with hold` to stream results
+        cursor = self.backend.conn.connection.cursor(name=f'{self._temp_table_time_prefix()}_cursor', withhold=True)
+        try:
+            with TimeLog(f'start to execute sql: {self.sql}', f'end to execute sql({TimeLog.time_took_tpl}): {self.sql}'):
+                cursor.execute(self.sql)
+            schema = None
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                schema = schema or RowSchema([col[0] for col in cursor.description])
+                yield schema, _columns_from_rows(rows, len(schema.names))
+        finally:
+            cursor.close()
+
     def show(self, count: int = 20):
         keys = self.field_names()
         rows = self._collect(count)
@@ -210,10 +283,21 @@ class RdbTable(Table):
             prefix = self._temp_table_time_prefix()
             temp_table_name = f'{prefix}_count'
             self._exec_sql(self.db_config.create_view_sql(temp_table_name, self.sql))
+            self.backend.catalog.invalidate(temp_table_name)
         self.sql = f'select * from {self.backend.temp_schema}.{temp_table_name}'
         return temp_table_name
 
-    def save_to_temp_table(self, name: str):
+    def save_to_temp_table(self, name: str, materialize: bool = False):
+        if materialize:
+            if '.' in name:
+                raise SqlProcessorAssertionError(f'name of temp table must be pure TABLE_NAME, found: {name}')
+            if self.backend.table_exists(TableMeta(name)):
+                raise SqlProcessorAssertionError(
+                    f'we are trying to replace an existing temp table, it is not supported right now. table name: {name}')
+            self._execute_actions()
+            self._exec_sql(self.db_config.create_materialized_temp_table_sql(name, self.sql))
+            self.backend.catalog.invalidate(name)
+            return
         temp_table_name = self.resolve_to_temp_table()
         if temp_table_name != name:
             if '.' in name:
@@ -225,6 +309,7 @@ class RdbTable(Table):
                         f'we are trying to replace an existing temp table, it is not supported right now. table name: {name}')
                 self._exec_sql(
                     self.db_config.create_view_sql(name, f'select * from {self.backend.temp_schema}.{temp_table_name}'))
+                self.backend.catalog.invalidate(name)
 
     def save_to_table(self, target_table: TableMeta):
         if self.backend.table_exists(target_table):
@@ -239,10 +324,11 @@ class RdbTable(Table):
                     f'does not found partition field `{pt.field}` in source table for target table {target_table.table_name}, '
                     f'all fields are in source table: {field_names}')
 
-        cols = self.backend.inspector.get_columns(temp_table_name, self.backend.temp_schema)
+        cols = self.backend.catalog.columns(temp_table_name)
         db = target_table.table_name[:target_table.table_name.index('.')]
         self._exec_sql(self.db_config.create_db_sql(db))
         self._exec_sql(self.db_config.create_table_with_partitions_sql(target_table.table_name, cols, target_table.partitions))
+        self.backend.catalog.invalidate(target_table.table_name)
 
         target_table_name = target_table.get_full_table_name(self.backend.temp_schema)
 
@@ -254,6 +340,7 @@ class RdbTable(Table):
                                                                    partitions_to_save)
             for sql in sqls:
                 self._exec_sql(sql)
+            self.backend.catalog.invalidate(target_table.table_name)
         else:
             cols = [col['name'] for col in cols]
             col_names = ', '.join(cols)
@@ -277,65 +364,202 @@ class RdbTable(Table):
         return partitions_to_save
 
 
-class RdbRow(Row):
+def _float_column(column: tuple) -> tuple:
+    # case decimal to float in order for later comparing (to ensure type consistency)
+    # values of a column are of the same type, so only the first non-null value is checked
+    first_value = next((v for v in column if v is not None), None)
+    if isinstance(first_value, Decimal):
+        return tuple([float(v) if isinstance(v, Decimal) else v for v in column])
+    return column
 
-    def __init__(self, cols: List[str], values: Optional[Tuple]):
-        self._cols = cols
-        from decimal import Decimal
-        # case decimal to float in order for later comparing (to ensure type consistency)
-        self._values = tuple([float(v) if isinstance(v, Decimal) else v for v in values])
 
-    def as_dict(self):
-        return None if self._values is None else dict(zip(self._cols, self._values))
+def _columns_from_rows(rows: List[Tuple], column_count: int) -> List[tuple]:
+    """
+    Transpose the rows fetched to columns, with decimals converted to floats column by column.
+    """
+    if not rows:
+        return [() for _ in range(column_count)]
+    return [_float_column(column) for column in zip(*rows)]
 
-    def as_tuple(self):
-        return self._values
 
-    def __eq__(self, other: 'RdbRow'):
-        if not isinstance(other, (RdbRow, tuple,)) or other is None:
-            return False
-        if isinstance(other, RdbRow):
-            return other._cols == self._cols and other._values == self._values
-        elif isinstance(other, tuple):
-            return other == self._values
+def _rows_from_columns(schema: RowSchema, columns: List[tuple]) -> List['RdbRow']:
+    return [RdbRow.from_converted_values(schema, values) for values in zip(*columns)]
 
-    def __str__(self):
-        return f'({", ".join([f"{k}={_quote_str(v)}" for k, v in zip(self._cols, self._values)])})'
 
-    def __getitem__(self, i):
-        return self._values[i]
+class RdbRow(SchemaRow):
+    __slots__ = ()
 
-    def __repr__(self):
-        return 'RdbRow' + str(self)
+    def __init__(self, cols: Union[List[str], RowSchema], values: Optional[Tuple]):
+        # case decimal to float in order for later comparing (to ensure type consistency)
+        super().__init__(cols if isinstance(cols, RowSchema) else RowSchema(cols),
+                         None if values is None else tuple([float(v) if isinstance(v, Decimal) else v for v in values]))
+
+    @staticmethod
+    def from_converted_values(schema: RowSchema, values: Tuple) -> 'RdbRow':
+        """
+        Create a row without converting the values, the values must have been converted by `_columns_from_rows`.
+        """
+        row = RdbRow.__new__(RdbRow)
+        row.schema, row.values = schema, values
+        return row
+
+    def __str__(self):
+        return f'({", ".join([f"{k}={_quote_str(v)}" for k, v in zip(self.schema.names, self.values or ())])})'
+
+
+class RdbCatalog:
+    """
+    Cache of the tables in a schema, the columns of a table and the partition columns of a table.
+
+    Metadata is only cached within a scope (e.g. one run of the sql processor), and easy_sql invalidates it
+    whenever it creates, drops or renames objects. Outside of a scope, metadata is always queried from the database.
+    """
+
+    def __init__(self, backend: 'RdbBackend'):
+        self.backend = backend
+        self._lock = threading.RLock()
+        self._scope_depth = 0
+        self._tables: Dict[str, List[str]] = {}
+        self._columns: Dict[Tuple[str, str], List[Dict]] = {}
+        self._partition_cols: Dict[Tuple[str, str], List[str]] = {}
+        self._inspector = None
+
+    @contextlib.contextmanager
+    def scope(self):
+        with self._lock:
+            self._scope_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._scope_depth -= 1
+                if self._scope_depth == 0:
+                    self.invalidate()
+
+    def _split_table_name(self, table_name: str) -> Tuple[str, str]:
+        table = TableMeta(table_name)
+        return table.dbname or self.backend.temp_schema, table.pure_table_name
+
+    def tables(self, db: str) -> List[str]:
+        with self._lock:
+            if self._scope_depth == 0:
+                return self.backend._fetch_tables(db)
+            if db not in self._tables:
+                self._tables[db] = self.backend._fetch_tables(db)
+            return list(self._tables[db])
+
+    def columns(self, table_name: str) -> List[Dict]:
+        key = self._split_table_name(table_name)
+        with self._lock:
+            if self._scope_depth == 0:
+                return self.backend.inspector.get_columns(key[1], key[0])
+            if key not in self._columns:
+                # inspector object has cache built-in, it is shared within the scope and recreated when invalidated
+                self._inspector = self._inspector or self.backend.inspector
+                self._columns[key] = self._inspector.get_columns(key[1], key[0])
+            return [dict(col) for col in self._columns[key]]
+
+    def partition_cols(self, table_name: str) -> List[str]:
+        key = self._split_table_name(table_name)
+        with self._lock:
+            if self._scope_depth == 0:
+                return self.backend._fetch_partition_cols(f'{key[0]}.{key[1]}')
+            if key not in self._partition_cols:
+                self._partition_cols[key] = self.backend._fetch_partition_cols(f'{key[0]}.{key[1]}')
+            return list(self._partition_cols[key])
+
+    def invalidate(self, table_name: str = None):
+        """
+        Invalidate the metadata of the table and the table list of its schema, or all the metadata if table_name is None.
+        """
+        with self._lock:
+            self._inspector = None
+            if table_name is None:
+                self._tables, self._columns, self._partition_cols = {}, {}, {}
+                return
+            key = self._split_table_name(table_name)
+            self._tables.pop(key[0], None)
+            self._columns.pop(key, None)
+            self._partition_cols.pop(key, None)
+
+
+class _ThreadConnection:
+
+    def __init__(self, conn: 'sqlalchemy.engine.base.Connection'):
+        self.conn = conn
+
+    def close(self):
+        try:
+            self.conn.close()
+        except:
+            pass
+
+    def __del__(self):
+        # thread local data is released when the thread ends, return the connection to the pool then
+        self.close()
 
 
 class RdbBackend(Backend):
     """table_partitions_table_name; means the table name which save the static partition info for all partition tables in data warehouse,
     for now need support backend type: [clickhouse]
     others backend has another method to manage static partition info or just support static partition"""
+    MATERIALIZED_SCHEMA = 'sp_materialized'
 
     def __init__(self, url: str, credentials: str = None, sql_expr: SqlExpr = None,
-                 partitions_table_name='dataplat.__table_partitions__'):
+                 partitions_table_name='dataplat.__table_partitions__',
+                 pool_size: int = 1, max_overflow: int = 10, pool_pre_ping: bool = False, pool_recycle: int = -1,
+                 partition_write_parallelism: int = 1, analyze_cache_tables: bool = False):
+        """
+        pool_size, max_overflow, pool_pre_ping and pool_recycle are passed to the connection pool of the sqlalchemy engine.
+        Every thread uses its own connection checked out from the pool, set pool_size larger than 1 to run steps concurrently.
+        partition_write_parallelism is the max number of partitions written concurrently when saving a table with multiple partitions.
+        analyze_cache_tables is whether to collect the statistics of the tables created by cache and broadcast steps after they are loaded,
+        so that the query planner could choose better plans for the steps reading them.
+        """
         self.partitions_table_name = partitions_table_name
         self.url, self.credentials = url, credentials
         self.sql_expr = sql_expr or SqlExpr()
+        self.pool_size, self.max_overflow, self.pool_pre_ping, self.pool_recycle = pool_size, max_overflow, pool_pre_ping, pool_recycle
+        self.partition_write_parallelism = partition_write_parallelism
+        self.analyze_cache_tables = analyze_cache_tables
         self.__init_inner(self.url, self.credentials)
 
-    def __init_inner(self, url: str, credentials: str = None):
-        from sqlalchemy import create_engine
-        from sqlalchemy.engine.base import Engine, Connection
-
+    def _init_state(self):
+        """
+        Initialize the state of the backend not depending on the database.
+        """
         self.temp_schema = f'sp_temp_{int(time.mktime(time.gmtime()))}_{int(random() * 10000):04d}'
-
+        self._thread_local = threading.local()
+        self.catalog = RdbCatalog(self)
+        # temp tables created as physical tables instead of views
+        self._materialized_temp_tables: Set[str] = set()
+        self._materialized_temp_tables_lock = threading.Lock()
+        # temp table name to the order it is created, tables are dropped in the reverse order since later ones may depend on earlier ones
+        self._temp_table_orders: Dict[str, int] = {}
+        self._temp_table_counter = itertools.count()
         self.backend_type, self.is_pg, self.is_ch, self.is_bq = None, False, False, False
         self.sql_dialect: SqlDialect = None
+
+    def __init_inner(self, url: str, credentials: str = None):
+        from sqlalchemy import create_engine, event
+        from sqlalchemy.engine.base import Engine, Connection
+
+        self._init_state()
+        pool_args = {'pool_size': self.pool_size, 'max_overflow': self.max_overflow,
+                     'pool_pre_ping': self.pool_pre_ping, 'pool_recycle': self.pool_recycle}
         if url.startswith('postgresql://'):
             self.backend_type, self.is_pg = 'pg', True
             self.sql_dialect = PgSqlDialect(self.sql_expr)
-            self.engine: Engine = create_engine(url, isolation_level="AUTOCOMMIT", pool_size=1)
-            self.conn: Connection = self.engine.connect()
+            self.engine: Engine = create_engine(url, isolation_level="AUTOCOMMIT", **pool_args)
+
+            @event.listens_for(self.engine, 'connect')
+            def use_temp_schema(dbapi_conn, connection_record):
+                cursor = dbapi_conn.cursor()
+                cursor.execute(self.sql_dialect.use_db_sql(self.temp_schema))
+                cursor.close()
+                dbapi_conn.commit()
+
             _exec_sql(self.conn, self.sql_dialect.create_db_sql(self.temp_schema))
-            _exec_sql(self.conn, self.sql_dialect.use_db_sql(self.temp_schema))
         elif url.startswith('clickhouse://') or url.startswith('clickhouse+native://'):
             self.backend_type, self.is_ch = 'ch', True
             self.sql_dialect = ChSqlDialect(self.sql_expr, self.partitions_table_name)
@@ -347,6 +571,7 @@ class RdbBackend(Backend):
             self._create_partitions_table(conn)
 
             conn.close()
+            engine.dispose()
 
             url_parts = url.split('?')
             url_params = '' if len(url_parts) == 1 else f'?{url_parts[1]}'
@@ -357,17 +582,30 @@ class RdbBackend(Backend):
                 url_raw_parts = url_raw_parts
             else:
                 raise Exception(f'unrecognized url: {url}')
+            # all the connections created by the engine will use the temp db as the default db
             url = f'{"/".join(url_raw_parts + [self.temp_schema])}{url_params}'
 
-            self.engine: Engine = create_engine(url, pool_size=1)
-            self.conn: Connection = self.engine.connect()
+            self.engine: Engine = create_engine(url, **pool_args)
         elif url.startswith('bigquery://'):
             self.backend_type, self.is_bq = 'bq', True
             self.sql_dialect = BqSqlDialect(self.temp_schema, self.sql_expr)
-            self.engine: Engine = create_engine(url, credentials_path=credentials)
-            self.conn: Connection = self.engine.connect()
+            self.engine: Engine = create_engine(url, credentials_path=credentials, **pool_args)
             _exec_sql(self.conn, self.sql_dialect.create_db_sql(self.temp_schema))
 
+    @property
+    def conn(self) -> 'sqlalchemy.engine.base.Connection':
+        """
+        The connection of the current thread, checked out from the pool when first used in the thread and returned when the thread ends.
+        """
+        thread_conn = getattr(self._thread_local, 'conn', None)
+        if thread_conn is None:
+            thread_conn = _ThreadConnection(self.engine.connect())
+            self._thread_local.conn = thread_conn
+        return thread_conn.conn
+
+    def support_concurrent_execution(self) -> bool:
+        return self.pool_size > 1
+
     def _create_partitions_table(self, conn):
         cols = [
             {'name': 'db_name', 'type': 'String'},
@@ -389,11 +627,9 @@ class RdbBackend(Backend):
         return inspector
 
     def reset(self):
-        if self.conn:
-            try:
-                self.conn.close()
-            except:
-                pass
+        thread_conn = getattr(self._thread_local, 'conn', None)
+        if thread_conn:
+            thread_conn.close()
         if self.engine:
             try:
                 self.engine.dispose()
@@ -415,15 +651,41 @@ class RdbBackend(Backend):
         return RdbTable(self, '')
 
     def exec_native_sql(self, sql: str) -> Any:
+        if not _is_query_sql(sql):
+            # we do not know which objects are changed by the sql
+            self.catalog.invalidate()
         return _exec_sql(self.conn, sql)
 
     def exec_sql(self, sql: str) -> 'RdbTable':
         return RdbTable(self, sql)
 
+    def catalog_cache_scope(self) -> ContextManager:
+        return self.catalog.scope()
+
+    def explain(self, table: 'RdbTable', analyze: bool = False) -> Optional[QueryPlan]:
+        table._execute_actions()
+        explain_sql = self.sql_dialect.explain_sql(table.sql, analyze)
+        if explain_sql is None:
+            return None
+        result = _exec_sql(self.conn, explain_sql)
+        keys, rows = list(result.keys()), result.fetchall()
+        if self.is_ch and analyze:
+            plan = '\n'.join(['\t'.join(keys)] + ['\t'.join([str(v) for v in row]) for row in rows])
+            return QueryPlan(plan, {'estimated_rows_to_read': sum([row[keys.index('rows')] for row in rows])})
+        plan = '\n'.join([str(row[0]) for row in rows])
+        return QueryPlan(plan, _pg_analyzed_plan_metrics(plan) if self.is_pg and analyze else {})
+
     def _tables(self, db: str) -> List[str]:
+        return self.catalog.tables(db)
+
+    def _fetch_tables(self, db: str) -> List[str]:
         all_tables = _exec_sql(self.conn, self.sql_dialect.get_tables_sql(db)).fetchall()
         return sorted([table[0] for table in all_tables])
 
+    def _fetch_partition_cols(self, table_name: str) -> List[str]:
+        native_partitions_sql, extract_partition_cols = self.sql_dialect.native_partitions_sql(table_name)
+        return extract_partition_cols(_exec_sql(self.conn, native_partitions_sql))
+
     def temp_tables(self) -> List[str]:
         return self._tables(self.temp_schema)
 
@@ -433,33 +695,99 @@ class RdbBackend(Backend):
     def clean(self):
         logger.info(f'clean temp db: {self.temp_schema}')
         _exec_sql(self.conn, self.sql_dialect.drop_db_sql(self.temp_schema))
+        self.catalog.invalidate()
+
+    def materialize_table(self, table_name: str, data_dir: str, data_id: str) -> str:
+        # tables in the temp schema are dropped when the backend is cleaned, so the data is persisted in a dedicated schema
+        _exec_sql(self.conn, self.sql_dialect.create_db_sql(self.MATERIALIZED_SCHEMA))
+        location = f'{self.MATERIALIZED_SCHEMA}.t_{data_id}'
+        _exec_sql(self.conn, self.sql_dialect.drop_table_sql(location))
+        _exec_sql(self.conn, self.sql_dialect.create_table_sql(location, f'select * from {self.temp_schema}.{table_name}'))
+        self.catalog.invalidate(location)
+        return location
+
+    def load_materialized_table(self, location: str, table_name: str):
+        _exec_sql(self.conn, self.sql_dialect.create_view_sql(table_name, f'select * from {location}'))
+        self.catalog.invalidate(table_name)
+        self._register_temp_table(table_name, materialize=False)
+
+    def drop_materialized_table(self, location: str):
+        _exec_sql(self.conn, self.sql_dialect.drop_table_sql(location))
+        self.catalog.invalidate(location)
+
+    def table_version(self, table_name: str) -> Optional[str]:
+        if '.' not in table_name or table_name.startswith(f'{self.temp_schema}.'):
+            # tables in the temp schema are views created in this run
+            return None
+        db, table = table_name[:table_name.index('.')], table_name[table_name.index('.') + 1:]
+        table_version_sql = self.sql_dialect.table_version_sql(db, table)
+        if table_version_sql is None:
+            return None
+        row = _exec_sql(self.conn, table_version_sql).first()
+        return None if row is None else '-'.join([str(v) for v in row])
 
     def clear_temp_tables(self, exclude: List[str] = None):
-        from sqlalchemy.exc import ProgrammingError
-        for table in self.temp_tables():
-            if table not in exclude:
-                print(f'dropping temp table {table}')
-                try:
-                    _exec_sql(self.conn, self.sql_dialect.drop_view_sql(table))
-                except ProgrammingError as e:
-                    if re.match(r'.*view ".*" does not exist', e.args[0]):
-                        # Since we will drop view cascade in pg, so some view might already be dropped.
-                        # It will raise the view-not-exist error, we just ignore this kind of error.
-                        pass
-                    else:
-                        raise e
-
-    def create_temp_table(self, table: 'RdbTable', name: str):
-        logger.info(f'create_temp_table with: table={table}, name={name}')
-        table.save_to_temp_table(name)
+        exclude = exclude or []
+        try:
+            # the temp schema is never dropped here, since the udfs (e.g. in pg) are created in it as well
+            tables = [table for table in self.temp_tables() if table not in exclude]
+            temp_views = self._temp_views()
+            with self._materialized_temp_tables_lock:
+                # tables not created by the backend (e.g. the intermediate views of RdbTable) are dropped at last
+                tables.sort(key=lambda table: self._temp_table_orders.get(table, -1), reverse=True)
+                if temp_views is None:
+                    # the catalog could not tell the kind of the objects, take the ones not materialized by the backend as views
+                    views = [table for table in tables if table not in self._materialized_temp_tables]
+                else:
+                    views = [table for table in tables if table in temp_views]
+                physical_tables = [table for table in tables if table not in views]
+                self._materialized_temp_tables.difference_update(tables)
+                for table in tables:
+                    self._temp_table_orders.pop(table, None)
+            # views depend on tables but not the other way around, so drop views first
+            if views:
+                logger.info(f'dropping temp views: {views}')
+                _exec_sql(self.conn, self.sql_dialect.drop_views_sql(views))
+            if physical_tables:
+                logger.info(f'dropping temp tables: {physical_tables}')
+                _exec_sql(self.conn, self.sql_dialect.drop_tables_sql([f'{self.temp_schema}.{table}' for table in physical_tables]))
+        finally:
+            # views are dropped with cascade in pg, so the dependent views may be dropped as well
+            self.catalog.invalidate()
+
+    def _temp_views(self) -> Optional[Set[str]]:
+        views_sql = self.sql_dialect.get_views_sql(self.temp_schema)
+        if views_sql is None:
+            return None
+        return set([view[0] for view in _exec_sql(self.conn, views_sql).fetchall()])
+
+    def _register_temp_table(self, name: str, materialize: bool):
+        with self._materialized_temp_tables_lock:
+            self._temp_table_orders[name] = next(self._temp_table_counter)
+            if materialize:
+                self._materialized_temp_tables.add(name)
+            else:
+                self._materialized_temp_tables.discard(name)
+
+    def create_temp_table(self, table: 'RdbTable', name: str, materialize: bool = False):
+        logger.info(f'create_temp_table with: table={table}, name={name}, materialize={materialize}')
+        table.save_to_temp_table(name, materialize)
+        self._register_temp_table(name, materialize)
 
     def create_cache_table(self, table: 'RdbTable', name: str):
         logger.info(f'create_cache_table with: table={table}, name={name}')
-        table.save_to_temp_table(name)
+        self._create_materialized_temp_table(table, name)
 
     def broadcast_table(self, table: 'RdbTable', name: str):
         logger.info(f'broadcast_table with: table={table}, name={name}')
-        table.save_to_temp_table(name)
+        self._create_materialized_temp_table(table, name)
+
+    def _create_materialized_temp_table(self, table: 'RdbTable', name: str):
+        # cache and broadcast tables are expected to be read more than once, so evaluate the query only once
+        self.create_temp_table(table, name, materialize=True)
+        analyze_sql = self.sql_dialect.analyze_table_sql(name) if self.analyze_cache_tables else None
+        if analyze_sql:
+            _exec_sql(self.conn, analyze_sql)
 
     def table_exists(self, table: 'TableMeta'):
         schema, table_name = table.dbname, table.pure_table_name
@@ -468,8 +796,7 @@ class RdbBackend(Backend):
 
     def refresh_table_partitions(self, table: 'TableMeta'):
         if self.sql_dialect.support_native_partition():
-            native_partitions_sql, extract_partition_cols = self.sql_dialect.native_partitions_sql(table.table_name)
-            pt_cols = extract_partition_cols(_exec_sql(self.conn, native_partitions_sql))
+            pt_cols = self.catalog.partition_cols(table.table_name)
             table.update_partitions([Partition(col) for col in pt_cols])
         # no need to do anything, if the db does not support partition
 
@@ -488,9 +815,11 @@ class RdbBackend(Backend):
         return save_partitions_list
 
     def save_table(self, source_table: 'TableMeta', target_table: 'TableMeta', save_mode: 'SaveMode',
-                   create_target_table: bool):
+                   create_target_table: bool, staged: bool = False):
         logger.info(f'save table with: source_table={source_table}, target_table={target_table}, '
                     f'save_mode={save_mode}, create_target_table={create_target_table}')
+        if staged:
+            logger.info('staged write is not supported for rdb backend, will save table directly')
 
         if not self.sql_dialect.support_static_partition():
             _exec_sql(self.conn, self.sql_dialect.create_pt_meta_table_sql(target_table.dbname))
@@ -504,11 +833,10 @@ class RdbBackend(Backend):
             RdbTable.from_table_meta(self, source_table).save_to_table(target_table)
             return
 
-        inspector = self.inspector
-        target_cols = inspector.get_columns(target_table.pure_table_name, target_table.dbname or self.temp_schema)
+        target_cols = self.catalog.columns(target_table.table_name)
         original_source_table = source_table
         source_table = TableMeta(RdbTable.from_table_meta(self, source_table).resolve_to_temp_table())
-        source_cols = inspector.get_columns(source_table.pure_table_name, source_table.dbname or self.temp_schema)
+        source_cols = self.catalog.columns(source_table.table_name)
         logger.info(f'ensure cols match for source_table {source_table.table_name} and target_table {target_table.table_name}')
         self._ensure_contain_target_cols(source_cols, target_cols)
 
@@ -518,10 +846,12 @@ class RdbBackend(Backend):
             # write data to temp table to support the case when read from and write to the same table
             temp_table_name = f'{full_target_table_name}__temp'
             _exec_sql(self.conn, self.sql_dialect.drop_table_sql(temp_table_name))
+            self.catalog.invalidate(temp_table_name)
             RdbTable.from_table_meta(self, source_table).save_to_table(target_table.clone_with_name(temp_table_name))
             if original_source_table.has_partitions():
                 save_partitions = self._get_save_partitions(original_source_table, source_table, target_table)
-                for save_partition in save_partitions:
+
+                def overwrite_partition(save_partition: List[Partition]):
                     _exec_sql(self.conn, self.sql_dialect.delete_partition_sql(target_table.table_name, save_partition))
                     if not self.sql_dialect.create_partition_automatically():
                         _exec_sql(self.conn, self.sql_dialect.create_partition_sql(full_target_table_name, save_partition))
@@ -530,20 +860,28 @@ class RdbBackend(Backend):
                     _exec_sql(self.conn, self.sql_dialect.insert_data_sql(full_target_table_name, col_names,
                                                                           f'select {col_names} from {temp_table_name} where {filter_expr}',
                                                                           save_partition))
+
+                self._write_partitions(full_target_table_name, save_partitions, overwrite_partition)
                 _exec_sql(self.conn, self.sql_dialect.drop_table_sql(temp_table_name))
             else:
                 _exec_sql(self.conn, self.sql_dialect.drop_table_sql(full_target_table_name))
                 _exec_sql(self.conn, self.sql_dialect.rename_table_sql(temp_table_name, full_target_table_name))
+            self.catalog.invalidate(temp_table_name)
+            self.catalog.invalidate(full_target_table_name)
 
         elif save_mode == SaveMode.append:
             if original_source_table.has_partitions():
                 save_partitions = self._get_save_partitions(original_source_table, source_table, target_table)
-                for save_partition in save_partitions:
+
+                def append_partition(save_partition: List[Partition]):
                     if not self.sql_dialect.create_partition_automatically():
                         _exec_sql(self.conn, self.sql_dialect.create_partition_sql(full_target_table_name, save_partition, True))
                     _exec_sql(self.conn, self.sql_dialect.insert_data_sql(full_target_table_name, col_names,
                                                                           f'select {col_names} from {source_table.get_full_table_name(self.temp_schema)}',
                                                                           save_partition))
+
+                self._write_partitions(full_target_table_name, save_partitions, append_partition)
+                self.catalog.invalidate(full_target_table_name)
             else:
                 _exec_sql(self.conn, self.sql_dialect.insert_data_sql(full_target_table_name, col_names,
                                                                       f'select {col_names} from {source_table.get_full_table_name(self.temp_schema)}',
@@ -552,6 +890,44 @@ class RdbBackend(Backend):
         else:
             raise SqlProcessorAssertionError(f'unknown save mode {save_mode}')
 
+    def _write_partitions(self, table_name: str, save_partitions: List[List[Partition]],
+                          write_partition: Callable[[List[Partition]], None]):
+        """
+        Run write_partition for every partition. The statements of one partition are always executed in order in the same thread,
+        while different partitions are written concurrently with their own connections if partition_write_parallelism is larger than 1.
+        """
+        timings: List[Tuple[List[Partition], float]] = []
+
+        def timed_write_partition(save_partition: List[Partition]):
+            start_dt = datetime.now()
+            write_partition(save_partition)
+            timings.append((save_partition, (datetime.now() - start_dt).total_seconds()))
+
+        # keep one connection for the current thread, the others could be used by the writers
+        max_connections = self.pool_size + self.max_overflow - 1 if self.max_overflow >= 0 else len(save_partitions)
+        parallelism = min(self.partition_write_parallelism, len(save_partitions), max(1, max_connections))
+        start_dt = datetime.now()
+        if parallelism <= 1:
+            for save_partition in save_partitions:
+                timed_write_partition(save_partition)
+        else:
+            from concurrent.futures import ThreadPoolExecutor, as_completed
+            logger.info(f'will write {len(save_partitions)} partitions of table {table_name} with parallelism {parallelism}')
+            error = None
+            with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='partition-writer') as executor:
+                futures = [executor.submit(timed_write_partition, save_partition) for save_partition in save_partitions]
+                for future in as_completed(futures):
+                    if future.exception() is not None and error is None:
+                        error = future.exception()
+                        for f in futures:
+                            f.cancel()
+            if error is not None:
+                raise error
+        time_took = (datetime.now() - start_dt).total_seconds()
+        timings_msg = ', '.join([f'{",".join([str(pt) for pt in save_partition])}: {partition_time_took:.3f}s'
+                                 for save_partition, partition_time_took in timings])
+        logger.info(f'wrote {len(timings)} partitions of table {table_name}(time took: {time_took:.3f}s): {timings_msg}')
+
     def _ensure_contain_target_cols(self, source_cols: List[Dict], target_cols: List[Dict]):
         source_cols = [(col['name'],) for col in source_cols]
         target_cols = [(col['name'],) for col in target_cols]
@@ -563,6 +939,7 @@ class RdbBackend(Backend):
         db, table = full_table_name[:full_table_name.index('.')], full_table_name[full_table_name.index('.') + 1:]
         _exec_sql(self.conn, self.sql_dialect.create_db_sql(db))
         _exec_sql(self.conn, self.sql_dialect.create_table_with_partitions_sql(full_table_name, [col.as_dict() for col in schema], partitions))
+        self.catalog.invalidate(full_table_name)
         cols = [col.name for col in schema]
         pt_cols = [p.field for p in partitions]
         pt_values_list = [[row[cols.index(p)] for p in pt_cols] for row in values]
@@ -571,11 +948,8 @@ class RdbBackend(Backend):
             for partition in partitions:
                 if partition:
                     _exec_sql(self.conn, self.sql_dialect.create_partition_sql(full_table_name, list(partition)))
-        from sqlalchemy.sql import text
-        converted_col_names = ", ".join(self.sql_dialect.convert_pt_col_expr([f":{col}" for col in cols], pt_cols))
-        stmt = text(f'insert into {full_table_name} ({", ".join(cols)}) VALUES ({converted_col_names})')
-        for v in values:
-            _exec_sql(self.conn, stmt, **dict([(col, _v) for _v, col in zip(v, cols)]))
+            self.catalog.invalidate(full_table_name)
+        self._insert_values(full_table_name, cols, values, pt_cols)
 
         if partitions and not self.sql_dialect.support_static_partition():
             _exec_sql(self.conn, self.sql_dialect.create_pt_meta_table_sql(db))
@@ -585,8 +959,53 @@ class RdbBackend(Backend):
 
     def create_temp_table_with_data(self, table_name: str, values: List[List[Any]], schema: List[Col]):
         _exec_sql(self.conn, self.sql_dialect.create_table_with_partitions_sql(table_name, [col.as_dict() for col in schema], []))
+        self.catalog.invalidate(table_name)
+        if '.' not in table_name:
+            self._register_temp_table(table_name, materialize=True)
         cols = [col.name for col in schema]
+        self._insert_values(table_name, cols, values)
+
+    def _insert_values(self, table_name: str, cols: List[str], values: List[List[Any]], partition_cols: List[str] = None,
+                       batch_size: int = 5000):
+        partition_cols = partition_cols or []
+        col_params = [f":{col}" for col in cols]
+        converted_col_params = self.sql_dialect.convert_pt_col_expr(col_params, partition_cols)
+        # the native protocol could not convert partition values, use the bulk insert statement only when no conversion needed
+        bulk_insert_sql = self.sql_dialect.bulk_insert_sql(table_name, cols) if converted_col_params == col_params else None
         from sqlalchemy.sql import text
-        stmt = text(f'insert into {table_name} ({", ".join(cols)}) VALUES ({", ".join([f":{col}" for col in cols])})')
-        for v in values:
-            _exec_sql(self.conn, stmt, **dict([(col, _v) for _v, col in zip(v, cols)]))
+        stmt = text(f'insert into {table_name} ({", ".join(cols)}) VALUES ({", ".join(converted_col_params)})')
+
+        for start in range(0, len(values), batch_size):
+            batch = values[start:start + batch_size]
+            with TimeLog(f'start to insert {len(batch)} rows into {table_name}',
+                         f'end to insert {len(batch)} rows into {table_name}({TimeLog.time_took_tpl})'):
+                if bulk_insert_sql is not None:
+                    try:
+                        self._bulk_insert_values(bulk_insert_sql, batch)
+                        continue
+                    except Exception as e:
+                        logger.warning(f'failed to bulk insert rows into {table_name}, will insert rows by executemany instead: {e}')
+                        bulk_insert_sql = None
+                self.conn.execute(stmt, [dict(zip(cols, row)) for row in batch])
+
+    def _bulk_insert_values(self, bulk_insert_sql: str, values: List[List[Any]]):
+        if self.is_pg:
+            if not all(_is_pg_copy_value(v) for row in values for v in row):
+                raise SqlProcessorAssertionError('only scalar values could be loaded by copy')
+            import io
+            data = io.StringIO('\n'.join([','.join([_to_pg_copy_value(v) for v in row]) for row in values]))
+            cursor = self.conn.connection.cursor()
+            try:
+                cursor.copy_expert(bulk_insert_sql, data)
+            finally:
+                cursor.close()
+        elif self.is_ch:
+            if self.engine.dialect.driver != 'native':
+                raise SqlProcessorAssertionError(f'block insert is only supported by the native driver, found {self.engine.dialect.driver}')
+            cursor = self.conn.connection.cursor()
+            try:
+                cursor.executemany(bulk_insert_sql, [tuple(row) for row in values])
+            finally:
+                cursor.close()
+        else:
+            raise SqlProcessorAssertionError(f'bulk insert is not supported for backend {self.backend_type}')
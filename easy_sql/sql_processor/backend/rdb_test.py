@@ -1,7 +1,54 @@
+import threading
+import time
 import unittest
+from types import SimpleNamespace
 
-from easy_sql.sql_processor.backend import Partition
-from easy_sql.sql_processor.backend.rdb import SqlExpr, ChSqlDialect
+from easy_sql.sql_processor.backend import Partition, RowSchema
+from easy_sql.sql_processor.backend.rdb import SqlExpr, ChSqlDialect, RdbTable, RdbBackend, RdbCatalog, _to_pg_copy_value, _is_query_sql, \
+    _pg_analyzed_plan_metrics, _columns_from_rows, RdbRow
+from easy_sql.sql_processor.backend.sql_dialect import SqlDialect
+
+
+class _SqliteDialect(SqlDialect):
+
+    def create_table_sql(self, table_name: str, select_sql: str) -> str:
+        return f'create table {table_name} as {select_sql}'
+
+    def analyze_table_sql(self, table_name: str):
+        return f'analyze {table_name}'
+
+    def create_view_sql(self, table_name: str, select_sql: str) -> str:
+        return f'create view {table_name} as {select_sql}'
+
+    def get_tables_sql(self, db) -> str:
+        return f"select name from {db}.sqlite_master where type in ('table', 'view') and name not like 'sqlite_%'"
+
+    def get_views_sql(self, db) -> str:
+        return f"select name from {db}.sqlite_master where type = 'view'"
+
+    def drop_view_sql(self, table: str) -> str:
+        return f'drop view {table}'
+
+    def drop_table_sql(self, table: str, cascade: bool = False) -> str:
+        return f'drop table {table}'
+
+
+def _sqlite_backend(engine=None, sql_dialect: SqlDialect = None, temp_schema: str = 'main', **options) -> RdbBackend:
+    """
+    A backend on an in-memory sqlite database (or the engine given). Sqlite is not supported by RdbBackend,
+    but it runs everything not specific to a database, with the tables of the main schema as the temp tables.
+    """
+    from sqlalchemy import create_engine
+    backend = RdbBackend.__new__(RdbBackend)
+    backend.sql_expr = SqlExpr()
+    backend.pool_size, backend.max_overflow, backend.partition_write_parallelism, backend.analyze_cache_tables = 1, 10, 1, False
+    backend._init_state()
+    backend.engine = engine or create_engine('sqlite://')
+    backend.sql_dialect = sql_dialect or _SqliteDialect(backend.sql_expr)
+    backend.temp_schema = temp_schema
+    for name, value in options.items():
+        setattr(backend, name, value)
+    return backend
 
 
 class RdbTest(unittest.TestCase):
@@ -13,6 +60,228 @@ class RdbTest(unittest.TestCase):
                                "alter table dataplat.__table_partitions__ delete "
                                "where db_name = 'test' and table_name = 'test' and partition_value = '20210101'"])
 
+    def test_should_compose_actions_into_select_sql(self):
+        executed_sqls = []
+        table = RdbTable(SimpleNamespace(sql_dialect=None, conn=None), 'select * from t').with_column('a', 1).limit(10).with_column('b', "'x'")
+        table._exec_sql = executed_sqls.append
+        table._execute_actions()
+        self.assertEqual(table.sql, "select *, 'x' as b from (\n"
+                                    "select * from (\n"
+                                    "select *, 1 as a from t\n"
+                                    ") as limit_source limit 10\n"
+                                    ") as newcol_source")
+        self.assertEqual(executed_sqls, [])
+
+        table = RdbTable(SimpleNamespace(sql_dialect=None, conn=None), 'select a from t -- some comment').limit(1)
+        table._execute_actions()
+        self.assertEqual(table.sql, 'select * from (\nselect a from t -- some comment\n) as limit_source limit 1')
+
+    def test_should_iter_batches(self):
+        from sqlalchemy import create_engine
+        conn = create_engine('sqlite://').connect()
+        conn.execute('create table t (a int, b text)')
+        conn.execute('insert into t values (1, "x"), (2, "y"), (3, "z")')
+        table = RdbTable(SimpleNamespace(sql_dialect=None, conn=conn, is_pg=False), 'select * from t order by a')
+        batches = list(table.iter_batches(2))
+        self.assertEqual([[row.as_tuple() for row in rows] for rows in batches], [[(1, 'x'), (2, 'y')], [(3, 'z')]])
+        self.assertEqual(batches[0][0].as_dict(), {'a': 1, 'b': 'x'})
+
+    def test_should_check_emptiness_by_fetching_one_row(self):
+        from sqlalchemy import create_engine
+        conn = create_engine('sqlite://').connect()
+        conn.execute('create table t (a int)')
+        executed_sqls = []
+        recording_conn = SimpleNamespace(execute=lambda sql, *args, **kwargs: executed_sqls.append(sql) or conn.execute(sql, *args, **kwargs))
+        table = RdbTable(SimpleNamespace(sql_dialect=None, conn=recording_conn, is_pg=False), 'select * from t where a > 1')
+        self.assertTrue(table.is_empty())
+        conn.execute('insert into t values (1), (2), (3)')
+        self.assertFalse(table.is_empty())
+        self.assertEqual(executed_sqls, ['select * from (\nselect * from t where a > 1\n) as limit_source limit 1'] * 2)
+
+    def test_should_materialize_temp_table(self):
+        backend = _sqlite_backend()
+        backend.conn.execute('create table t (a int)')
+        backend.conn.execute('insert into t values (1), (2)')
+        RdbTable(backend, 'select a + 1 as a from t').save_to_temp_table('t1', materialize=True)
+        self.assertEqual(backend.conn.execute("select type from sqlite_master where name = 't1'").fetchall(), [('table',)])
+        self.assertEqual(backend.conn.execute('select a from t1 order by a').fetchall(), [(2,), (3,)])
+
+    def test_should_materialize_and_analyze_cache_table(self):
+        backend = _sqlite_backend(analyze_cache_tables=True)
+        backend.conn.execute('create table t (a int)')
+        backend.conn.execute('insert into t values (1), (2)')
+        backend.create_cache_table(RdbTable(backend, 'select a from t'), 't1')
+        self.assertEqual(backend.conn.execute("select type from sqlite_master where name = 't1'").fetchall(), [('table',)])
+        self.assertEqual(backend.conn.execute("select tbl from sqlite_stat1 where tbl = 't1'").fetchall(), [('t1',)])
+        self.assertEqual(backend._materialized_temp_tables, {'t1'})
+
+    def test_should_drop_temp_tables_in_batches(self):
+        from easy_sql.sql_processor.backend.rdb import PgSqlDialect
+        sql_dialect, executed_sqls = PgSqlDialect(SqlExpr()), []
+        # the untracked object t_123 is a table in the catalog
+        tables_sql, views_sql = sql_dialect.get_tables_sql('sp_temp'), sql_dialect.get_views_sql('sp_temp')
+        results = {tables_sql: [(table,) for table in ['t_123', 'a', 'b', 'c', 'd', 'e']], views_sql: [('a',), ('c',), ('e',)]}
+        conn = SimpleNamespace(execute=lambda sql, *args, **kwargs: executed_sqls.append(sql) or SimpleNamespace(fetchall=lambda: results.get(sql, [])))
+        backend = _sqlite_backend(SimpleNamespace(connect=lambda: conn), sql_dialect, 'sp_temp', is_pg=True)
+        for table, materialize in [('a', False), ('b', True), ('c', False), ('d', True), ('e', False)]:
+            backend._register_temp_table(table, materialize)
+
+        backend.clear_temp_tables(exclude=['e'])
+        self.assertEqual(executed_sqls, [tables_sql, views_sql, 'drop view if exists c, a cascade',
+                                         'drop table if exists sp_temp.d, sp_temp.b, sp_temp.t_123 cascade'])
+        self.assertEqual(backend._materialized_temp_tables, set())
+
+        # the udfs created in the temp schema should still work after all the temp tables are cleared
+        executed_sqls.clear()
+        backend.register_udfs({'udf': lambda: 'create or replace function udf() returns int as $$ select 1 $$ language sql'})
+        results[tables_sql] = [('t_123',), ('e',)]
+        backend.clear_temp_tables(exclude=[])
+        self.assertEqual(executed_sqls, ['create or replace function udf() returns int as $$ select 1 $$ language sql', tables_sql, views_sql,
+                                         'drop view if exists e cascade', 'drop table if exists sp_temp.t_123 cascade'])
+
+    def test_should_drop_temp_tables_by_kind(self):
+        backend = _sqlite_backend()
+        backend.conn.execute('create table t (a int)')
+        backend.create_temp_table(RdbTable(backend, 'select a from t'), 'a')
+        backend.create_temp_table(RdbTable(backend, 'select a from a'), 'b', materialize=True)
+        # objects not created by the backend
+        backend.conn.execute('create table t_123 (a int)')
+        backend.conn.execute('create view t_456 as select a from b')
+        backend.clear_temp_tables(exclude=['t'])
+        self.assertEqual(backend.temp_tables(), ['t'])
+
+        # objects not materialized by the backend are taken as views when the catalog could not tell the kind
+        sql_dialect = _SqliteDialect(SqlExpr())
+        sql_dialect.get_views_sql = lambda db: None
+        backend = _sqlite_backend(sql_dialect=sql_dialect)
+        backend.conn.execute('create table t (a int)')
+        backend.create_temp_table(RdbTable(backend, 'select a from t'), 'a')
+        backend.create_temp_table(RdbTable(backend, 'select a from a'), 'b', materialize=True)
+        backend.conn.execute('create view t_456 as select a from b')
+        backend.clear_temp_tables(exclude=['t'])
+        self.assertEqual(backend.temp_tables(), ['t'])
+
+    def test_should_create_unlogged_tables_for_temp_tables_in_pg(self):
+        from easy_sql.sql_processor.backend.rdb import PgSqlDialect
+        self.assertEqual(PgSqlDialect(SqlExpr()).create_materialized_temp_table_sql('t1', 'select 1'), 'create unlogged table t1 as select 1')
+        self.assertEqual(PgSqlDialect(SqlExpr()).analyze_table_sql('t1'), 'analyze t1')
+
+    def test_should_fetch_results_by_column(self):
+        from decimal import Decimal
+        columns = _columns_from_rows([(1, None, 'a'), (2, Decimal('1.5'), 'b'), (3, Decimal('2'), None)], 3)
+        self.assertEqual(columns, [(1, 2, 3), (None, 1.5, 2.0), ('a', 'b', None)])
+        self.assertIsInstance(columns[1][1], float)
+        self.assertEqual(_columns_from_rows([], 2), [(), ()])
+        self.assertEqual(RdbRow(['a', 'b'], (1, Decimal('1.5'))), RdbRow.from_converted_values(RowSchema(['a', 'b']), (1, 1.5)))
+        self.assertIsNone(RdbRow(['a'], None).as_dict())
+
+        backend = _sqlite_backend()
+        backend.conn.execute('create table t (a int, b text)')
+        backend.conn.execute("insert into t values (1, 'x'), (2, 'y'), (3, 'z')")
+        table = RdbTable(backend, 'select * from t order by a')
+        self.assertEqual(list(table.iter_column_batches(batch_size=2)), [[(1, 2), ('x', 'y')], [(3,), ('z',)]])
+        self.assertEqual([row.as_tuple() for rows in table.iter_batches(batch_size=2) for row in rows], [(1, 'x'), (2, 'y'), (3, 'z')])
+        self.assertEqual([row.as_dict() for row in table.collect()], [{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'y'}, {'a': 3, 'b': 'z'}])
+
+        rows = table.collect()
+        # rows of a result share the same schema, and carry no attribute dict
+        self.assertTrue(all(row.schema is rows[0].schema for row in rows))
+        self.assertFalse(hasattr(rows[0], '__dict__'))
+        self.assertEqual((rows[1]['b'], rows[1][0]), ('y', 2))
+
+    def test_should_insert_values_in_batches(self):
+        backend = _sqlite_backend()
+        backend.conn.execute('create table t (a int, b text)')
+        backend._insert_values('t', ['a', 'b'], [[i, f'v{i}'] for i in range(5)], batch_size=2)
+        self.assertEqual(backend.conn.execute('select * from t order by a').fetchall(), [(i, f'v{i}') for i in range(5)])
+
+    def test_should_format_pg_copy_values(self):
+        from datetime import date, datetime
+        self.assertEqual([_to_pg_copy_value(v) for v in [None, '', 'a"b,c', 1, 1.5, True, date(2021, 1, 1), datetime(2021, 1, 1, 10, 1, 2)]],
+                         ['', '""', '"a""b,c"', '1', '1.5', 'true', '2021-01-01', '2021-01-01T10:01:02'])
+
+    def test_should_use_a_connection_per_thread(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import QueuePool
+        backend = _sqlite_backend(create_engine('sqlite://', poolclass=QueuePool, pool_size=2, max_overflow=0, pool_timeout=1,
+                                                connect_args={'check_same_thread': False}))
+        main_conn = backend.conn
+        self.assertIs(backend.conn, main_conn)
+        thread_conns = []
+        for _ in range(3):
+            thread = threading.Thread(target=lambda: thread_conns.append(backend.conn))
+            thread.start()
+            thread.join()
+        # connections of the ended threads are returned to the pool, so the pool is never exhausted
+        self.assertEqual(len(thread_conns), 3)
+        self.assertTrue(all(conn is not main_conn for conn in thread_conns))
+
+    def test_should_write_partitions_concurrently(self):
+        backend = _sqlite_backend(pool_size=4, max_overflow=0, partition_write_parallelism=8)
+        lock, running, max_running, written = threading.Lock(), [0], [0], []
+
+        def write_partition(save_partition):
+            with lock:
+                running[0] += 1
+                max_running[0] = max(max_running[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+                written.append(save_partition)
+
+        partitions = [[Partition('dt', str(i))] for i in range(6)]
+        backend._write_partitions('db.t', partitions, write_partition)
+        # one connection is kept for the current thread
+        self.assertEqual(max_running[0], 3)
+        self.assertEqual(sorted(written, key=lambda pt: pt[0].value), partitions)
+
+        def failed_write_partition(save_partition):
+            raise Exception(f'failed to write {save_partition[0]}')
+
+        with self.assertRaisesRegex(Exception, 'failed to write dt='):
+            backend._write_partitions('db.t', partitions, failed_write_partition)
+
+    def test_should_cache_catalog_within_scope(self):
+        fetched = []
+
+        def fetch_tables(db):
+            fetched.append(db)
+            return ['t1', 't2']
+
+        catalog = RdbCatalog(SimpleNamespace(temp_schema='temp', _fetch_tables=fetch_tables))
+        catalog.tables('db')
+        catalog.tables('db')
+        self.assertEqual(fetched, ['db', 'db'])
+
+        fetched.clear()
+        with catalog.scope():
+            self.assertEqual(catalog.tables('db'), ['t1', 't2'])
+            catalog.tables('db')
+            catalog.tables('temp')
+            self.assertEqual(fetched, ['db', 'temp'])
+            catalog.invalidate('db.t1')
+            catalog.invalidate('t1')
+            catalog.tables('db')
+            catalog.tables('temp')
+            self.assertEqual(fetched, ['db', 'temp', 'db', 'temp'])
+        catalog.tables('db')
+        self.assertEqual(fetched, ['db', 'temp', 'db', 'temp', 'db'])
+
+    def test_should_parse_metrics_of_pg_analyzed_plan(self):
+        plan = 'Hash Join  (cost=1.09..2.21 rows=6 width=8) (actual time=0.031..0.042 rows=5 loops=1)\n' \
+               '  Hash Cond: (a.id = b.id)\n' \
+               '  Buffers: shared hit=3 read=2\n' \
+               '  ->  Seq Scan on a  (cost=0.00..1.06 rows=6 width=4) (actual time=0.010..0.012 rows=6 loops=1)\n' \
+               '        Buffers: shared hit=1'
+        self.assertEqual(_pg_analyzed_plan_metrics(plan), {'execution_time_ms': 0.042, 'rows': 5, 'bytes_scanned': 5 * 8192})
+        self.assertEqual(_pg_analyzed_plan_metrics('Seq Scan on a  (cost=0.00..1.06 rows=6 width=4)'), {})
+
+    def test_should_recognize_query_sql(self):
+        self.assertTrue(_is_query_sql(' select 1'))
+        self.assertTrue(_is_query_sql(['with a as (select 1) select * from a', 'show tables']))
+        self.assertFalse(_is_query_sql('drop table t'))
+        self.assertFalse(_is_query_sql(['select 1', 'create view v as select 1']))
+
 
 if __name__ == '__main__':
     unittest.main()
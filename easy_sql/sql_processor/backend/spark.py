@@ -1,9 +1,10 @@
-from typing import Dict, Callable, List, Any, Tuple, Union
+import uuid
+from typing import Dict, Callable, List, Any, Tuple, Union, Iterator, Optional
 
 
 from .base import *
 from .base import Col
-from ..common import SqlProcessorAssertionError
+from ..common import SqlProcessorAssertionError, SqlProcessorException
 from ...udf import udfs
 from ...logger import logger
 
@@ -12,29 +13,64 @@ __all__ = [
 ]
 
 
-class SparkRow(Row):
+_ARROW_ENABLED_CONF = 'spark.sql.execution.arrow.pyspark.enabled'
+# types converted by arrow to the same python values as the rows collected by py4j,
+# e.g. timestamps are excluded since arrow converts them with the session time zone
+_ARROW_SUPPORTED_TYPES = ['boolean', 'byte', 'short', 'integer', 'long', 'float', 'double', 'decimal', 'string', 'date']
 
-    def __init__(self, row):
-        from pyspark.sql.types import Row
-        self.row: Row = row
 
-    def as_dict(self):
-        return self.row.asDict()
+def _arrow_enabled(spark) -> bool:
+    if spark.conf.get(_ARROW_ENABLED_CONF, 'false').lower() != 'true':
+        return False
+    try:
+        import pyarrow
+        import pandas
+    except ImportError:
+        return False
+    return True
 
-    def as_tuple(self) -> Tuple:
-        return self.row
+
+def _arrow_supported(schema: 'pyspark.sql.types.StructType') -> bool:
+    return len(schema.fields) > 0 and all([field.dataType.typeName() in _ARROW_SUPPORTED_TYPES for field in schema.fields])
+
+
+def _create_data_frame(spark, values: List[List[Any]], schema: Union['pyspark.sql.types.StructType', List[str]]):
+    from pyspark.sql.types import StructType
+    if isinstance(schema, StructType) and values and _arrow_supported(schema) and _arrow_enabled(spark):
+        import pandas
+        # data frames created from pandas are transferred to the jvm in arrow batches instead of row by row
+        pdf = pandas.DataFrame.from_records([tuple(row) for row in values], columns=schema.fieldNames())
+        try:
+            return spark.createDataFrame(pdf, schema)
+        except Exception as e:
+            logger.info(f'failed to create data frame with arrow, will fall back to create from rows: {e}')
+    return spark.createDataFrame(values, schema)
+
+
+class SparkRow(SchemaRow):
+    __slots__ = ()
+
+    def __init__(self, row, schema: RowSchema = None):
+        """
+        :param row: the pyspark Row
+        :param schema: the schema shared by the rows of the same result, derived from the row if not provided
+        """
+        schema = schema or RowSchema(getattr(row, '__fields__', []) if row is not None else [])
+        super().__init__(schema, None if row is None else tuple(row))
 
     def __eq__(self, other):
-        return self.row.__eq__(other)
+        # pyspark rows are tuples, and are compared by values only
+        if isinstance(other, SchemaRow):
+            return self.values == other.values
+        return isinstance(other, tuple) and self.values == other
 
-    def __str__(self):
-        return str(self.row)[4:-1]
+    __hash__ = None
 
-    def __getitem__(self, i):
-        return self.row[i]
+    def __str__(self):
+        return ", ".join([f"{k}={v!r}" for k, v in zip(self.schema.names, self.values or ())])
 
     def __repr__(self):
-        return self.row.__repr__()
+        return f'Row({self})'
 
 
 class SparkTable(Table):
@@ -44,7 +80,8 @@ class SparkTable(Table):
         self.df: DataFrame = df
 
     def is_empty(self) -> bool:
-        return self.df.rdd.isEmpty()
+        # head(1) keeps the query in catalyst and stops at the first row
+        return len(self.df.head(1)) == 0
 
     def field_names(self) -> List[str]:
         return self.df.schema.fieldNames()
@@ -61,7 +98,51 @@ class SparkTable(Table):
         return SparkTable(self.df.withColumn(name, value if isinstance(value, Column) else expr(value)))
 
     def collect(self) -> List['Row']:
-        return [SparkRow(row) for row in self.df.collect()]
+        schema = RowSchema(self.df.schema.fieldNames())
+        values = self._collect_with_arrow()
+        if values is not None:
+            return [SparkRow(row, schema) for row in values]
+        return [SparkRow(row, schema) for row in self.df.collect()]
+
+    def _collect_with_arrow(self) -> Optional[List[tuple]]:
+        """
+        Collect the values in arrow batches, returns None if arrow is not enabled or not supported by the types of the table.
+        """
+        if not _arrow_supported(self.df.schema) or not _arrow_enabled(self.df.sql_ctx.sparkSession):
+            return None
+        try:
+            batches = self.df._collect_as_arrow()
+        except Exception as e:
+            logger.info(f'failed to collect with arrow, will fall back to collect rows: {e}')
+            return None
+        import pyarrow
+        values = []
+        for batch in batches:
+            columns = [column.to_pylist() for column in pyarrow.Table.from_batches([batch]).columns]
+            values.extend(zip(*columns))
+        return values
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[List['Row']]:
+        schema = RowSchema(self.df.schema.fieldNames())
+        batch = []
+        for row in self.df.toLocalIterator():
+            batch.append(SparkRow(row, schema))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def iter_column_batches(self, batch_size: int = 1000) -> Iterator[List[tuple]]:
+        # values consumed by column are all kept by the caller (e.g. list variables),
+        # so collect them in one job instead of one job per partition by toLocalIterator
+        values = self._collect_with_arrow()
+        if values is None:
+            values = self.df.collect()
+        field_count = len(self.df.schema.fields)
+        for start in range(0, len(values), batch_size):
+            rows = values[start:start + batch_size]
+            yield [tuple([row[i] for row in rows]) for i in range(field_count)]
 
     def show(self, count: int = 20):
         self.df.show(count)
@@ -72,13 +153,25 @@ class SparkTable(Table):
 
 class SparkBackend(Backend):
 
-    def __init__(self, spark):
+    def __init__(self, spark, use_arrow: bool = False):
+        """
+        :param use_arrow: transfer data between python and the jvm in arrow batches when collecting tables and creating tables with data,
+            pyarrow and pandas must be installed. It could also be enabled by setting spark.sql.execution.arrow.pyspark.enabled.
+        """
         from pyspark.sql import SparkSession
         self.spark: SparkSession = spark
+        if use_arrow:
+            self.spark.conf.set(_ARROW_ENABLED_CONF, 'true')
+            self.spark.conf.set('spark.sql.execution.arrow.pyspark.fallback.enabled', 'true')
+            if not _arrow_enabled(self.spark):
+                logger.warning(f'arrow is not enabled since pyarrow or pandas is not installed, or {_ARROW_ENABLED_CONF} could not be set')
 
     def reset(self):
         pass
 
+    def support_concurrent_execution(self) -> bool:
+        return True
+
     def init_udfs(self, scala_udf_initializer: str, *args, **kwargs):
         if scala_udf_initializer:
             from py4j.java_gateway import java_import
@@ -116,7 +209,7 @@ class SparkBackend(Backend):
         from pyspark.sql.types import StructType
         return SparkTable(self.spark.createDataFrame(self.spark.sparkContext.emptyRDD(), StructType([])))
 
-    def create_temp_table(self, table: 'SparkTable', name: str):
+    def create_temp_table(self, table: 'SparkTable', name: str, materialize: bool = False):
         table.df.createOrReplaceTempView(name)
 
     def create_cache_table(self, table: 'SparkTable', name: str):
@@ -136,6 +229,10 @@ class SparkBackend(Backend):
         logger.info(f'will exec sql: {sql}')
         return SparkTable(self.spark.sql(sql))
 
+    def explain(self, table: 'SparkTable', analyze: bool = False) -> Optional[QueryPlan]:
+        # the physical plan is available without executing the query, spark does not support analyze
+        return QueryPlan(table.df._jdf.queryExecution().executedPlan().toString())
+
     def table_exists(self, table: 'TableMeta'):
         from pyspark.sql.utils import AnalysisException
         try:
@@ -158,25 +255,35 @@ class SparkBackend(Backend):
                         f'table_name={dbname}.{table_name}, p.field={p.field}, p.value={p.value}')
                 df = df.withColumn(p.field, lit(p.value))
 
-        df.createOrReplaceTempView('table_data')
+        # use a unique view name since tables might be created concurrently
+        table_data_view = f'table_data_{uuid.uuid4().hex}'
+        df.createOrReplaceTempView(table_data_view)
         partition_expr = f'partitioned by ({",".join([p.field for p in partitions])}) ' if partitions else ''
         create_database_stmt = f'create database if not exists {dbname}'
         create_table_stmt = f"""create table if not exists {dbname}.{table_name} using hive
                                 options(FILEFORMAT "parquet") {partition_expr}
                                 TBLPROPERTIES ("transactional" = "false")
-                                as select * from table_data"""
+                                as select * from {table_data_view}"""
 
         self.exec_native_sql(create_database_stmt)
         self.exec_native_sql(create_table_stmt)
+        self.spark.catalog.dropTempView(table_data_view)
         return self
 
-    def save_table(self, source_table_meta: 'TableMeta', target_table_meta: 'TableMeta', save_mode: 'SaveMode', create_target_table: bool):
+    def save_table(self, source_table_meta: 'TableMeta', target_table_meta: 'TableMeta', save_mode: 'SaveMode', create_target_table: bool,
+                   staged: bool = False):
         from pyspark.sql.functions import lit
 
         if not self.table_exists(target_table_meta) and create_target_table:
             schema = self.spark.sql(f'select * from {source_table_meta.table_name}').limit(0).schema
             self._create_table(target_table_meta.dbname, target_table_meta.pure_table_name, schema, target_table_meta.partitions)
 
+        if staged:
+            if save_mode != SaveMode.overwrite:
+                logger.warning(f'staged write only supports overwrite, will save table {target_table_meta.table_name} directly')
+            elif self._save_table_staged(source_table_meta, target_table_meta):
+                return
+
         temp_res = self.exec_native_sql(f"select * from {source_table_meta.table_name}")
         # partial dynamic partition (动态分区和静态分区同时使用）在 spark 2.3.2 上有问题，参见 https://issues.apache.org/jira/browse/SPARK-31605
         # 纯动态分区时，如果当日没有新增数据，则不会创建 partition。而我们希望对于静态分区，总是应该创建分区，即使当日没有数据
@@ -197,12 +304,196 @@ class SparkBackend(Backend):
 
         # to resolve issue: pyspark.sql.utils.AnalysisException: Cannot overwrite a path that is also being read from.
         # refer: https://stackoverflow.com/questions/38746773/read-from-a-hive-table-and-write-back-to-it-using-spark-sql
-        temp_res = self.spark.createDataFrame(temp_res.rdd, temp_res.schema)
-        temp_res.createOrReplaceTempView('res')
+        # the lineage is only broken when the target table is read, so that the plan of other outputs is kept as a whole
+        if self._reads_table(temp_res, target_table_meta.table_name):
+            temp_res = self._break_lineage(temp_res)
+        # use a unique view name since tables might be saved concurrently
+        res_view = f'res_{uuid.uuid4().hex}'
+        temp_res.createOrReplaceTempView(res_view)
 
         save_sql = f"insert {'into' if save_mode == SaveMode.append else save_mode.name} table {target_table_meta.table_name} {partition_expr} " \
-                   f"select * from res"
-        self.exec_native_sql(save_sql)
+                   f"select * from {res_view}"
+        from pyspark.sql.utils import AnalysisException
+        try:
+            self.exec_native_sql(save_sql)
+        except AnalysisException as e:
+            # the check happens before any data written, so it is safe to retry
+            if 'Cannot overwrite a path that is also being read from' not in str(e):
+                raise e
+            logger.info(f'target table {target_table_meta.table_name} is read by the query, will save it again after breaking the lineage')
+            self._break_lineage(temp_res).createOrReplaceTempView(res_view)
+            self.exec_native_sql(save_sql)
+        finally:
+            self.spark.catalog.dropTempView(res_view)
+
+    def _save_table_staged(self, source_table_meta: 'TableMeta', target_table_meta: 'TableMeta') -> bool:
+        """
+        Write the data to a staging directory, and then point the partitions (or the table, if not partitioned) to the written directories.
+        Readers never observe partial data, since every partition is switched by one metastore operation after all the data is written.
+        Partitions without data written are kept, the same as overwriting hive tables with dynamic partitions.
+        If any step fails, the partitions already switched are pointed back and the staging directory is deleted.
+        Returns False if the format of the table is not supported.
+        """
+        from pyspark.sql.functions import lit
+        table_name = target_table_meta.table_name
+        table_format, table_location = self._table_format(table_name), self._table_location(table_name)
+        if table_format is None or table_location is None:
+            logger.info(f'staged write is not supported for table {table_name}, will save it directly')
+            return False
+        table_meta = TableMeta(table_name)
+        self.refresh_table_partitions(table_meta)
+        partition_cols = [p.field for p in table_meta.partitions]
+        static_partitions = [p for p in target_table_meta.partitions if p.value]
+
+        temp_res = self.exec_native_sql(f"select * from {source_table_meta.table_name}")
+        for p in static_partitions:
+            temp_res = temp_res.withColumn(p.field, lit(p.value))
+        temp_res = temp_res.select(*self.exec_native_sql(f'select * from {table_name}').limit(0).columns)
+
+        jvm = self.spark.sparkContext._jvm
+        staging_root = f'{self._database_location(target_table_meta.dbname)}/.easy_sql_staging/{target_table_meta.pure_table_name}'
+        staging_location = f'{staging_root}/{uuid.uuid4().hex}'
+        staging_path = jvm.org.apache.hadoop.fs.Path(staging_location)
+        fs = staging_path.getFileSystem(self.spark.sparkContext._jsc.hadoopConfiguration())
+        # (partition spec, the location replaced) of the partitions switched, the spec is None for a table not partitioned,
+        # and the location is None for a partition added
+        switched: List[Tuple[Optional[str], Optional[str]]] = []
+        try:
+            logger.info(f'writing data of table {table_name} to staging location {staging_location}')
+            # the staging directory is invisible until the metastore is changed, so a faster but non-atomic commit of the files is fine
+            temp_res.write.format(table_format).partitionBy(*partition_cols).mode('overwrite') \
+                .option('mapreduce.fileoutputcommitter.algorithm.version', '2').save(staging_location)
+
+            if not partition_cols:
+                self.exec_native_sql(f"alter table {table_name} set location '{staging_location}'")
+                switched.append((None, table_location))
+            else:
+                escape = jvm.org.apache.spark.sql.catalyst.catalog.ExternalCatalogUtils.escapePathName
+                if len(static_partitions) == len(partition_cols):
+                    # static partitions are always created, even if there is no data
+                    fs.mkdirs(jvm.org.apache.hadoop.fs.Path(staging_location + '/' + '/'.join([f'{p.field}={escape(str(p.value))}' for p in static_partitions])))
+                existing_partitions = set([row[0] for row in self.exec_native_sql(f'show partitions {table_name}').collect()])
+                for partition_path in self._list_partition_paths(fs, staging_path, len(partition_cols)):
+                    partition_location = f'{staging_location}/{partition_path}'
+                    spec = self._partition_spec_sql(jvm, partition_path)
+                    if partition_path in existing_partitions:
+                        old_location = self._table_location(f'{table_name} partition ({spec})')
+                        if old_location is None:
+                            raise SqlProcessorException(f'location of partition ({spec}) of table {table_name} not found')
+                        self.exec_native_sql(f"alter table {table_name} partition ({spec}) set location '{partition_location}'")
+                        switched.append((spec, old_location))
+                    else:
+                        self.exec_native_sql(f"alter table {table_name} add partition ({spec}) location '{partition_location}'")
+                        switched.append((spec, None))
+        except Exception:
+            self._rollback_staged_write(table_name, switched, fs, staging_location)
+            raise
+        self.spark.catalog.refreshTable(table_name)
+
+        # the data replaced is deleted at last, only if it is managed by the table or by the staged write
+        from urllib.parse import urlparse
+        table_dir, staging_root_dir = urlparse(table_location).path.rstrip('/'), urlparse(staging_root).path.rstrip('/')
+        for _, old_location in switched:
+            old_path = urlparse(old_location or '').path.rstrip('/')
+            if not any([old_path == managed_dir or old_path.startswith(f'{managed_dir}/') for managed_dir in [table_dir, staging_root_dir]]):
+                continue
+            try:
+                fs.delete(jvm.org.apache.hadoop.fs.Path(old_location), True)
+                if old_path.startswith(f'{staging_root_dir}/'):
+                    self._delete_empty_staging_dirs(fs, jvm.org.apache.hadoop.fs.Path(old_location).getParent(), staging_root_dir)
+            except Exception as e:
+                logger.warning(f'failed to delete the replaced data {old_location} of table {table_name}: {e}')
+        return True
+
+    def _rollback_staged_write(self, table_name: str, switched: List[Tuple[Optional[str], Optional[str]]], fs, staging_location: str):
+        logger.warning(f'staged write of table {table_name} failed, will roll back {len(switched)} partitions switched')
+        try:
+            for spec, old_location in reversed(switched):
+                if spec is None:
+                    self.exec_native_sql(f"alter table {table_name} set location '{old_location}'")
+                elif old_location is None:
+                    self.exec_native_sql(f"alter table {table_name} drop if exists partition ({spec})")
+                else:
+                    self.exec_native_sql(f"alter table {table_name} partition ({spec}) set location '{old_location}'")
+            fs.delete(self.spark.sparkContext._jvm.org.apache.hadoop.fs.Path(staging_location), True)
+            self.spark.catalog.refreshTable(table_name)
+        except Exception as e:
+            # the partitions not pointed back may still be located in the staging directory, which must be kept
+            logger.warning(f'failed to roll back the staged write of table {table_name}, staging location {staging_location} is kept: {e}')
+
+    def _delete_empty_staging_dirs(self, fs, path, staging_root_dir: str):
+        # a staging directory is deleted when none of its partitions is used by the table, only files like _SUCCESS are left then
+        from urllib.parse import urlparse
+        while urlparse(path.toString()).path.rstrip('/').startswith(f'{staging_root_dir}/') \
+                and not any([status.isDirectory() for status in fs.listStatus(path)]):
+            fs.delete(path, True)
+            path = path.getParent()
+
+    def _list_partition_paths(self, fs, path, depth: int) -> List[str]:
+        if depth == 0:
+            return ['']
+        partition_paths = []
+        for status in fs.listStatus(path):
+            name = status.getPath().getName()
+            if status.isDirectory() and not name.startswith('_') and not name.startswith('.'):
+                partition_paths.extend([f'{name}/{sub_path}'.rstrip('/') for sub_path in self._list_partition_paths(fs, status.getPath(), depth - 1)])
+        return partition_paths
+
+    def _partition_spec_sql(self, jvm, partition_path: str) -> str:
+        unescape = jvm.org.apache.spark.sql.catalyst.catalog.ExternalCatalogUtils.unescapePathName
+        specs = []
+        for part in partition_path.split('/'):
+            field, value = part.split('=', 1)
+            value = unescape(value).replace('\\', '\\\\').replace("'", "\\'")
+            specs.append(f"{unescape(field)}='{value}'")
+        return ', '.join(specs)
+
+    def _table_format(self, table_name: str) -> Optional[str]:
+        table_info = dict([(row.col_name, row.data_type) for row in self.spark.sql(f'describe table extended {table_name}').collect()])
+        provider, serde = (table_info.get('Provider') or '').lower(), (table_info.get('Serde Library') or '').lower()
+        for table_format in ['parquet', 'orc']:
+            if provider == table_format or (provider == 'hive' and table_format in serde):
+                return table_format
+        return None
+
+    def _database_location(self, db: str) -> str:
+        db_info = dict([(row[0], row[1]) for row in self.spark.sql(f'describe database {db}').collect()])
+        return db_info['Location'].rstrip('/')
+
+    def _reads_table(self, df: 'pyspark.sql.DataFrame', table_name: str) -> bool:
+        location = self._table_location(table_name)
+        if location is None:
+            return False
+        from urllib.parse import urlparse
+        # compare the paths only, since the scheme and authority may be written differently, e.g. file:/a and file:///a
+        input_paths = set([urlparse(file).path for file in df.inputFiles()])
+        if not input_paths:
+            return False
+        # partitions may be located outside the table location (e.g. after a staged write), so check the locations of them as well
+        locations = set([urlparse(location).path.rstrip('/') for location in [location] + self._partition_locations(table_name)])
+        for path in input_paths:
+            while path:
+                if path in locations:
+                    return True
+                path = path.rsplit('/', 1)[0]
+        return False
+
+    def _partition_locations(self, table_name: str) -> List[str]:
+        """
+        Locations of the partitions of the table recorded in the metastore, fetched without listing any file.
+        """
+        jvm = self.spark.sparkContext._jvm
+        names = table_name.split('.')
+        identifier = jvm.org.apache.spark.sql.catalyst.TableIdentifier(names[-1], jvm.scala.Option.apply(names[0] if len(names) > 1 else None))
+        catalog = self.spark._jsparkSession.sessionState().catalog()
+        if catalog.getTableMetadata(identifier).partitionColumnNames().isEmpty():
+            return []
+        partitions = catalog.listPartitions(identifier, jvm.scala.Option.apply(None))
+        return [partitions.apply(i).location().toString() for i in range(partitions.size())]
+
+    def _break_lineage(self, df: 'pyspark.sql.DataFrame') -> 'pyspark.sql.DataFrame':
+        # the data is kept in the block managers of the executors, without being converted to python objects
+        return df.localCheckpoint(eager=True)
 
     def refresh_table_partitions(self, table: 'TableMeta'):
         df = self.exec_native_sql(f'desc {table.table_name}')
@@ -219,6 +510,48 @@ class SparkBackend(Backend):
         self.spark.catalog.clearCache()
         clear_temp_views(self.spark)
 
+    def materialize_table(self, table_name: str, data_dir: str, data_id: str) -> str:
+        location = f'{data_dir.rstrip("/")}/tables/{data_id}'
+        self.spark.table(table_name).write.mode('overwrite').parquet(location)
+        # read from the persisted data afterwards, so that the query of the table is not executed again by the following steps
+        cached = self.spark.catalog.isCached(table_name)
+        self.spark.read.parquet(location).createOrReplaceTempView(table_name)
+        if cached:
+            self.spark.catalog.cacheTable(table_name)
+        return location
+
+    def load_materialized_table(self, location: str, table_name: str):
+        self.spark.read.parquet(location).createOrReplaceTempView(table_name)
+
+    def _table_location(self, table_name: str) -> Optional[str]:
+        from pyspark.sql.utils import AnalysisException
+        try:
+            table_info = self.spark.sql(f'describe table extended {table_name}').collect()
+        except AnalysisException:
+            return None
+        locations = [row.data_type for row in table_info if row.col_name == 'Location']
+        return locations[0] if locations else None
+
+    def table_version(self, table_name: str) -> Optional[str]:
+        location = self._table_location(table_name)
+        if location is None:
+            return None
+        # any change of the data files of the table or its partitions changes the count, size or modification time of the files
+        jvm = self.spark.sparkContext._jvm
+        path = jvm.org.apache.hadoop.fs.Path(location)
+        files = path.getFileSystem(self.spark.sparkContext._jsc.hadoopConfiguration()).listFiles(path, True)
+        file_count, total_size, max_modification_time = 0, 0, 0
+        while files.hasNext():
+            file = files.next()
+            file_count, total_size = file_count + 1, total_size + file.getLen()
+            max_modification_time = max(max_modification_time, file.getModificationTime())
+        return f'{file_count}-{total_size}-{max_modification_time}'
+
+    def drop_materialized_table(self, location: str):
+        jvm = self.spark.sparkContext._jvm
+        path = jvm.org.apache.hadoop.fs.Path(location)
+        path.getFileSystem(self.spark.sparkContext._jsc.hadoopConfiguration()).delete(path, True)
+
     def create_table_with_data(self, full_table_name: str, values: List[List[Any]], schema: Union['pyspark.sql.types.StructType', List[Col]],
                                partitions: List['Partition']):
         print(f'creating table: {full_table_name}')
@@ -226,10 +559,10 @@ class SparkBackend(Backend):
         self.spark.sql(f'drop table if exists {full_table_name}').collect()
         from pyspark.sql.types import StructType
         schema_or_cols = schema if isinstance(schema, StructType) else [col.name for col in schema]
-        write = self.spark.createDataFrame(values, schema_or_cols).write
+        write = _create_data_frame(self.spark, values, schema_or_cols).write
         if partitions:
             write = write.partitionBy(*[p.field for p in partitions])
         write.mode('overwrite').saveAsTable(full_table_name, mode='overwrite')
 
     def create_temp_table_with_data(self, table_name: str, values: List[List[Any]], schema: 'StructType'):
-        self.spark.createDataFrame(values, schema).createOrReplaceTempView(table_name)
+        _create_data_frame(self.spark, values, schema).createOrReplaceTempView(table_name)
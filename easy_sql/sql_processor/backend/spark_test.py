@@ -3,7 +3,7 @@ import unittest
 from pyspark.sql.functions import lit,expr
 
 from easy_sql.base_test import LocalSpark
-from easy_sql.sql_processor.backend import SparkTable
+from easy_sql.sql_processor.backend import SparkTable, SparkBackend, TableMeta, SaveMode, Partition
 
 
 class SparkTest(unittest.TestCase):
@@ -19,6 +19,90 @@ class SparkTest(unittest.TestCase):
         self.assertEqual(SparkTable(df).with_column('flag', '1==2').df.select('flag').limit(1).collect(), [(False,)])
         self.assertEqual(SparkTable(df).with_column('flag', expr('1==2')).df.select('flag').limit(1).collect(), [(False,)])
 
+    def test_should_collect_the_same_rows_with_arrow(self):
+        from datetime import date
+        from decimal import Decimal
+        from pyspark.sql.types import StructType, StructField, IntegerType, StringType, DateType, DecimalType
+        backend = SparkBackend(LocalSpark.get(), use_arrow=True)
+        try:
+            schema = StructType([StructField('id', IntegerType()), StructField('val', StringType()),
+                                 StructField('dt', DateType()), StructField('amount', DecimalType(10, 2))])
+            values = [[1, 'a', date(2021, 1, 1), Decimal('1.50')], [2, None, None, None]]
+            backend.create_temp_table_with_data('arrow_test', values, schema)
+            rows = backend.exec_sql('select * from arrow_test order by id').collect()
+            self.assertEqual([row.as_tuple() for row in rows], [tuple(v) for v in values])
+            self.assertEqual(rows[0].as_dict(), {'id': 1, 'val': 'a', 'dt': date(2021, 1, 1), 'amount': Decimal('1.50')})
+        finally:
+            backend.spark.conf.set('spark.sql.execution.arrow.pyspark.enabled', 'false')
+
+    def test_should_overwrite_the_table_being_read(self):
+        backend = SparkBackend(LocalSpark.get())
+        backend.exec_native_sql('create database if not exists spark_test_db')
+        backend.exec_native_sql('drop table if exists spark_test_db.t')
+        backend.exec_native_sql('create table spark_test_db.t (id int) using parquet')
+        backend.exec_native_sql('insert into spark_test_db.t values (1), (2)')
+        backend.exec_native_sql('drop table if exists spark_test_db.other')
+        backend.exec_native_sql('create table spark_test_db.other (id int) using parquet')
+
+        df = backend.exec_native_sql('select id + 1 as id from spark_test_db.t')
+        self.assertTrue(backend._reads_table(df, 'spark_test_db.t'))
+        self.assertFalse(backend._reads_table(df, 'spark_test_db.other'))
+
+        df.createOrReplaceTempView('t_plus_one')
+        backend.save_table(TableMeta('t_plus_one'), TableMeta('spark_test_db.t'), SaveMode.overwrite, False)
+        self.assertEqual(sorted([row[0] for row in backend.exec_native_sql('select id from spark_test_db.t').collect()]), [2, 3])
+
+    def test_should_save_table_staged(self):
+        backend = SparkBackend(LocalSpark.get())
+        backend.exec_native_sql('create database if not exists spark_test_db')
+        backend.exec_native_sql('drop table if exists spark_test_db.staged')
+        backend.exec_native_sql('create table spark_test_db.staged (id int, dt string) using parquet partitioned by (dt)')
+        backend.exec_native_sql("insert into spark_test_db.staged values (1, '2021-01-01'), (2, '2021-01-02')")
+
+        backend.exec_native_sql("select 3 as id, '2021-01-02' as dt union all select 4 as id, '2021-01-03' as dt").createOrReplaceTempView('staged_source')
+        backend.save_table(TableMeta('staged_source'), TableMeta('spark_test_db.staged', [Partition('dt')]), SaveMode.overwrite, False, staged=True)
+        self.assertEqual(backend.exec_native_sql('select id, dt from spark_test_db.staged order by id').collect(),
+                         [(1, '2021-01-01'), (3, '2021-01-02'), (4, '2021-01-03')])
+
+        backend.exec_native_sql('select 5 as id').createOrReplaceTempView('staged_source')
+        backend.save_table(TableMeta('staged_source'), TableMeta('spark_test_db.staged', [Partition('dt', '2021-01-01')]), SaveMode.overwrite, False,
+                           staged=True)
+        self.assertEqual(backend.exec_native_sql('select id, dt from spark_test_db.staged order by id').collect(),
+                         [(3, '2021-01-02'), (4, '2021-01-03'), (5, '2021-01-01')])
+
+        # the partitions are located in the staging directory now, which is outside the table location
+        df = backend.exec_native_sql('select id + 10 as id, dt from spark_test_db.staged')
+        self.assertTrue(backend._reads_table(df, 'spark_test_db.staged'))
+        df.createOrReplaceTempView('staged_source')
+        backend.save_table(TableMeta('staged_source'), TableMeta('spark_test_db.staged', [Partition('dt')]), SaveMode.overwrite, False)
+        self.assertEqual(backend.exec_native_sql('select id from spark_test_db.staged order by id').collect(), [(13,), (14,), (15,)])
+
+    def test_should_roll_back_staged_write_when_switch_failed(self):
+        backend = SparkBackend(LocalSpark.get())
+        backend.exec_native_sql('create database if not exists spark_test_db')
+        backend.exec_native_sql('drop table if exists spark_test_db.staged_failed')
+        backend.exec_native_sql('create table spark_test_db.staged_failed (id int, dt string) using parquet partitioned by (dt)')
+        backend.exec_native_sql("insert into spark_test_db.staged_failed values (1, '2021-01-01')")
+
+        exec_native_sql = backend.exec_native_sql
+
+        def failing_exec_native_sql(sql):
+            if 'add partition' in sql:
+                raise Exception('failed to add partition')
+            return exec_native_sql(sql)
+        backend.exec_native_sql = failing_exec_native_sql
+        backend.spark.sql("select 2 as id, '2021-01-01' as dt union all select 3 as id, '2021-01-02' as dt").createOrReplaceTempView('staged_source')
+        with self.assertRaisesRegex(Exception, 'failed to add partition'):
+            backend.save_table(TableMeta('staged_source'), TableMeta('spark_test_db.staged_failed', [Partition('dt')]), SaveMode.overwrite, False,
+                               staged=True)
+        backend.exec_native_sql = exec_native_sql
+
+        self.assertEqual(backend.exec_native_sql('select id, dt from spark_test_db.staged_failed').collect(), [(1, '2021-01-01')])
+        staging_root = f'{backend._database_location("spark_test_db")}/.easy_sql_staging/staged_failed'
+        path = backend.spark.sparkContext._jvm.org.apache.hadoop.fs.Path(staging_root)
+        fs = path.getFileSystem(backend.spark.sparkContext._jsc.hadoopConfiguration())
+        self.assertEqual(len(fs.listStatus(path)) if fs.exists(path) else 0, 0)
+
 
 if __name__ == '__main__':
     unittest.main()
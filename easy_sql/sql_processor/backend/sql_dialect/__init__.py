@@ -109,15 +109,50 @@ class SqlDialect:
     def get_tables_sql(self, db) -> str:
         raise NotImplementedError()
 
+    def get_views_sql(self, db) -> Optional[str]:
+        """
+        Sql to list the views in the db (the first column of the result), or None if the catalog could not tell views from tables.
+        """
+        return None
+
     def create_table_sql(self, table_name: str, select_sql: str) -> str:
         raise NotImplementedError()
 
+    def create_materialized_temp_table_sql(self, table_name: str, select_sql: str) -> str:
+        """
+        Sql to create a physical table holding intermediate results, which are dropped when the processor finishes,
+        so durability could be traded for speed.
+        """
+        return self.create_table_sql(table_name, select_sql)
+
+    def analyze_table_sql(self, table_name: str) -> Optional[str]:
+        """
+        Sql to collect the statistics of the table for the query planner, or None if not supported.
+        """
+        return None
+
     def rename_view_sql(self, from_table: str, to_table: str) -> str:
         raise NotImplementedError()
 
     def drop_view_sql(self, table: str) -> str:
         raise NotImplementedError()
 
+    def drop_views_sql(self, tables: List[str]) -> Union[str, List[str]]:
+        """
+        Sql to drop the views in order, override it if the database could drop multiple views in one statement.
+        """
+        return [self.drop_view_sql(table) for table in tables]
+
+    def drop_tables_sql(self, tables: List[str]) -> Union[str, List[str]]:
+        """
+        Sql to drop the tables in order, together with the objects depending on them, the same as `drop_views_sql` for tables.
+        """
+        sqls = []
+        for table in tables:
+            sql = self.drop_table_sql(table, cascade=True)
+            sqls.extend(sql if isinstance(sql, list) else [sql])
+        return sqls
+
     def create_view_sql(self, table_name: str, select_sql: str) -> str:
         raise NotImplementedError()
 
@@ -150,7 +185,30 @@ class SqlDialect:
     def insert_data_sql(self, table_name: str, col_names_expr: str, select_sql: str, partitions: List[Partition]) -> Union[str, List[str]]:
         raise NotImplementedError()
 
-    def drop_table_sql(self, table: str) -> str:
+    def bulk_insert_sql(self, table_name: str, col_names: List[str]) -> Optional[str]:
+        """
+        The statement to load many rows into a table at once with the native protocol of the database,
+        None means rows should be inserted with a parameterized insert statement by executemany.
+        """
+        return None
+
+    def explain_sql(self, select_sql: str, analyze: bool = False) -> Optional[str]:
+        """
+        The statement to get the plan of the query, None means the database could not explain queries.
+        """
+        return None
+
+    def table_version_sql(self, db: str, table: str) -> Optional[str]:
+        """
+        The query returning one row which changes whenever the data of the table changes, and no row if the table is not a physical table.
+        None means the database does not provide a reliable version of tables.
+        """
+        return None
+
+    def drop_table_sql(self, table: str, cascade: bool = False) -> str:
+        """
+        :param cascade: drop the objects depending on the table as well, e.g. views reading the table, for databases supporting it
+        """
         raise NotImplementedError()
 
     def create_pt_meta_table_sql(self, db: str) -> str:
@@ -1,4 +1,4 @@
-from typing import Dict, Callable, List, Tuple
+from typing import Dict, Callable, List, Tuple, Optional
 
 from easy_sql.sql_processor.backend.sql_dialect import SqlDialect, SqlExpr
 from ..base import Partition
@@ -41,6 +41,9 @@ class BqSqlDialect(SqlDialect):
     def get_tables_sql(self, db) -> str:
         return f'select table_name from {db}.INFORMATION_SCHEMA.TABLES'
 
+    def get_views_sql(self, db) -> str:
+        return f"select table_name from {db}.INFORMATION_SCHEMA.TABLES where table_type='VIEW'"
+
     def create_table_sql(self, table_name: str, select_sql: str) -> str:
         full_table_name = table_name if self.contains_db(table_name) else f'{self.db}.{table_name}'
         return f'create table if not exists {full_table_name} as {select_sql}'
@@ -117,7 +120,11 @@ class BqSqlDialect(SqlDialect):
         insert_pt_metadata = self.insert_pt_metadata_sql(table_name, partitions)
         return self.transaction(f'{insert_date_sql}\n{delete_pt_metadata_if_exist}\n{insert_pt_metadata}')
 
-    def drop_table_sql(self, table: str):
+    def table_version_sql(self, db: str, table: str) -> Optional[str]:
+        # type 1 means a physical table, views are excluded
+        return f"select last_modified_time, row_count, size_bytes from {db}.__TABLES__ where table_id = '{table}' and type = 1"
+
+    def drop_table_sql(self, table: str, cascade: bool = False):
         if not self.contains_db(table):
             raise SqlProcessorAssertionError("BigQuery table must be qualified with a dataset.")
         db, pure_table_name = tuple(table.split('.'))
@@ -1,4 +1,4 @@
-from typing import Dict, Callable, List, Tuple
+from typing import Dict, Callable, List, Tuple, Optional
 
 from easy_sql.sql_processor.backend.sql_dialect import SqlDialect, SqlExpr
 from ..base import Partition
@@ -50,6 +50,9 @@ class ChSqlDialect(SqlDialect):
     def get_tables_sql(self, db: str):
         return f'show tables in {db}'
 
+    def get_views_sql(self, db: str):
+        return f"select name from system.tables where database='{db}' and engine='View'"
+
     def create_table_sql(self, table_name: str, select_sql: str):
         return f'create table {table_name} engine=MergeTree order by tuple() as {select_sql}'
 
@@ -116,7 +119,22 @@ class ChSqlDialect(SqlDialect):
             return [insert_date_sql, drop_pt_metadata_if_exist, insert_pt_metadata]
         return [insert_date_sql]
 
-    def drop_table_sql(self, table: str) -> List[str]:
+    def bulk_insert_sql(self, table_name: str, col_names: List[str]) -> Optional[str]:
+        # the native driver sends the rows of an insert statement ending with `values` as a single block
+        return f'insert into {table_name} ({", ".join(col_names)}) values'
+
+    def explain_sql(self, select_sql: str, analyze: bool = False) -> Optional[str]:
+        # the estimated rows and marks to read are available without executing the query
+        return f'explain estimate {select_sql}' if analyze else f'explain {select_sql}'
+
+    def table_version_sql(self, db: str, table: str) -> Optional[str]:
+        parts_condition = f"database = '{db}' and table = '{table}' and active"
+        return f"select metadata_modification_time, " \
+               f"(select max(modification_time) from system.parts where {parts_condition}), " \
+               f"(select count() from system.parts where {parts_condition}) " \
+               f"from system.tables where database = '{db}' and name = '{table}' and engine like '%MergeTree'"
+
+    def drop_table_sql(self, table: str, cascade: bool = False) -> List[str]:
         drop_table_sql = f'drop table if exists {table}'
         db, pure_table_name = split_table_name(table)
         drop_pt_metadata = f"alter table {self.partitions_table_name} delete where db_name = '{db}' and table_name = '{pure_table_name}'"
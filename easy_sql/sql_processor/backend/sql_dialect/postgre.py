@@ -1,4 +1,4 @@
-from typing import Dict, Callable, List, Tuple, Union
+from typing import Dict, Callable, List, Tuple, Union, Optional
 
 from easy_sql.sql_processor.backend.sql_dialect import SqlDialect
 from ..base import Partition
@@ -54,13 +54,30 @@ class PgSqlDialect(SqlDialect):
     def drop_view_sql(self, table_name: str) -> str:
         return f'drop view {table_name} cascade'
 
+    def drop_views_sql(self, tables: List[str]) -> str:
+        # views already dropped by cascade are ignored
+        return f'drop view if exists {", ".join(tables)} cascade'
+
+    def drop_tables_sql(self, tables: List[str]) -> str:
+        return f'drop table if exists {", ".join(tables)} cascade'
+
     def get_tables_sql(self, db) -> str:
         return f"select tablename FROM pg_catalog.pg_tables where schemaname='{db}' union " \
                f"select viewname FROM pg_catalog.pg_views where schemaname='{db}'"
 
+    def get_views_sql(self, db) -> str:
+        return f"select table_name from information_schema.tables where table_schema='{db}' and table_type='VIEW'"
+
     def create_table_sql(self, table_name: str, select_sql: str) -> str:
         return f'create table {table_name} as {select_sql}'
 
+    def create_materialized_temp_table_sql(self, table_name: str, select_sql: str) -> str:
+        # no WAL is written for unlogged tables, the data is lost after a crash, which is fine for temp tables
+        return f'create unlogged table {table_name} as {select_sql}'
+
+    def analyze_table_sql(self, table_name: str) -> Optional[str]:
+        return f'analyze {table_name}'
+
     def support_native_partition(self) -> bool:
         return True
 
@@ -142,8 +159,15 @@ class PgSqlDialect(SqlDialect):
     def insert_data_sql(self, table_name: str, col_names_expr: str, select_sql: str, partitions: List[Partition]):
         return f'insert into {table_name}({col_names_expr}) {select_sql}'
 
-    def drop_table_sql(self, table: str):
-        return f'drop table if exists {table}'
+    def bulk_insert_sql(self, table_name: str, col_names: List[str]) -> Optional[str]:
+        return f'copy {table_name} ({", ".join(col_names)}) from stdin with (format csv)'
+
+    def explain_sql(self, select_sql: str, analyze: bool = False) -> Optional[str]:
+        # explain analyze executes the query, so it should only be used when asked for explicitly
+        return f'explain (analyze, buffers) {select_sql}' if analyze else f'explain {select_sql}'
+
+    def drop_table_sql(self, table: str, cascade: bool = False):
+        return f'drop table if exists {table}' + (' cascade' if cascade else '')
 
     def support_static_partition(self):
         return True
@@ -0,0 +1,30 @@
+from typing import Dict, Optional
+
+from easy_sql.sql_processor.backend import Backend
+
+
+class RecordingBackend(Backend):
+    """
+    Backend recording the tables materialized, loaded and dropped, with the versions of the tables given.
+    """
+
+    def __init__(self, versions: Dict[str, str] = None):
+        self.versions = versions or {}
+        self.materialized, self.loaded, self.dropped = [], [], []
+        # location of the materialized data to the name of the table materialized
+        self._locations: Dict[str, str] = {}
+
+    def table_version(self, table_name: str) -> Optional[str]:
+        return self.versions.get(table_name)
+
+    def materialize_table(self, table_name: str, data_dir: str, data_id: str) -> str:
+        self.materialized.append(table_name)
+        location = f'{data_dir}/tables/{data_id}'
+        self._locations[location] = table_name
+        return location
+
+    def load_materialized_table(self, location: str, table_name: str):
+        self.loaded.append((table_name, self._locations[location]))
+
+    def drop_materialized_table(self, location: str):
+        self.dropped.append(self._locations[location])
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+from typing import List, Dict, Any
+
+from .backend import Backend
+from .common import SqlProcessorException
+from .context import ProcessorContext
+from .step import Step, StepType
+from ..logger import logger
+
+__all__ = [
+    'StepCheckpoint'
+]
+
+
+def _check_restorable(value: Any, name: str):
+    try:
+        restorable = json.loads(json.dumps(value)) == value
+    except (TypeError, ValueError):
+        restorable = False
+    if not restorable:
+        raise SqlProcessorException(f'unable to checkpoint {name}, its value could not be restored from json: {value!r}')
+
+
+class StepCheckpoint:
+    """
+    Persist the state after every completed step, so that a failed run could be resumed from the first step not completed.
+
+    The state of a step includes the temp/cache/broadcast table created by it (persisted by `Backend.materialize_table`),
+    and the variables, list variables and templates after it.
+    Every step is identified by a fingerprint chained from the initial variables, templates and extra columns,
+    and the sql of the step and all the steps before it.
+    When resuming, the longest prefix of steps with the same fingerprints as the completed ones is skipped.
+
+    Note that changes in the data of the source tables are not detected,
+    and temp tables created outside temp/cache/broadcast steps (e.g. by functions) are not restored.
+    The state is persisted as json, so values not restored as they are from json (e.g. dates, or tuples which become lists) are refused.
+    """
+
+    MATERIALIZED_STEP_TYPES = [StepType.TEMP, StepType.CACHE, StepType.BROADCAST]
+    _META_VARS = ['__step__', '__context__']
+
+    def __init__(self, backend: Backend, checkpoint_dir: str):
+        self.backend = backend
+        self.checkpoint_dir = checkpoint_dir
+        self.manifest_path = os.path.join(checkpoint_dir, 'manifest.json')
+        self._fingerprints: Dict[str, str] = {}
+        self._entries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def _context_snapshot(self, context: ProcessorContext) -> Dict[str, Any]:
+        snapshot = {
+            'vars': {k: v for k, v in context.vars.items() if k not in self._META_VARS},
+            'list_vars': context.vars_context.list_vars,
+            'templates': context.templates_context.templates,
+        }
+        for kind, values in snapshot.items():
+            for name, value in values.items():
+                _check_restorable(value, f'{kind} {name}')
+        return snapshot
+
+    def _fingerprint(self, *parts: Any) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf8')).hexdigest()
+
+    def fingerprints(self, steps: List[Step], context: ProcessorContext) -> Dict[str, str]:
+        """
+        Returns step id to the fingerprint of the step. Must be called before running the steps, since the sql of the steps is changed when run.
+        """
+        for col in context.extra_cols:
+            _check_restorable(col.value, f'extra column {col.name}')
+        fingerprint = self._fingerprint(self._context_snapshot(context), [[col.name, col.value] for col in context.extra_cols])
+        fingerprints = {}
+        for step in steps:
+            fingerprint = self._fingerprint(fingerprint, step.target_config.step_config_str, step.select_sql)
+            fingerprints[step.id] = fingerprint
+        return fingerprints
+
+    def _load_entries(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.manifest_path):
+            return []
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)['steps']
+        except (ValueError, KeyError) as e:
+            logger.warning(f'ignored invalid checkpoint manifest {self.manifest_path}: {e}')
+            return []
+
+    def _save_entries(self):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        tmp_manifest_path = f'{self.manifest_path}.tmp'
+        with open(tmp_manifest_path, 'w') as f:
+            json.dump({'steps': self._entries}, f)
+        os.replace(tmp_manifest_path, self.manifest_path)
+
+    def resume(self, steps: List[Step], context: ProcessorContext) -> List[Step]:
+        """
+        Restore the state of the completed steps and returns them, the steps after them should be executed.
+        """
+        self._fingerprints = self.fingerprints(steps, context)
+        entries = dict([(entry['fingerprint'], entry) for entry in self._load_entries()])
+
+        completed_steps, completed_entries = [], []
+        for step in steps:
+            entry = entries.pop(self._fingerprints[step.id], None)
+            if entry is None:
+                break
+            completed_steps.append(step)
+            completed_entries.append(entry)
+
+        for stale_entry in entries.values():
+            self._drop_tables(stale_entry)
+
+        for entry in completed_entries:
+            for table_name, location in entry['tables'].items():
+                logger.info(f'restoring table {table_name} from checkpoint {location}')
+                self.backend.load_materialized_table(location, table_name)
+        if completed_entries:
+            snapshot = completed_entries[-1]['context']
+            context.set_vars(snapshot['vars'])
+            context.vars_context.list_vars = snapshot['list_vars']
+            context.templates_context.templates = snapshot['templates']
+            logger.info(f'resumed from checkpoint {self.checkpoint_dir}, skipped {len(completed_steps)} completed steps')
+
+        with self._lock:
+            self._entries = completed_entries
+            self._save_entries()
+        return completed_steps
+
+    def save(self, step: Step, context: ProcessorContext, table_created: bool = True):
+        """
+        Record the step as completed.
+        :param table_created: whether the table of the step is created, it is False when the step is skipped by its condition
+        """
+        fingerprint = self._fingerprints[step.id]
+        tables = {}
+        if table_created and step.target_config.step_type in self.MATERIALIZED_STEP_TYPES:
+            checkpoint_id = hashlib.sha1(f'{os.path.abspath(self.checkpoint_dir)}/{fingerprint}'.encode('utf8')).hexdigest()[:16]
+            tables[step.target_config.name] = self.backend.materialize_table(step.target_config.name, self.checkpoint_dir, checkpoint_id)
+        entry = {'step_id': step.id, 'fingerprint': fingerprint, 'tables': tables, 'context': self._context_snapshot(context)}
+        with self._lock:
+            self._entries.append(entry)
+            self._save_entries()
+
+    def _drop_tables(self, entry: Dict[str, Any]):
+        for location in entry['tables'].values():
+            try:
+                self.backend.drop_materialized_table(location)
+            except Exception as e:
+                logger.warning(f'failed to drop materialized table {location}: {e}')
+
+    def clear(self):
+        """
+        Drop all the persisted state, called when the run finished successfully.
+        """
+        with self._lock:
+            for entry in self._entries:
+                self._drop_tables(entry)
+            self._entries = []
+            if os.path.exists(self.manifest_path):
+                os.remove(self.manifest_path)
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+from easy_sql.sql_processor import SqlProcessorException
+from easy_sql.sql_processor.base_test import RecordingBackend
+from easy_sql.sql_processor.checkpoint import StepCheckpoint
+from easy_sql.sql_processor.context import ProcessorContext, VarsContext, TemplatesContext
+from easy_sql.sql_processor.step import StepFactory
+
+sql = '''
+-- target=temp.a
+select 1 as a
+-- target=variables
+select 2 as b
+-- target=temp.c
+select * from a
+-- target=output.db.d
+select * from c
+'''
+
+
+class StepCheckpointTest(unittest.TestCase):
+
+    def create_context(self):
+        return ProcessorContext(VarsContext({'a': '1'}), TemplatesContext())
+
+    def run_steps(self, checkpoint: StepCheckpoint, sql: str, steps_to_run: int, context: ProcessorContext = None):
+        steps = StepFactory(None, None).create_from_sql(sql)
+        context = context or self.create_context()
+        completed_steps = checkpoint.resume(steps, context)
+        for step in steps[len(completed_steps):steps_to_run]:
+            if step.target_config.step_type == 'variables':
+                context.add_vars({'b': '2'})
+            checkpoint.save(step, context)
+        return [step.id for step in completed_steps], context
+
+    def test_should_resume_from_first_step_not_completed(self):
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            backend = RecordingBackend()
+            self.assertEqual(self.run_steps(StepCheckpoint(backend, checkpoint_dir), sql, 3)[0], [])
+            self.assertEqual(backend.materialized, ['a', 'c'])
+
+            completed_step_ids, context = self.run_steps(StepCheckpoint(backend, checkpoint_dir), sql, 3)
+            self.assertEqual(completed_step_ids, ['step-1', 'step-2', 'step-3'])
+            self.assertEqual(backend.loaded, [('a', 'a'), ('c', 'c')])
+            self.assertEqual(context.vars, {'a': '1', 'b': '2'})
+
+            # the sql of step-3 changed, so step-3 and the following steps should be executed again
+            completed_step_ids, _ = self.run_steps(StepCheckpoint(backend, checkpoint_dir), sql.replace('select * from a', 'select 3 as c'), 4)
+            self.assertEqual(completed_step_ids, ['step-1', 'step-2'])
+            self.assertEqual(backend.dropped, ['c'])
+
+            checkpoint = StepCheckpoint(backend, checkpoint_dir)
+            self.assertEqual(self.run_steps(checkpoint, sql, 4, ProcessorContext(VarsContext({'a': '2'}), TemplatesContext()))[0], [])
+            checkpoint.clear()
+            self.assertFalse(os.path.exists(checkpoint.manifest_path))
+            self.assertEqual(backend.dropped, ['c', 'a', 'c', 'a', 'c'])
+
+    def test_should_refuse_values_not_restorable(self):
+        from datetime import date
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            checkpoint = StepCheckpoint(RecordingBackend(), checkpoint_dir)
+            with self.assertRaisesRegex(SqlProcessorException, 'unable to checkpoint vars d'):
+                self.run_steps(checkpoint, sql, 1, ProcessorContext(VarsContext({'d': date(2021, 1, 1)}), TemplatesContext()))
+
+            context = self.create_context()
+            self.run_steps(checkpoint, sql, 0, context)
+            context.vars_context.list_vars = {'l': (1, 2)}
+            with self.assertRaisesRegex(SqlProcessorException, 'unable to checkpoint list_vars l'):
+                checkpoint.save(StepFactory(None, None).create_from_sql(sql)[0], context)
+            self.assertEqual(checkpoint._load_entries(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
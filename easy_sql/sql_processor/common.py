@@ -1,13 +1,71 @@
-from typing import Any
+import re
+from typing import Any, Set, Dict
 
 from ..logger import logger
 
+_IDENTIFIER_PATTERN = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*(?:\.[a-zA-Z_][a-zA-Z0-9_]*)?')
+_TABLE_LIST_PATTERN = re.compile(r'\b(?:from|join)\s+((?:[\w.]+(?:\s+(?:as\s+)?(?!on\b|where\b|join\b|left\b|right\b|inner\b|full\b|cross\b|group\b|order\b|limit\b|union\b)\w+)?\s*,\s*)*[\w.]+)',
+                                 flags=re.IGNORECASE)
+_TABLE_ALIAS_PATTERN = re.compile(r'\s+(?:as\s+)?\w+$', flags=re.IGNORECASE)
+_CTE_NAME_PATTERN = re.compile(r'\b(\w+)\s+as\s*\(', flags=re.IGNORECASE)
+_SUBQUERY_START_PATTERN = re.compile(r'\(\s*(?:select|with)\b', flags=re.IGNORECASE)
+_SUBQUERY_IN_TABLE_LIST_PATTERN = re.compile(r'\s*(?:as\s+)?\w*\s*,', flags=re.IGNORECASE)
+
 
 def _exec_sql(spark: 'pyspark.sql.SparkSession', sql: str) -> 'pyspark.sql.DataFrame':
     logger.info(f'will exec sql: {sql}')
     return spark.sql(sql)
 
 
+def extract_identifiers(sql: str) -> Set[str]:
+    """
+    Extract all the (possibly db-qualified) identifiers from sql, lower-cased.
+    The result is a superset of the table names referenced by the sql, since column names, aliases and keywords are included as well.
+    """
+    return set([identifier.lower() for identifier in _IDENTIFIER_PATTERN.findall(sql.replace('`', ''))])
+
+
+def count_table_references(sql: str) -> Dict[str, int]:
+    """
+    Count the times every table is read by sql (in from or join clauses), lower-cased. Names of common table expressions are excluded.
+    """
+    sql = sql.replace('`', '')
+    cte_names = set([name.lower() for name in _CTE_NAME_PATTERN.findall(sql)])
+    counts = {}
+    for table_list in _TABLE_LIST_PATTERN.findall(sql):
+        for table in table_list.split(','):
+            table_name = _TABLE_ALIAS_PATTERN.sub('', table.strip()).lower()
+            if table_name not in cte_names:
+                counts[table_name] = counts.get(table_name, 0) + 1
+    return counts
+
+
+def extract_table_names(sql: str) -> Set[str]:
+    """
+    Extract the names of the tables read by sql, lower-cased. Names of common table expressions are excluded.
+    Tables listed after a subquery in a comma separated table list are not found, check it by `has_unparsed_table_list`.
+    """
+    return set(count_table_references(sql).keys())
+
+
+def has_unparsed_table_list(sql: str) -> bool:
+    """
+    Whether some tables read by sql may be missed by `extract_table_names`,
+    i.e. there is a subquery followed by a comma, e.g. `select * from (select * from a) t, b`.
+    Subqueries in the select list followed by a comma are reported as well, which is conservative.
+    """
+    for match in _SUBQUERY_START_PATTERN.finditer(sql):
+        depth, index = 0, match.start()
+        while index < len(sql):
+            depth += {'(': 1, ')': -1}.get(sql[index], 0)
+            if depth == 0:
+                break
+            index += 1
+        if _SUBQUERY_IN_TABLE_LIST_PATTERN.match(sql, index + 1):
+            return True
+    return False
+
+
 class Column:
 
     def __init__(self, name: str, value: Any):
@@ -1,5 +1,7 @@
 import copy
 import re
+import threading
+from collections import ChainMap
 from typing import Dict, Any, List
 
 from ..logger import logger
@@ -7,9 +9,18 @@ from . import FuncRunner
 from .common import SqlProcessorException, Column, VarsReplacer
 
 __all__ = [
-    'VarsContext', 'TemplatesContext', 'ProcessorContext'
+    'VarsContext', 'StepVarsContext', 'TemplatesContext', 'ProcessorContext'
 ]
 
+_COMMENT_START_PATTERN = re.compile(r'.*?([^a-zA-Z0-9_]-- ).*')
+_SINGLE_VAR_PATTERN = re.compile(r'^\${([^}]+)}$')
+_VAR_PATTERN = re.compile(r'\${([^}]+)}')
+_INNERMOST_VAR_PATTERN = re.compile(r'\${([^{}]+)}')
+_TMPL_WITH_ARG_PATTERN = re.compile(r'@{\s*(\w+)\(\s*?(\s*\w+\s*=\s*[^,)]+\s*,?\s*)*\)\s*}', flags=re.IGNORECASE)
+_TMPL_NO_ARG_PATTERN = re.compile(r'@{\s*(\w+)\s*}', flags=re.IGNORECASE)
+_TMPL_ARG_PATTERN = re.compile(r'\s*\w+\s*=\s*[^,)]+,?\s*', flags=re.IGNORECASE)
+_TMPL_LAST_ARG_END_PATTERN = re.compile(r'\)}$')
+
 
 class CommentSubstitutor:
     COMMENT_IDENTIFIABLE_NAME = '__COMMENT_SUBSTITUTED__'
@@ -31,7 +42,7 @@ class CommentSubstitutor:
 
             current_index = 0
             while True:
-                m = re.match(r'.*?([^a-zA-Z0-9_]-- ).*', line[current_index:])
+                m = _COMMENT_START_PATTERN.match(line[current_index:])
                 if m:
                     comment_start = m.start(1) + 1
                     left_of_comment = line[:current_index + comment_start]
@@ -114,12 +125,13 @@ class VarsContext(VarsReplacer):
         self.list_vars = list_vars or {}
         self.func_runner = None
         self.debug_log = debug_log
+        self._lock = threading.Lock()
 
     def init(self, func_runner: 'FuncRunner'):
         self.func_runner = func_runner
 
     def replace_variables(self, text: str, include_funcs: bool = True) -> str:
-        m = re.match(r'^\${([^}]+)}$', text.strip())
+        m = _SINGLE_VAR_PATTERN.match(text.strip())
         if m:
             return self.vars.get(m.group(1).strip(), self.vars.get(m.group(1).strip().lower()))
 
@@ -128,25 +140,23 @@ class VarsContext(VarsReplacer):
         text = comment_substitutor.substitute(text)
 
         variables = self.vars
-        for key in variables.keys():
-            text = re.sub(re.escape(f'${{{key}}}'), str(variables.get(key)), text, flags=re.IGNORECASE)
+        text = self._replace_direct_variables(text)
         self._log_replace_process(f'after direct variable replaced: {text}')
 
         if not include_funcs:
             return comment_substitutor.recover(text)
 
-        var_rex = re.compile(r'\${([^}]+)}')
         text_parts = []
         match = None
         while True:
             start = match.end() if match is not None else 0
-            match = var_rex.search(text, start)
+            match = _VAR_PATTERN.search(text, start)
             if match is None:
                 text_parts.append(text[start:])
                 break
 
             text_parts.append(text[start:match.start()])
-            var_name = var_rex.match(match.group()).groups()[0]
+            var_name = match.group(1)
             var_name_is_func = '(' in var_name
             self._log_replace_process(f'variable matched: var_name={var_name}, is_func={var_name_is_func}')
             if var_name_is_func:
@@ -166,13 +176,43 @@ class VarsContext(VarsReplacer):
         self._log_replace_process(f'after variable replaced: text={text}')
         return text
 
+    def _replace_direct_variables(self, text: str) -> str:
+        """
+        Replace all the `${var}` placeholders of known variables in one scan, names are matched case-insensitively.
+        Function calls and unknown variables are left as is.
+        """
+        if '${' not in text:
+            return text
+        lookup = {}
+        for key, value in self.vars.items():
+            lookup.setdefault(str(key).lower(), value)
+
+        nested_vars_found = False
+
+        def replace(match):
+            nonlocal nested_vars_found
+            name = match.group(1).lower()
+            if name not in lookup:
+                return match.group(0)
+            value = str(lookup[name])
+            nested_vars_found = nested_vars_found or '${' in value
+            return value
+
+        text = _INNERMOST_VAR_PATTERN.sub(replace, text)
+        if nested_vars_found:
+            # variable values could reference other variables, resolve them one more level
+            text = _INNERMOST_VAR_PATTERN.sub(replace, text)
+        return text
+
     def _log_replace_process(self, message: str):
         if self.debug_log:
             logger.debug(message)
 
     def add_vars(self, vars: Dict[str, str]):
         vars = {k.lower(): v for k, v in vars.items()}
-        self.vars.update(vars)
+        with self._lock:
+            # replace the dict instead of updating it, so that steps running concurrently never read a dict being changed
+            self.vars = dict(self.vars, **vars)
         if self.debug_log:
             logger.debug(f'vars: {self.vars}')
 
@@ -183,6 +223,43 @@ class VarsContext(VarsReplacer):
             logger.debug(f'list vars: {self.vars}')
 
 
+class StepVarsContext(VarsContext):
+    """
+    Variables seen by a step. The meta vars of the step (e.g. `__step__`) are kept in the step,
+    while the other variables are read from and added to the vars context shared by all the steps.
+    """
+
+    def __init__(self, shared: VarsContext, meta_vars: Dict[str, Any]):
+        self.shared = shared
+        self.meta_vars = {k.lower(): v for k, v in meta_vars.items()}
+        self.func_runner = shared.func_runner
+        self.debug_log = shared.debug_log
+
+    @property
+    def vars(self):
+        return ChainMap(self.meta_vars, self.shared.vars)
+
+    @vars.setter
+    def vars(self, vars: Dict[str, Any]):
+        self.shared.vars = vars
+
+    @property
+    def list_vars(self):
+        return self.shared.list_vars
+
+    @list_vars.setter
+    def list_vars(self, list_vars: Dict[str, List]):
+        self.shared.list_vars = list_vars
+
+    def add_vars(self, vars: Dict[str, str]):
+        vars = {k.lower(): v for k, v in vars.items()}
+        self.meta_vars.update({k: v for k, v in vars.items() if k in self.meta_vars})
+        self.shared.add_vars({k: v for k, v in vars.items() if k not in self.meta_vars})
+
+    def add_list_vars(self, vars: Dict[str, List]):
+        self.shared.add_list_vars(vars)
+
+
 class TemplatesContext:
 
     def __init__(self, debug_log: bool = False, templates: dict = None):
@@ -191,9 +268,7 @@ class TemplatesContext:
 
     def replace_templates(self, text: str):
         templates = self.templates
-        tmpl_with_arg_pattern = re.compile(r'@{\s*(\w+)\(\s*?(\s*\w+\s*=\s*[^,)]+\s*,?\s*)*\)\s*}', flags=re.IGNORECASE)
-        tmpl_no_arg_pattern = re.compile(r'@{\s*(\w+)\s*}', flags=re.IGNORECASE)
-        # pattern = re.compile(r'(%s)|(%s)' % (tmpl_with_arg_rex, tmpl_no_arg_rex), flags=re.IGNORECASE)
+        tmpl_with_arg_pattern, tmpl_no_arg_pattern = _TMPL_WITH_ARG_PATTERN, _TMPL_NO_ARG_PATTERN
         while tmpl_with_arg_pattern.search(text) or tmpl_no_arg_pattern.search(text):
             match_result = tmpl_with_arg_pattern.search(text) or tmpl_no_arg_pattern.search(text)
             template_define = match_result.group(0)
@@ -204,7 +279,7 @@ class TemplatesContext:
                 raise SqlProcessorException(f'no template for found `{template_name}`, existing are {templates}')
 
             template = templates.get(template_name)
-            values = re.compile(r'\s*\w+\s*=\s*[^,)]+,?\s*', flags=re.IGNORECASE).findall(template_define_normalized)
+            values = _TMPL_ARG_PATTERN.findall(template_define_normalized)
             if values:
                 index = 0
                 while index < len(values):
@@ -212,7 +287,7 @@ class TemplatesContext:
                     value_name = value_def[0].strip()
                     value = value_def[1].replace(',', '').strip()
                     # fix for the last template parameter
-                    if re.compile(r'\)}$').search(value):
+                    if _TMPL_LAST_ARG_END_PATTERN.search(value):
                         value = value[:-2].strip()
                     self._log_replace_process(
                         f'template param matched: value_name={value_name}, value: {value}, template_name: {template_name}, template: {template}')
@@ -262,3 +337,12 @@ class ProcessorContext:
 
     def add_templates(self, templates: Dict[str, str]):
         self.templates_context.add_templates(templates)
+
+    def for_step(self, step: 'Step') -> 'ProcessorContext':
+        """
+        Returns the context to run the step with, with meta vars `__step__` and `__context__` only visible to the step,
+        so that steps running concurrently do not see the meta vars of each other.
+        """
+        step_context = ProcessorContext(None, self.templates_context, self.extra_cols)
+        step_context.vars_context = StepVarsContext(self.vars_context, {'__step__': step, '__context__': step_context})
+        return step_context
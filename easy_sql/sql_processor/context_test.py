@@ -1,6 +1,6 @@
 import unittest
 
-from easy_sql.sql_processor.context import CommentSubstitutor
+from easy_sql.sql_processor.context import CommentSubstitutor, VarsContext, ProcessorContext, TemplatesContext
 
 
 class CommentSubstitutorTest(unittest.TestCase):
@@ -71,3 +71,32 @@ bbb -- ${a} in comment
 -- ${a} in comment
    aaa -- some comment
         ''')
+
+
+class VarsContextTest(unittest.TestCase):
+
+    def test_should_replace_variables_case_insensitively(self):
+        vars_context = VarsContext({'a': 1, 'B': 'bb', 'c': '${a}', 'in_list': "'x', 'y'"})
+        self.assertEqual(vars_context.replace_variables('select ${A}, ${b}, ${c} where x in (${in_list}) -- ${a}', include_funcs=False),
+                         "select 1, bb, 1 where x in ('x', 'y') -- ${a}")
+        self.assertEqual(vars_context.replace_variables('${unknown}, ${fn(${a})}, ${a}', include_funcs=False), '${unknown}, ${fn(1)}, 1')
+
+    def test_should_keep_backslash_in_variable_values(self):
+        vars_context = VarsContext({'a': '\\n\\1'})
+        self.assertEqual(vars_context.replace_variables("select '${a}'", include_funcs=False), "select '\\n\\1'")
+
+    def test_should_raise_for_unknown_variable(self):
+        from easy_sql.sql_processor.common import SqlProcessorException
+        with self.assertRaises(SqlProcessorException):
+            VarsContext({'a': 1}).replace_variables('select ${a}, ${b}')
+
+    def test_should_keep_meta_vars_in_step_context(self):
+        context = ProcessorContext(VarsContext({'a': 1}), TemplatesContext())
+        step1_context, step2_context = context.for_step('step1'), context.for_step('step2')
+        self.assertEqual(step1_context.replace_variables('${__step__}, ${a}'), 'step1, 1')
+        self.assertEqual(step2_context.replace_variables('${__step__}, ${a}'), 'step2, 1')
+        self.assertIs(step1_context.vars['__context__'], step1_context)
+
+        step1_context.add_vars({'B': 2})
+        self.assertEqual(step2_context.replace_variables('select ${b}'), 'select 2')
+        self.assertEqual(context.vars, {'a': 1, 'b': 2})
@@ -12,8 +12,16 @@ __all__ = [
 class FuncRunner:
     _instance = None
 
-    def __init__(self, funcs: Dict[str, Callable] = None):
+    def __init__(self, funcs: Dict[str, Callable] = None, partition_funcs=None):
         self.funcs: Dict[str, Callable] = funcs or {}
+        self.partition_funcs = partition_funcs
+
+    def invalidate_partition_values(self, table_name: str = None):
+        """
+        Invalidate the cached partition values of the table, or of all the tables if table_name is None.
+        """
+        if self.partition_funcs is not None:
+            self.partition_funcs.invalidate_partition_values(table_name)
 
     def register_funcs(self, funcs: Dict[str, Callable]):
         self.funcs.update(funcs)
@@ -35,18 +43,22 @@ class FuncRunner:
             'equal_ignore_case': lambda a, b: a.lower() == b.lower(),
         })
 
+        partition_funcs = None
         if isinstance(backend, (SparkBackend, )):
-            all_funcs.update(FuncRunner._get_spark_funcs(backend))
+            from easy_sql.sql_processor.funcs_spark import PartitionFuncs
+            partition_funcs = PartitionFuncs(backend)
+            all_funcs.update(FuncRunner._get_spark_funcs(backend, partition_funcs))
         elif isinstance(backend, (RdbBackend, )):
-            all_funcs.update(FuncRunner._get_rdb_funcs(backend))
+            from easy_sql.sql_processor.funcs_rdb import PartitionFuncs
+            partition_funcs = PartitionFuncs(backend)
+            all_funcs.update(FuncRunner._get_rdb_funcs(backend, partition_funcs))
 
-        FuncRunner._instance = FuncRunner(all_funcs)
+        FuncRunner._instance = FuncRunner(all_funcs, partition_funcs)
         return FuncRunner._instance
 
     @staticmethod
-    def _get_rdb_funcs(backend) -> Dict[str, Callable]:
-        from easy_sql.sql_processor.funcs_rdb import PartitionFuncs, ColumnFuncs, TableFuncs,ModelFuncs
-        partition_funcs = PartitionFuncs(backend)
+    def _get_rdb_funcs(backend, partition_funcs) -> Dict[str, Callable]:
+        from easy_sql.sql_processor.funcs_rdb import ColumnFuncs, TableFuncs,ModelFuncs
         col_funcs = ColumnFuncs(backend)
         table_funcs = TableFuncs(backend)
         model_funcs = ModelFuncs(backend)
@@ -73,11 +85,10 @@ class FuncRunner:
         }
 
     @staticmethod
-    def _get_spark_funcs(backend) -> Dict[str, Callable]:
-        from easy_sql.sql_processor.funcs_spark import ParallelismFuncs, PartitionFuncs, \
+    def _get_spark_funcs(backend, partition_funcs) -> Dict[str, Callable]:
+        from easy_sql.sql_processor.funcs_spark import ParallelismFuncs, \
             CacheFuncs, ColumnFuncs, TableFuncs, IOFuncs, ModelFuncs
         spark = backend.spark
-        partition_funcs = PartitionFuncs(backend)
         parallelism_funcs = ParallelismFuncs(spark)
         cache_funcs = CacheFuncs(spark)
         col_funcs = ColumnFuncs(backend)
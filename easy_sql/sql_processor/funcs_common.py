@@ -1,6 +1,8 @@
+import threading
 import traceback
+from bisect import bisect_left
 from datetime import datetime, timedelta
-from typing import List, Optional, Union
+from typing import List, Optional, Union, Dict
 from . import SqlProcessorException, Step
 from .backend import Backend
 from ..logger import logger
@@ -34,6 +36,7 @@ class ColumnFuncs:
 
 
 class TableFuncs:
+    NULL_CHECK_COLUMNS_PER_QUERY = 100
 
     def __init__(self, backend: Backend):
         self.backend = backend
@@ -48,11 +51,9 @@ class TableFuncs:
     def _check_not_null_columns_in_table(self, step: Step, table_name: str, not_null_columns: List[str],
                                          query: str = None, context: str = 'check_not_null_column_in_table') -> bool:
         null_counts = {}
-        for field in not_null_columns:
-            condition_sql = f'{field} is null'
-            sql = f'select count(1) from {table_name} where ' + (condition_sql if query is None else f'({condition_sql}) and ({query})')
-            null_count = self.backend.exec_sql(sql).collect()[0][0]
-            null_counts[field] = null_count
+        chunk_size = self.NULL_CHECK_COLUMNS_PER_QUERY
+        for i in range(0, len(not_null_columns), chunk_size):
+            null_counts.update(self._count_null_values(table_name, not_null_columns[i:i + chunk_size], query))
         if sum(null_counts.values()) != 0:
             null_count_msg = '\n'.join([f'{v} null rows({k})' for k, v in null_counts.items() if v != 0])
             msg = f"{context} {table_name} failed, found: \n{null_count_msg}"
@@ -62,27 +63,76 @@ class TableFuncs:
         else:
             return True
 
+    def _count_null_values(self, table_name: str, columns: List[str], query: str = None) -> Dict[str, int]:
+        # count null values of all the columns in one scan, sum of empty table will be null
+        null_count_exprs = [f'sum(case when {col} is null then 1 else 0 end) as null_count_{i}' for i, col in enumerate(columns)]
+        sql = f'select {", ".join(null_count_exprs)} from {table_name}' + ('' if query is None else f' where {query}')
+        row = self.backend.exec_sql(sql).collect()[0]
+        return {col: int(row[i] or 0) for i, col in enumerate(columns)}
+
+
+class PartitionValues:
+
+    def __init__(self, values: List[Union[str, int]]):
+        # keep the order returned by the backend, which decides the first and the last partition
+        self.values = list(values)
+        self.str_values = sorted([str(v) for v in values])
+
+    def first(self) -> Optional[Union[str, int]]:
+        return self.values[0] if self.values else None
+
+    def last(self) -> Optional[Union[str, int]]:
+        return self.values[-1] if self.values else None
+
+    def contains(self, value: str) -> bool:
+        index = bisect_left(self.str_values, value)
+        return index < len(self.str_values) and self.str_values[index] == value
+
 
 class PartitionFuncs:
 
     def __init__(self, backend: Backend):
         self.backend = backend
+        # partition values are cached during a run, and invalidated when the processor writes to the table
+        self._partition_values_cache: Dict[str, PartitionValues] = {}
+        self._partition_values_cache_lock = threading.Lock()
+
+    def invalidate_partition_values(self, table_name: str = None):
+        with self._partition_values_cache_lock:
+            if table_name is None:
+                self._partition_values_cache.clear()
+                return
+            pure_table_name = table_name.lower().split('.')[-1]
+            for cached_table_name in list(self._partition_values_cache.keys()):
+                # the same table may be referred with or without db name
+                if cached_table_name.split('.')[-1] == pure_table_name:
+                    del self._partition_values_cache[cached_table_name]
+
+    def _cached_partition_values(self, table_name: str) -> PartitionValues:
+        key = table_name.strip().lower()
+        with self._partition_values_cache_lock:
+            cached = self._partition_values_cache.get(key)
+        if cached is None:
+            cached = PartitionValues(self._get_partition_values(table_name))
+            with self._partition_values_cache_lock:
+                self._partition_values_cache[key] = cached
+        return cached
 
     def is_not_first_partition(self, table_name: str, partition_value: str) -> bool:
         return not self.is_first_partition(table_name, partition_value)
 
     def is_first_partition(self, table_name: str, partition_value: str) -> bool:
-        partition_values = self._get_partition_values(table_name)
-        return partition_value == str(partition_values[0]) if len(partition_values) > 0 else False
+        first_partition = self._cached_partition_values(table_name).first()
+        return partition_value == str(first_partition) if first_partition is not None else False
 
     def _get_partition_values(self, table_name) -> List[Union[str, int]]:
         raise NotImplementedError()
 
     def _get_partition_values_as_str(self, table_name) -> List[str]:
-        return [str(v) for v in self._get_partition_values(table_name)]
+        return [str(v) for v in self._cached_partition_values(table_name).values]
 
     def partition_exists(self, table_name: str, partition_value: str) -> bool:
-        return partition_value in self._get_partition_values_as_str(table_name)
+        return self._cached_partition_values(table_name).contains(partition_value)
 
     def ensure_partition_exists(self, step, *args) -> bool:
         from easy_sql.sql_processor import Step
@@ -130,7 +180,7 @@ class PartitionFuncs:
             check_ok = False
 
         if len(foreign_key_cols) > 0:
-            partition_values = self._get_partition_values(table_name)
+            partition_values = self._cached_partition_values(table_name).values
             if len(partition_values) > 0:  # this indicates first partition exists
                 partition_col, first_partition = self.get_partition_col(table_name), str(partition_values[0])
                 partition_value_to_use = partition_value if partition_value > first_partition else first_partition
@@ -177,26 +227,27 @@ class PartitionFuncs:
         return not self.partition_exists(table_name, partition_value)
 
     def previous_partition_exists(self, table_name: str, curr_partition_value_as_dt: str) -> bool:
-        partition_values = self._get_partition_values_as_str(table_name)
+        partition_values = self._cached_partition_values(table_name)
         partition_date_format = '%Y-%m-%d' if '-' in curr_partition_value_as_dt else '%Y%m%d'
         try:
             curr_partition_value_as_dt = datetime.strptime(curr_partition_value_as_dt, partition_date_format)
         except ValueError:
             raise SqlProcessorException(f'partition value must be date of format `%Y-%m-%d` or `%Y%m%d`, found {curr_partition_value_as_dt}')
         previous_partition_value = (curr_partition_value_as_dt - timedelta(days=1)).strftime(partition_date_format)
-        return previous_partition_value in partition_values
+        return partition_values.contains(previous_partition_value)
 
     def get_partition_or_first_partition(self, table_name: str, partition_value: str):
-        partition_values = self._get_partition_values_as_str(table_name)
-        if len(partition_values) == 0:
+        partition_values = self._cached_partition_values(table_name)
+        if len(partition_values.values) == 0:
             return partition_value
-        if partition_value in partition_values:
+        if partition_values.contains(partition_value):
             return partition_value
-        return partition_values[0] if partition_value < partition_values[0] else partition_value
+        first_partition = str(partition_values.first())
+        return first_partition if partition_value < first_partition else partition_value
 
     def get_first_partition_optional(self, table_name: str) -> Optional[str]:
-        partition_values = self._get_partition_values(table_name)
-        return str(partition_values[0]) if len(partition_values) > 0 else None
+        first_partition = self._cached_partition_values(table_name).first()
+        return str(first_partition) if first_partition is not None else None
 
     def get_first_partition(self, table_name: str) -> str:
         first_partition = self.get_first_partition_optional(table_name)
@@ -205,8 +256,7 @@ class PartitionFuncs:
         return first_partition
 
     def get_last_partition(self, table_name: str) -> str:
-        partition_values = self._get_partition_values(table_name)
-        last_partition = partition_values[-1] if len(partition_values) > 0 else None
+        last_partition = self._cached_partition_values(table_name).last()
         if not last_partition:
             raise Exception(f'no partition found for table {table_name}')
         return str(last_partition)
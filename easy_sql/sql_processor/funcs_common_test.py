@@ -0,0 +1,82 @@
+import sqlite3
+import unittest
+from types import SimpleNamespace
+
+from easy_sql.sql_processor.funcs_common import PartitionFuncs, TableFuncs
+
+
+class _CountingPartitionFuncs(PartitionFuncs):
+
+    def __init__(self, partitions):
+        super().__init__(None)
+        self.partitions = partitions
+        self.fetch_count = 0
+
+    def _get_partition_values(self, table_name):
+        self.fetch_count += 1
+        return self.partitions[table_name.split('.')[-1]]
+
+
+class PartitionFuncsTest(unittest.TestCase):
+
+    def test_should_cache_partition_values(self):
+        funcs = _CountingPartitionFuncs({'t': ['2021-01-01', '2021-01-02', '2021-01-03']})
+        self.assertTrue(funcs.is_first_partition('db.t', '2021-01-01'))
+        self.assertTrue(funcs.partition_exists('db.t', '2021-01-02'))
+        self.assertFalse(funcs.partition_exists('db.t', '2021-01-04'))
+        self.assertTrue(funcs.previous_partition_exists('db.t', '2021-01-03'))
+        self.assertFalse(funcs.previous_partition_exists('db.t', '20210101'))
+        self.assertEqual(funcs.get_last_partition('db.t'), '2021-01-03')
+        self.assertEqual(funcs.get_partition_or_first_partition('db.t', '2020-12-01'), '2021-01-01')
+        self.assertEqual(funcs.fetch_count, 1)
+
+    def test_should_keep_the_order_of_partition_values_from_backend(self):
+        funcs = _CountingPartitionFuncs({'t': ['20210102', None, 20210101]})
+        self.assertEqual(funcs.get_first_partition('t'), '20210102')
+        self.assertEqual(funcs.get_last_partition('t'), '20210101')
+        self.assertTrue(funcs.partition_exists('t', '20210101'))
+        self.assertFalse(funcs.partition_exists('t', '20210103'))
+
+    def test_should_invalidate_partition_values(self):
+        funcs = _CountingPartitionFuncs({'t': [1, 2], 't1': [3]})
+        self.assertEqual(funcs.get_first_partition('db.t'), '1')
+        self.assertEqual(funcs.get_first_partition('t1'), '3')
+
+        funcs.partitions['t'] = [0, 1, 2]
+        funcs.invalidate_partition_values('other_db.T')
+        self.assertEqual(funcs.get_first_partition('db.t'), '0')
+        self.assertEqual(funcs.get_first_partition('t1'), '3')
+        self.assertEqual(funcs.fetch_count, 3)
+
+        funcs.invalidate_partition_values()
+        self.assertTrue(funcs.partition_exists('t1', '3'))
+        self.assertEqual(funcs.fetch_count, 4)
+
+
+class TableFuncsTest(unittest.TestCase):
+
+    def test_should_check_null_values_of_all_columns_in_chunked_queries(self):
+        conn = sqlite3.connect(':memory:')
+        conn.execute('create table t (a int, b int, c int)')
+        conn.executemany('insert into t values (?, ?, ?)', [(1, None, None), (2, 2, None), (3, 3, 3)])
+        sqls = []
+
+        def exec_sql(sql):
+            sqls.append(sql)
+            cursor = conn.execute(sql)
+            return SimpleNamespace(collect=cursor.fetchall, field_names=lambda: [d[0] for d in cursor.description])
+
+        reports = []
+        step = SimpleNamespace(collect_report=lambda message: reports.append(message))
+        funcs = TableFuncs(SimpleNamespace(exec_sql=exec_sql))
+        funcs.NULL_CHECK_COLUMNS_PER_QUERY = 2
+
+        self.assertFalse(funcs.ensure_no_null_data_in_table(step, 't'))
+        self.assertEqual(len(sqls), 3)
+        self.assertEqual(reports, ['ensure_no_null_data_in_table t failed, found: \n1 null rows(b)\n2 null rows(c)'])
+        self.assertTrue(funcs.ensure_no_null_data_in_table(step, 't', 'a = 3'))
+        self.assertTrue(funcs.check_not_null_column_in_table(step, 't', 'b', 'a > 5'))
+
+
+if __name__ == '__main__':
+    unittest.main()
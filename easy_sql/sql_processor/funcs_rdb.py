@@ -204,9 +204,7 @@ class PartitionFuncs(PartitionFuncsBase):
         self.__check_backend()
         db, table = self.__parse_table_name(table_name)
         if isinstance(self.backend, RdbBackend):
-            native_partitions_sql, extract_partition_cols = self.backend.sql_dialect.native_partitions_sql(f'{db}.{table}')
-            pt_cols = extract_partition_cols(self.backend.exec_native_sql(native_partitions_sql))
-            return pt_cols
+            return self.backend.catalog.partition_cols(f'{db}.{table}')
         else:
             raise AssertionError('should not happen!')
 
@@ -1,10 +1,11 @@
 import json
 import os
-from typing import List, Dict, Union
+from typing import List, Union
 
 from pyspark.sql import SparkSession
 
 from .backend import SparkBackend
+from .backend.spark import SparkTable
 from .common import _exec_sql, SqlProcessorAssertionError
 from .funcs_common import ColumnFuncs, TableFuncs, PartitionFuncs as PartitionFuncsBase, AlertFunc
 
@@ -82,13 +83,18 @@ class IOFuncs:
 
     def write_json_local(self, table: str, output_file: str):
         from pyspark.sql import DataFrame
-        from pyspark.sql.types import Row
         data: DataFrame = _exec_sql(self.spark, f'select * from {table}')
-        data: List[Row] = data.collect()
-        data: List[Dict] = [row.asDict() for row in data]
         os.makedirs(os.path.dirname(output_file), exist_ok=True)
         with open(output_file, 'w') as f:
-            f.write(json.dumps(data, ensure_ascii=False, indent=4, sort_keys=False))
+            # write rows in batches, the content is the same as json.dumps(rows, indent=4)
+            written_count = 0
+            for rows in SparkTable(data).iter_batches():
+                for row in rows:
+                    row_json = json.dumps(row.as_dict(), ensure_ascii=False, indent=4, sort_keys=False)
+                    f.write(',\n' if written_count > 0 else '[\n')
+                    f.write('\n'.join(['    ' + line for line in row_json.split('\n')]))
+                    written_count += 1
+            f.write('\n]' if written_count > 0 else '[]')
 
     def update_json_local(self, context, vars: str, list_vars: str, json_attr: str, output_file: str):
         from easy_sql.sql_processor.context import ProcessorContext
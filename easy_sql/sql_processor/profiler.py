@@ -0,0 +1,125 @@
+import contextlib
+import json
+import threading
+import time
+from typing import List, Dict, Any, Optional, ContextManager
+
+from .backend import Backend, Table
+from .step import Step, StepType
+from ..logger import logger
+
+__all__ = [
+    'StepProfile', 'StepProfiler', 'profile_phase'
+]
+
+
+class StepProfile:
+
+    def __init__(self, step: Step):
+        self.step = step
+        # (phase name, start time in seconds, end time in seconds, thread id)
+        self.phases: List[tuple] = []
+        self.metrics: Dict[str, Any] = {}
+        self.plan: Optional[str] = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start_time, time.time(), threading.get_ident()))
+
+    def phase_durations(self) -> Dict[str, float]:
+        durations = {}
+        for name, start_time, end_time, _ in self.phases:
+            durations[name] = durations.get(name, 0) + end_time - start_time
+        return durations
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.step.id,
+            'type': self.step.target_config.step_type,
+            'name': self.step.target_config.name,
+            'line_no': self.step.target_config.line_no,
+            'phases': [{'name': name, 'start_time': start_time, 'duration': end_time - start_time}
+                       for name, start_time, end_time, _ in self.phases],
+            'total_duration': sum(self.phase_durations().values()),
+            'metrics': self.metrics,
+            'plan': self.plan,
+        }
+
+
+def profile_phase(profile: Optional[StepProfile], name: str) -> ContextManager:
+    return profile.phase(name) if profile is not None else contextlib.nullcontext()
+
+
+class StepProfiler:
+    """
+    Collect the time spent in every phase of the steps, together with the query plans and the metrics provided by the backend.
+
+    Phases of a step are: `condition` (evaluating the if condition), `substitute` (replacing templates and variables),
+    `read` (creating the table of the query by the backend), `explain` (retrieving the plan) and `write` (consuming the table).
+    Backends like spark and rdb create the table lazily: `read` only prepares the query and the query is executed in `write`.
+    For temp steps of these backends, `write` only registers a view (unless it is materialized),
+    and the query is executed in the `write` phase of the steps reading the view.
+
+    The rows written by the steps are not captured. The metrics are only the ones provided by the plan of the backend,
+    e.g. `rows` of the root node with EXPLAIN ANALYZE of postgres, which are the rows written for output steps.
+    With explain_analyze, the backend may execute the query again to collect the actual metrics,
+    so it should only be enabled when looking into the performance of the steps.
+    """
+
+    EXPLAINABLE_STEP_TYPES = [StepType.TEMP, StepType.CACHE, StepType.BROADCAST, StepType.OUTPUT, StepType.HIVE]
+
+    def __init__(self, backend: Backend, explain: bool = True, explain_analyze: bool = False):
+        self.backend = backend
+        self.explain = explain
+        self.explain_analyze = explain_analyze
+        self.profiles: Dict[str, StepProfile] = {}
+        self._lock = threading.Lock()
+
+    def start(self, step: Step) -> StepProfile:
+        profile = StepProfile(step)
+        with self._lock:
+            self.profiles[step.id] = profile
+        return profile
+
+    def collect_plan(self, profile: StepProfile, table: Optional[Table]):
+        if not self.explain or table is None or profile.step.target_config.step_type not in self.EXPLAINABLE_STEP_TYPES:
+            return
+        with profile.phase('explain'):
+            try:
+                query_plan = self.backend.explain(table, self.explain_analyze)
+            except Exception as e:
+                logger.warning(f'failed to explain the query of step {profile.step}: {e}')
+                return
+        if query_plan is not None:
+            profile.plan = query_plan.plan
+            profile.metrics.update(query_plan.metrics)
+
+    def as_dicts(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            profiles = list(self.profiles.values())
+        return [profile.as_dict() for profile in profiles]
+
+    def export_json(self, file_path: str):
+        with open(file_path, 'w') as f:
+            json.dump({'steps': self.as_dicts()}, f, indent=2, default=str)
+
+    def export_chrome_trace(self, file_path: str):
+        """
+        Export the phases as a trace file, which could be loaded in chrome://tracing or https://ui.perfetto.dev .
+        """
+        with self._lock:
+            profiles = list(self.profiles.values())
+        events = []
+        for profile in profiles:
+            for name, start_time, end_time, thread_id in profile.phases:
+                events.append({
+                    'name': f'{profile.step.id} {name}', 'cat': profile.step.target_config.step_type, 'ph': 'X',
+                    'ts': int(start_time * 1e6), 'dur': int((end_time - start_time) * 1e6), 'pid': 0, 'tid': thread_id,
+                    'args': {'step': str(profile.step), 'metrics': profile.metrics},
+                })
+        with open(file_path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
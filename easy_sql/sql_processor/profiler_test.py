@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from easy_sql.sql_processor.backend import QueryPlan
+from easy_sql.sql_processor.profiler import StepProfiler
+from easy_sql.sql_processor.step import StepFactory
+
+
+class StepProfilerTest(unittest.TestCase):
+
+    def test_should_profile_steps(self):
+        steps = StepFactory(None, None).create_from_sql('-- target=temp.a\nselect 1 as a\n-- target=log.a\nselect * from a')
+        backend = SimpleNamespace(explain=lambda table, analyze: QueryPlan(f'plan of {table}', {'rows': 1} if analyze else {}))
+        profiler = StepProfiler(backend, explain_analyze=True)
+        for step in steps:
+            profile = profiler.start(step)
+            with profile.phase('read'):
+                table = 'table ' + step.id
+            profiler.collect_plan(profile, table)
+
+        profiles = profiler.as_dicts()
+        self.assertEqual([[phase['name'] for phase in profile['phases']] for profile in profiles], [['read', 'explain'], ['read']])
+        self.assertEqual([(profile['plan'], profile['metrics']) for profile in profiles], [('plan of table step-1', {'rows': 1}), (None, {})])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            profiler.export_json(os.path.join(temp_dir, 'profile.json'))
+            profiler.export_chrome_trace(os.path.join(temp_dir, 'trace.json'))
+            with open(os.path.join(temp_dir, 'profile.json')) as f:
+                self.assertEqual([profile['id'] for profile in json.load(f)['steps']], ['step-1', 'step-2'])
+            with open(os.path.join(temp_dir, 'trace.json')) as f:
+                events = json.load(f)['traceEvents']
+            self.assertEqual([event['name'] for event in events], ['step-1 read', 'step-1 explain', 'step-2 read'])
+            self.assertTrue(all([event['ph'] == 'X' and event['dur'] >= 0 for event in events]))
+
+    def test_should_ignore_explain_failures(self):
+        steps = StepFactory(None, None).create_from_sql('-- target=temp.a\nselect 1 as a')
+
+        def explain(table, analyze):
+            raise Exception('not supported')
+
+        profiler = StepProfiler(SimpleNamespace(explain=explain))
+        profile = profiler.start(steps[0])
+        profiler.collect_plan(profile, 'table')
+        self.assertIsNone(profile.plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Set
+
+from .backend import Backend
+from .common import extract_table_names, has_unparsed_table_list
+from .step import Step, StepType
+from ..logger import logger
+
+__all__ = [
+    'StepResultCache'
+]
+
+
+class StepResultCache:
+    """
+    Persistent cache of the results of cache steps, shared by all the runs (of any ETL) using the same cache_dir.
+
+    The key of a cache step is computed from its sql (with templates and variables replaced) and the versions of the tables it reads
+    (decided by `Backend.table_version`). Temp tables created by previous steps of the run are resolved to their sql recursively.
+    If the version of any table could not be decided, the step is executed as usual and the result is not cached.
+    Sqls with tables that may not be found (see `has_unparsed_table_list`) or with non-deterministic functions (e.g. `current_date`)
+    are not cached either.
+    Results are persisted by `Backend.materialize_table`, and never expire: clean up cache_dir when it grows too large.
+    """
+
+    TEMP_STEP_TYPES = [StepType.TEMP, StepType.CACHE, StepType.BROADCAST]
+    _NON_DETERMINISTIC_PATTERN = re.compile(r'\b(?:current_date|current_time|current_timestamp|localtimestamp|sysdate|getdate|now|today'
+                                            r'|rand|random|randn|uuid|unix_timestamp|monotonically_increasing_id)\b', flags=re.IGNORECASE)
+
+    def __init__(self, backend: Backend, cache_dir: str):
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self._temp_table_sqls: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def register_temp_table(self, step: Step):
+        """
+        Record the sql of the temp table created by the step, must be called after the sql of the step is preprocessed.
+        """
+        if step.target_config.step_type in self.TEMP_STEP_TYPES and step.select_sql is not None:
+            with self._lock:
+                self._temp_table_sqls[step.target_config.name.lower()] = step.select_sql
+
+    def _table_key(self, table_name: str, resolving: Set[str]) -> Optional[str]:
+        with self._lock:
+            temp_table_sql = self._temp_table_sqls.get(table_name)
+        if temp_table_sql is not None and table_name not in resolving:
+            return self.key(temp_table_sql, resolving.union([table_name]))
+        try:
+            return self.backend.table_version(table_name)
+        except Exception as e:
+            logger.info(f'unable to decide the version of table {table_name}: {e}')
+            return None
+
+    def key(self, sql: str, resolving: Set[str] = None) -> Optional[str]:
+        """
+        Returns the key of the result of sql, or None if the result could not be cached.
+        """
+        resolving = resolving or set()
+        if has_unparsed_table_list(sql):
+            logger.info(f'unable to find all the tables read, will not cache the result of sql: {sql}')
+            return None
+        if self._NON_DETERMINISTIC_PATTERN.search(sql):
+            logger.info(f'sql is not deterministic, will not cache the result of sql: {sql}')
+            return None
+        table_keys = []
+        for table_name in sorted(extract_table_names(sql)):
+            table_key = self._table_key(table_name, resolving)
+            if table_key is None:
+                logger.info(f'version of table {table_name} is unknown, will not cache the result of sql: {sql}')
+                return None
+            table_keys.append([table_name, table_key])
+        content = json.dumps([type(self.backend).__name__, sql, table_keys])
+        return hashlib.sha256(content.encode('utf8')).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, 'entries', f'{key}.json')
+
+    def restore(self, step: Step) -> bool:
+        """
+        Create the table of the cache step from the cached result, returns False if no result is cached.
+        """
+        key = self.key(step.select_sql)
+        if key is None or not os.path.exists(self._entry_path(key)):
+            return False
+        with open(self._entry_path(key), 'r') as f:
+            entry = json.load(f)
+        try:
+            self.backend.load_materialized_table(entry['location'], step.target_config.name)
+        except Exception as e:
+            logger.warning(f'failed to load cached result {entry["location"]} of step {step}, will execute it again: {e}')
+            return False
+        logger.info(f'restored table {step.target_config.name} from cached result {entry["location"]}')
+        return True
+
+    def store(self, step: Step):
+        key = self.key(step.select_sql)
+        if key is None:
+            return
+        try:
+            location = self.backend.materialize_table(step.target_config.name, self.cache_dir, key)
+        except Exception as e:
+            logger.warning(f'failed to cache the result of step {step}: {e}')
+            return
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        # write to a temp file first, so that other runs never see a partial entry
+        tmp_entry_path = f'{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_entry_path, 'w') as f:
+            json.dump({'location': location, 'sql': step.select_sql, 'created_at': time.time()}, f)
+        os.replace(tmp_entry_path, entry_path)
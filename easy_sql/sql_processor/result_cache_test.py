@@ -0,0 +1,72 @@
+import tempfile
+import unittest
+
+from easy_sql.sql_processor.base_test import RecordingBackend
+from easy_sql.sql_processor.common import extract_table_names
+from easy_sql.sql_processor.result_cache import StepResultCache
+from easy_sql.sql_processor.step import StepFactory
+
+sql = '''
+-- target=temp.a
+select * from db.a where dt = '2021-01-01'
+-- target=cache.b
+select * from a join db.b on a.id = b.id
+'''
+
+
+class StepResultCacheTest(unittest.TestCase):
+
+    def run_steps(self, result_cache: StepResultCache):
+        steps = StepFactory(None, None).create_from_sql(sql)
+        result_cache.register_temp_table(steps[0])
+        result_cache.register_temp_table(steps[1])
+        if not result_cache.restore(steps[1]):
+            result_cache.store(steps[1])
+
+    def test_should_reuse_result_when_sql_and_data_not_changed(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            backend = RecordingBackend({'db.a': '1', 'db.b': '1'})
+            self.run_steps(StepResultCache(backend, cache_dir))
+            self.run_steps(StepResultCache(backend, cache_dir))
+            self.assertEqual((backend.materialized, backend.loaded), (['b'], [('b', 'b')]))
+
+            backend.versions['db.a'] = '2'
+            self.run_steps(StepResultCache(backend, cache_dir))
+            self.assertEqual((backend.materialized, backend.loaded), (['b', 'b'], [('b', 'b')]))
+
+            del backend.versions['db.b']
+            self.run_steps(StepResultCache(backend, cache_dir))
+            self.assertEqual((backend.materialized, backend.loaded), (['b', 'b'], [('b', 'b')]))
+
+    def test_should_resolve_temp_tables_in_key(self):
+        result_cache = StepResultCache(RecordingBackend({'db.a': '1', 'db.b': '1'}), '')
+        steps = StepFactory(None, None).create_from_sql(sql)
+        self.assertIsNone(result_cache.key(steps[1].select_sql))
+        result_cache.register_temp_table(steps[0])
+        key = result_cache.key(steps[1].select_sql)
+        self.assertIsNotNone(key)
+        steps[0].select_sql = "select * from db.a where dt = '2021-01-02'"
+        result_cache.register_temp_table(steps[0])
+        self.assertNotEqual(result_cache.key(steps[1].select_sql), key)
+
+    def test_should_not_cache_when_tables_read_may_be_missed(self):
+        result_cache = StepResultCache(RecordingBackend({'a': '1', 'db.b': '1'}), '')
+        self.assertIsNone(result_cache.key('select * from (select * from a) t, db.b'))
+        self.assertIsNone(result_cache.key('select * from (select * from a) as t , db.b'))
+        self.assertIsNotNone(result_cache.key('select * from (select * from a) t join db.b on t.id = b.id'))
+
+    def test_should_not_cache_non_deterministic_sql(self):
+        result_cache = StepResultCache(RecordingBackend({'a': '1'}), '')
+        for sql in ['select *, current_date() as dt from a', 'select * from a where dt = current_date', 'select now() as t from a',
+                    'select * from a order by rand() limit 1']:
+            self.assertIsNone(result_cache.key(sql), sql)
+        self.assertIsNotNone(result_cache.key('select random_id, nowhere from a'))
+
+    def test_should_extract_table_names(self):
+        self.assertEqual(extract_table_names('with x as (select * from db.a a1 join b as bb on a1.id = bb.id)\n'
+                                             'select * from x, db.c c, (select * from d) d1 left join `e` on d1.id = e.id'),
+                         {'db.a', 'b', 'db.c', 'd', 'e'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, Future
+from typing import List, Set, Dict, Optional, Tuple, Callable
+
+from .common import extract_identifiers
+from .context import ProcessorContext
+from .step import Step, StepType
+from ..logger import logger
+
+__all__ = [
+    'StepDependencyAnalyzer', 'StepScheduler'
+]
+
+
+class StepDependencyAnalyzer:
+    """
+    Find out which steps could be executed concurrently.
+
+    Steps that change the state of the processor (variables, templates, functions etc.) are barriers and are always executed alone.
+    For the other steps, the tables read and written by every step are collected to build the dependencies between them.
+    """
+
+    PARALLELIZABLE_STEP_TYPES = [StepType.TEMP, StepType.CACHE, StepType.BROADCAST, StepType.LOG, StepType.OUTPUT, StepType.HIVE]
+    _FUNC_CALL_PATTERN = re.compile(r'\${[^}]*\(')
+    _META_VAR_PATTERN = re.compile(r'__step__|__context__', flags=re.IGNORECASE)
+
+    def is_parallelizable(self, step: Step) -> bool:
+        config = step.target_config
+        if config.step_type not in StepDependencyAnalyzer.PARALLELIZABLE_STEP_TYPES:
+            return False
+        if config.has_condition() or config.is_target_name_a_func():
+            return False
+        select_sql = step.select_sql or ''
+        return not self._FUNC_CALL_PATTERN.search(select_sql) and not self._META_VAR_PATTERN.search(select_sql)
+
+    def writes(self, step: Step) -> Set[str]:
+        if step.target_config.step_type == StepType.LOG:
+            return set()
+        return {step.target_config.name.lower()}
+
+    def reads(self, step: Step, context: ProcessorContext) -> Optional[Set[str]]:
+        """
+        Returns all the identifiers referenced by the step, or None if they could not be resolved before running the step.
+        """
+        try:
+            sql = context.replace_templates(step.select_sql or '')
+            sql = context.vars_context.replace_variables(sql, include_funcs=False)
+        except Exception as e:
+            logger.info(f'unable to resolve tables referenced by step {step}, will treat it as a barrier: {e}')
+            return None
+        if '${' in sql:
+            return None
+        identifiers = extract_identifiers(sql)
+        return identifiers.union([identifier[identifier.index('.') + 1:] for identifier in identifiers if '.' in identifier])
+
+    def dependencies(self, steps: List[Step], context: ProcessorContext) -> Optional[Dict[str, Set[str]]]:
+        """
+        Returns step id to the ids of the steps it depends on, or None if the steps should be executed in sequence.
+        A step depends on a previous one if it reads what the previous step writes, or writes what the previous step reads or writes.
+        """
+        resources: List[Tuple[Step, Set[str], Set[str]]] = []
+        for step in steps:
+            reads = self.reads(step, context)
+            if reads is None:
+                return None
+            resources.append((step, reads, self.writes(step)))
+
+        dependencies = {}
+        for index, (step, reads, writes) in enumerate(resources):
+            dependencies[step.id] = set([prev_step.id for prev_step, prev_reads, prev_writes in resources[:index]
+                                         if reads.intersection(prev_writes) or writes.intersection(prev_reads.union(prev_writes))])
+        return dependencies
+
+
+class StepScheduler:
+    """
+    Run steps on a thread pool, respecting the dependencies between them.
+    Consecutive parallelizable steps are grouped and executed concurrently, while barrier steps are executed alone in sequence.
+    """
+
+    def __init__(self, run_step: Callable[[Step], None], context: ProcessorContext, parallelism: int,
+                 analyzer: StepDependencyAnalyzer = None):
+        self.run_step = run_step
+        self.context = context
+        self.parallelism = parallelism
+        self.analyzer = analyzer or StepDependencyAnalyzer()
+
+    def run(self, steps: List[Step]):
+        index = 0
+        while index < len(steps):
+            group = []
+            while index < len(steps) and self.analyzer.is_parallelizable(steps[index]):
+                group.append(steps[index])
+                index += 1
+            if group:
+                self._run_group(group)
+            if index < len(steps):
+                self.run_step(steps[index])
+                index += 1
+
+    def _run_group(self, steps: List[Step]):
+        dependencies = self.analyzer.dependencies(steps, self.context) if len(steps) > 1 else None
+        if dependencies is None:
+            for step in steps:
+                self.run_step(step)
+            return
+
+        logger.info(f'will run steps concurrently with dependencies: {dependencies}')
+        pending_steps = list(steps)
+        finished_step_ids: Set[str] = set()
+        running: Dict[Future, Step] = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix='step') as executor:
+            while pending_steps or running:
+                if error is None:
+                    for step in [step for step in pending_steps if dependencies[step.id].issubset(finished_step_ids)]:
+                        pending_steps.remove(step)
+                        running[executor.submit(self.run_step, step)] = step
+                if not running:
+                    break
+                done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                    else:
+                        finished_step_ids.add(step.id)
+        if error is not None:
+            raise error
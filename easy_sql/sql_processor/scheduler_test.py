@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+
+from easy_sql.sql_processor.context import ProcessorContext, VarsContext, TemplatesContext
+from easy_sql.sql_processor.scheduler import StepDependencyAnalyzer, StepScheduler
+from easy_sql.sql_processor.step import StepFactory
+
+sql = '''
+-- target=variables
+select 1 as a
+-- target=template.tmpl
+select * from db.source_c
+-- target=temp.table_a
+select * from db.source_a where a = ${a}
+-- target=temp.table_b
+select * from db.source_b
+-- target=temp.table_c
+@{tmpl}
+-- target=temp.table_ab
+select * from table_a join table_b on table_a.id = table_b.id
+-- target=output.db.source_c
+select * from table_ab
+-- target=check.some_check
+select 1 as actual, 1 as expected
+-- target=temp.table_d
+select * from table_c
+'''
+
+
+class StepSchedulerTest(unittest.TestCase):
+
+    def create_context(self):
+        return ProcessorContext(VarsContext({'a': '1'}), TemplatesContext(templates={'tmpl': 'select * from db.source_c'}))
+
+    def test_should_resolve_dependencies(self):
+        steps = StepFactory(None, None).create_from_sql(sql)
+        analyzer = StepDependencyAnalyzer()
+        self.assertEqual([analyzer.is_parallelizable(step) for step in steps],
+                         [False, False, True, True, True, True, True, False, True])
+        self.assertEqual(analyzer.dependencies(steps[2:7], self.create_context()), {
+            'step-3': set(), 'step-4': set(), 'step-5': set(),
+            'step-6': {'step-3', 'step-4'},
+            # output.db.source_c overwrites the table read by step-5
+            'step-7': {'step-5', 'step-6'},
+        })
+
+    def test_should_run_independent_steps_concurrently(self):
+        steps = StepFactory(None, None).create_from_sql(sql)
+        finished, running, max_running = [], set(), [0]
+        lock = threading.Lock()
+
+        def run_step(step):
+            with lock:
+                running.add(step.id)
+                max_running[0] = max(max_running[0], len(running))
+            time.sleep(0.1)
+            with lock:
+                running.remove(step.id)
+                finished.append(step.id)
+
+        StepScheduler(run_step, self.create_context(), 4).run(steps)
+        self.assertEqual(max_running[0], 3)
+        self.assertEqual(finished[:2], ['step-1', 'step-2'])
+        self.assertEqual(set(finished[2:5]), {'step-3', 'step-4', 'step-5'})
+        self.assertEqual(finished[5:], ['step-6', 'step-7', 'step-8', 'step-9'])
+
+    def test_should_stop_scheduling_when_step_failed(self):
+        steps = StepFactory(None, None).create_from_sql(sql)
+        finished = []
+
+        def run_step(step):
+            if step.id == 'step-3':
+                raise Exception('failed')
+            finished.append(step.id)
+
+        with self.assertRaisesRegex(Exception, 'failed'):
+            StepScheduler(run_step, self.create_context(), 4).run(steps)
+        self.assertNotIn('step-6', finished)
+        self.assertNotIn('step-8', finished)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,15 @@
-from typing import List, Any, Dict, Callable, Union
+from typing import List, Any, Dict, Callable, Union, Optional
 
-from .backend import Backend, SparkBackend
+from .backend import Backend, SparkBackend, Table
 from .common import Column
 from .context import ProcessorContext, VarsContext, TemplatesContext
+from .checkpoint import StepCheckpoint
 from .funcs import FuncRunner
+from .profiler import StepProfiler, profile_phase
 from .report import SqlProcessorReporter, StepStatus
-from .step import Step, StepFactory
+from .result_cache import StepResultCache
+from .scheduler import StepScheduler
+from .step import Step, StepFactory, StepType
 from ..logger import logger
 
 
@@ -23,7 +27,8 @@ class SqlProcessor:
 
     def __init__(self, backend: Union['SparkSession', Backend], sql: str, extra_cols: List[Column] = None, variables: dict = None,
                  report_hdfs_path: str = None, report_task_id: str = None, report_es_url: str = None, report_es_index_prefix: str = None,
-                 scala_udf_initializer: str = None, templates: dict = None, includes: Dict[str, str] = None):
+                 scala_udf_initializer: str = None, templates: dict = None, includes: Dict[str, str] = None,
+                 parse_cache_dir: str = None):
         backend = backend if isinstance(backend, (Backend, )) else SparkBackend(spark=backend)
         self.backend = backend
         self.sql = sql
@@ -35,11 +40,14 @@ class SqlProcessor:
         self.func_runner = FuncRunner.create(self.backend)
         vars_context.init(self.func_runner)
         self.context = ProcessorContext(vars_context, TemplatesContext(debug_log=log_var_tmpl_replace, templates=templates), extra_cols=extra_cols)
-        self.step_factory = StepFactory(self.reporter, self.func_runner)
+        self.step_factory = StepFactory(self.reporter, self.func_runner, parse_cache_dir=parse_cache_dir)
 
         self.step_list = self.step_factory.create_from_sql(self.sql, includes)
         self.reporter.init(self.step_list)
         self.backend.init_udfs(scala_udf_initializer=scala_udf_initializer)
+        self.profiler: Optional[StepProfiler] = None
+        self.checkpoint: Optional[StepCheckpoint] = None
+        self.result_cache: Optional[StepResultCache] = None
 
     @property
     def variables(self) -> [str, Any]:
@@ -80,17 +88,54 @@ class SqlProcessor:
     def add_vars(self, vars: Dict[str, Any]):
         self.context.add_vars(vars)
 
+    def enable_profiling(self, explain: bool = True, explain_analyze: bool = False) -> StepProfiler:
+        """
+        Profile the steps executed afterwards, the returned profiler could be used to export the profiles when the run finished.
+        :param explain: collect the plans of the queries
+        :param explain_analyze: collect the actual metrics of the queries if the backend supports it, the queries may be executed twice
+        """
+        self.profiler = StepProfiler(self.backend, explain=explain, explain_analyze=explain_analyze)
+        return self.profiler
+
+    def enable_checkpoint(self, checkpoint_dir: str) -> StepCheckpoint:
+        """
+        Persist the state after every completed step in checkpoint_dir, and resume from the first step not completed in the following runs.
+        The checkpoint is dropped when a run finished successfully.
+        """
+        self.checkpoint = StepCheckpoint(self.backend, checkpoint_dir)
+        return self.checkpoint
+
+    def enable_result_cache(self, cache_dir: str) -> StepResultCache:
+        """
+        Reuse the results of cache steps computed by previous runs with the same cache_dir, when the sql and the data read are not changed.
+        """
+        self.result_cache = StepResultCache(self.backend, cache_dir)
+        return self.result_cache
+
     def run_step(self, step: Step, dry_run: bool):
+        profile = self.profiler.start(step) if self.profiler is not None else None
+        # add meta vars to support step information retrieving in functions
+        context = self.context.for_step(step)
         try:
-            # add meta vars to support step information retrieving in functions
-            self.context.add_vars({'__step__': step})
-            self.context.add_vars({'__context__': self.context})
-            if not step.should_run(self.context):
+            with profile_phase(profile, 'condition'):
+                should_run = step.should_run(context)
+            if not should_run:
                 self.reporter.collect_report(step, status=StepStatus.SKIPPED)
+                if self.checkpoint is not None:
+                    self.checkpoint.save(step, context, table_created=False)
                 return
             self.reporter.collect_report(step, status=StepStatus.RUNNING)
-            df = step.read(self.backend, self.context)
-            step.write(self.backend, df, self.context, dry_run)
+            with self.backend.progress_scope(lambda message: self.reporter.collect_report(step, message=message)):
+                df = step.read(self.backend, context, profile)
+                if profile is not None:
+                    self.profiler.collect_plan(profile, df)
+                try:
+                    with profile_phase(profile, 'write'):
+                        self._write_step(step, df, context, dry_run)
+                finally:
+                    self._invalidate_partition_values(step)
+            if self.checkpoint is not None:
+                self.checkpoint.save(step, context, table_created=df is not None)
             self.reporter.collect_report(step, status=StepStatus.SUCCEEDED)
         except Exception as e:
             import traceback
@@ -98,13 +143,54 @@ class SqlProcessor:
             if '__exception_handler__' in self.variables and str(self.variables['__exception_handler__']).upper() != 'NULL':
                 func_name: str = self.variables['__exception_handler__']
                 func_name = func_name.replace('{', '${')
-                self.func_runner.run_func(func_name, self.context.vars_context)(e)
+                self.func_runner.run_func(func_name, context.vars_context)(e)
             else:
                 raise e
 
-    def run(self, dry_run: bool = False):
+    def _write_step(self, step: Step, df: Optional[Table], context: ProcessorContext, dry_run: bool):
+        if self.result_cache is None:
+            step.write(self.backend, df, context, dry_run)
+            return
+        self.result_cache.register_temp_table(step)
+        is_cache_step = step.target_config.step_type == StepType.CACHE and df is not None
+        if is_cache_step and self.result_cache.restore(step):
+            step.collect_report(message='restored from cached result')
+            return
+        step.write(self.backend, df, context, dry_run)
+        if is_cache_step:
+            self.result_cache.store(step)
+
+    def _invalidate_partition_values(self, step: Step):
+        step_type = step.target_config.step_type
+        if step_type in [StepType.OUTPUT, StepType.HIVE]:
+            self.func_runner.invalidate_partition_values(step.target_config.name)
+        elif step_type in [StepType.FUNC, StepType.ACTION]:
+            # functions may write to any table
+            self.func_runner.invalidate_partition_values()
+
+    def run(self, dry_run: bool = False, parallelism: int = 1):
+        """
+        :param parallelism: when greater than 1, independent steps will be executed concurrently with at most `parallelism` threads.
+        """
+        # partition values are only cached within a run
+        self.func_runner.invalidate_partition_values()
         try:
-            for step in self.step_list:
-                self.run_step(step, dry_run)
+            if parallelism > 1 and not self.backend.support_concurrent_execution():
+                logger.warn(f'backend of type {type(self.backend)} does not support concurrent execution, will run steps in sequence')
+                parallelism = 1
+            with self.backend.catalog_cache_scope():
+                steps = self.step_list
+                if self.checkpoint is not None:
+                    completed_steps = self.checkpoint.resume(self.step_list, self.context)
+                    for step in completed_steps:
+                        self.reporter.collect_report(step, status=StepStatus.SKIPPED, message='completed in a previous run')
+                    steps = self.step_list[len(completed_steps):]
+                if parallelism > 1:
+                    StepScheduler(lambda step: self.run_step(step, dry_run), self.context, parallelism).run(steps)
+                else:
+                    for step in steps:
+                        self.run_step(step, dry_run)
+            if self.checkpoint is not None:
+                self.checkpoint.clear()
         finally:
             self.reporter.print_report(True)
@@ -1,11 +1,17 @@
+import hashlib
+import importlib
+import json
+import os
 import re
+import threading
 import uuid
+from collections import OrderedDict
 from os import path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 from ..logger import logger
-from .backend import Backend, Table as BackendTable, TableMeta as Table, Partition, SaveMode
-from .common import SqlProcessorException
+from .backend import Backend, Table as BackendTable, TableMeta as Table, Partition, SaveMode, SchemaRow
+from .common import SqlProcessorException, count_table_references
 from .context import ProcessorContext
 from .funcs import FuncRunner
 
@@ -106,6 +112,8 @@ class Step:
         self.debug_var_tmpl_replace = debug_var_tmpl_replace
         self.reporter_collector = reporter_collector
         self.func_runner = func_runner
+        # the following steps which may read the table created by the step, before the table is replaced
+        self.following_steps: List['Step'] = []
 
     def __str__(self):
         return str(self.target_config).replace('StepConfig(', 'Step(', 1)
@@ -121,19 +129,23 @@ class Step:
             return True
         return self.func_runner.run_func(self.target_config.condition, context.vars_context)
 
-    def read(self, backend: Backend, context: ProcessorContext) -> Optional[BackendTable]:
+    def read(self, backend: Backend, context: ProcessorContext, profile: 'StepProfile' = None) -> Optional[BackendTable]:
+        from .profiler import profile_phase
         if self.target_config.step_type in [StepType.TEMPLATE] or (self.target_config.step_type == StepType.CHECK and self._should_skip_check(context.vars_context.vars)):
             return backend.create_empty_table()
         if self.target_config.is_target_name_a_func():
             if self.select_sql:
-                self.preprocess_select_sql(context)
+                with profile_phase(profile, 'substitute'):
+                    self.preprocess_select_sql(context)
             return backend.create_empty_table()
-        self.preprocess_select_sql(context)
-        if self.target_config.step_type == StepType.ACTION:
-            backend.exec_native_sql(self.select_sql)
-            return None
-        else:
-            return backend.exec_sql(self.select_sql)
+        with profile_phase(profile, 'substitute'):
+            self.preprocess_select_sql(context)
+        with profile_phase(profile, 'read'):
+            if self.target_config.step_type == StepType.ACTION:
+                backend.exec_native_sql(self.select_sql)
+                return None
+            else:
+                return backend.exec_sql(self.select_sql)
 
     def preprocess_select_sql(self, context):
         self.select_sql = context.replace_templates(self.select_sql)
@@ -146,9 +158,12 @@ class Step:
             return
 
         if StepType.VARIABLES == self.target_config.step_type:
-            if not table.is_empty():
-                field_names = table.field_names()
-                row = table.first()
+            # fetch at most one row, the row tells whether the table is empty and carries the field names as well,
+            # so the query (which is executed again by field_names of some backends) is executed only once
+            rows = table.limit(1).collect()
+            if rows:
+                row = rows[0]
+                field_names = row.schema.names
                 for field_name in field_names:
                     index = field_names.index(field_name)
                     field_value = "null"
@@ -158,18 +173,17 @@ class Step:
 
         if StepType.LIST_VARIABLES == self.target_config.step_type:
             field_names = table.field_names()
-            rows = table.collect()
-            list_vars = {}
-            for field_name in field_names:
-                index = field_names.index(field_name)
-                list_vars[field_name] = [row[index] for row in rows]
+            list_vars = dict([(field_name, []) for field_name in field_names])
+            for columns in table.iter_column_batches():
+                for field_name, column in zip(field_names, columns):
+                    list_vars[field_name].extend(column)
             context.add_list_vars(list_vars)
 
         if StepType.TEMPLATE == self.target_config.step_type:
             context.add_templates({self.target_config.name: self.select_sql})
 
         elif StepType.TEMP == self.target_config.step_type:
-            backend.create_temp_table(table, self.target_config.name)
+            backend.create_temp_table(table, self.target_config.name, materialize=self._should_materialize(context))
 
         elif StepType.CACHE == self.target_config.step_type:
             if '__no_cache__' in variables and variables['__no_cache__'] in ['TRUE', True, 1, 'True', 'true']:
@@ -196,6 +210,28 @@ class Step:
         elif self.target_config.step_type in [StepType.HIVE, StepType.OUTPUT]:
             self._write_for_output_step(backend, table, context, dry_run)
 
+    def _should_materialize(self, context: ProcessorContext) -> bool:
+        materialize = str(context.vars.get('__materialize__', 'false')).lower()
+        if materialize == 'auto':
+            # a view read more than once means the query is executed more than once
+            return self.reference_count(context) > 1
+        return materialize in ['true', '1']
+
+    def reference_count(self, context: ProcessorContext) -> int:
+        """
+        Times the table created by the step is read by the following steps, with the templates and variables known at the time resolved.
+        """
+        name = self.target_config.name.lower()
+        count = 0
+        for step in self.following_steps:
+            sql = step.select_sql or ''
+            try:
+                sql = context.vars_context.replace_variables(context.replace_templates(sql), include_funcs=False)
+            except Exception as e:
+                logger.info(f'unable to resolve sql of step {step}, will count the references in the original sql: {e}')
+            count += count_table_references(sql).get(name, 0)
+        return count
+
     def _should_skip_check(self, variables):
         return '__no_check__' in variables and variables['__no_check__'] in ['TRUE', True, 1, 'True', 'true']
 
@@ -218,6 +254,7 @@ class Step:
         target_table_name = f'{self.target_config.name}'
 
         static_partition_name, static_partition_value, create_output_table, save_mode = None, None, False, SaveMode.overwrite
+        staged_write = False
         for name, value in variables.items():
             if '__partition__' in name:
                 static_partition_name = name[len('__partition__'):]
@@ -229,6 +266,8 @@ class Step:
                 save_mode = SaveMode[value.lower()]
             if name.lower() in ['__create_hive_table__', '__create_output_table__', ]:
                 create_output_table = value in [True, 'true', 'TRUE', 'True', 1, '1']
+            if name.lower() == '__staged_write__':
+                staged_write = value in [True, 'true', 'TRUE', 'True', 1, '1']
 
         if static_partition_name is not None:
             if static_partition_value is None or str(static_partition_value).strip() == '':
@@ -258,9 +297,12 @@ class Step:
             self.collect_report(message=message)
             raise Exception(message)
 
-        backend.save_table(source_table, target_table, save_mode, create_target_table=create_output_table)
+        if staged_write:
+            self.collect_report(message=f'save with staged write')
+        backend.save_table(source_table, target_table, save_mode, create_target_table=create_output_table, staged=staged_write)
 
     def _write_for_log_step(self, df: BackendTable):
+        # the query is evaluated once, and the rows collected are shown instead of executing the query again
         log_data = df.limit(20).collect()
         if len(log_data) == 0:
             logger.info(f'log for [{self.target_config.name}]: no data to show')
@@ -269,8 +311,7 @@ class Step:
             logger.info(f'log for [{self.target_config.name}]: {str(log_data[0])}')
             self.collect_report(message=f'{str(log_data[0])}')
         else:
-            logger.info(f'log for [{self.target_config.name}]: ')
-            df.show(20)
+            logger.info(f'log for [{self.target_config.name}]: \n{_format_rows(log_data)}')
             self.collect_report(message=f'{str(log_data[0])}')
 
     def _write_for_check_step(self, df: BackendTable, context: ProcessorContext):
@@ -285,8 +326,9 @@ class Step:
 
         check_data = df.limit(100).collect()
         if not check_data:
+            # the count of check data is known to be 0 here, no need to execute the query again
             message = f'Data for check must contains at least one row. Please check your sql. ' \
-                      f'check={self.target_config.name}, check_data(limit 100)={check_data}, check_data_count={df.count()}'
+                      f'check={self.target_config.name}, check_data(limit 100)={check_data}, check_data_count={len(check_data)}'
             self.collect_report(message=message)
             raise SqlProcessorException(message)
         for check_item in check_data:
@@ -309,103 +351,255 @@ class Step:
         self.reporter_collector.collect_report(self, status=status, message=message)
 
 
+_STEP_CONFIG_PATTERN = re.compile(StepConfig.STEP_CONFIG_PATTERN, flags=re.IGNORECASE)
+_INCLUDE_SQL_PATTERN = re.compile(r'^--\s*include\s*=\s*(.*\.sql)\s*$', flags=re.IGNORECASE)
+_INCLUDE_PY_PATTERN = re.compile(r'^--\s*include\s*=\s*(.*)\.(\w+|\*)$', flags=re.IGNORECASE)
+
+
+class ParsedSqlCache:
+    """
+    Cache of the parsed steps, keyed by the hash of the sql content and the includes provided.
+
+    Every entry records the files and python modules included, together with their fingerprints (mtime of the file or hash of the content),
+    the entry is used only if all of them are not changed.
+    When cache_dir is provided, the entries are persisted to the directory as json files, so that they could be reused across processes.
+    """
+
+    def __init__(self, max_size: int = 128):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[str, dict]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(sql: str, includes: Dict[str, str]) -> str:
+        content = json.dumps([sql, sorted(includes.items())], ensure_ascii=False)
+        return hashlib.sha256(content.encode('utf8')).hexdigest()
+
+    def get(self, key: str, cache_dir: str = None) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and cache_dir is not None:
+            entry = self._read_from_disk(key, cache_dir)
+            if entry is not None:
+                self._put_in_memory(key, entry)
+        if entry is not None and not all(IncludeDependency.is_fresh(dep) for dep in entry['dependencies']):
+            logger.info(f'included files or modules changed, will parse sql again: key={key}')
+            return None
+        if entry is not None and cache_dir is not None and not path.exists(path.join(cache_dir, f'{key}.json')):
+            # the entry might be parsed in memory before, without the cache_dir provided
+            self._write_to_disk(key, entry, cache_dir)
+        return entry
+
+    def put(self, key: str, entry: dict, cache_dir: str = None):
+        self._put_in_memory(key, entry)
+        if cache_dir is not None:
+            self._write_to_disk(key, entry, cache_dir)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _put_in_memory(self, key: str, entry: dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _read_from_disk(self, key: str, cache_dir: str) -> Optional[dict]:
+        file = path.join(cache_dir, f'{key}.json')
+        if not path.exists(file):
+            return None
+        try:
+            with open(file) as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f'failed to read parsed sql cache from {file}, will ignore it: {e}')
+            return None
+
+    def _write_to_disk(self, key: str, entry: dict, cache_dir: str):
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            file = path.join(cache_dir, f'{key}.json')
+            tmp_file = f'{file}.{uuid.uuid4().hex}.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_file, file)
+        except Exception as e:
+            logger.warning(f'failed to write parsed sql cache to {cache_dir}, will ignore it: {e}')
+
+
+class IncludeDependency:
+
+    @staticmethod
+    def of_file(file_path: str) -> dict:
+        return {'type': 'file', 'path': path.abspath(file_path), 'mtime': path.getmtime(file_path)}
+
+    @staticmethod
+    def of_content(name: str, content: str) -> dict:
+        return {'type': 'content', 'name': name, 'hash': hashlib.sha256(str(content).encode('utf8')).hexdigest()}
+
+    @staticmethod
+    def of_module(module: str, sql_name: str, content: str) -> dict:
+        return dict(IncludeDependency.of_content(sql_name, content), type='module', module=module)
+
+    @staticmethod
+    def is_fresh(dependency: dict) -> bool:
+        try:
+            if dependency['type'] == 'file':
+                return path.exists(dependency['path']) and path.getmtime(dependency['path']) == dependency['mtime']
+            elif dependency['type'] == 'module':
+                content = getattr(importlib.import_module(dependency['module']), dependency['name'])
+                return IncludeDependency.of_module(dependency['module'], dependency['name'], content) == dependency
+            elif dependency['type'] == 'content':
+                return IncludeDependency.of_content(dependency['name'], StepFactory.read_include_file(dependency['name'])[0]) == dependency
+        except Exception:
+            return False
+        return False
+
+
+_parsed_sql_cache = ParsedSqlCache()
+
+
+def _format_rows(rows: List[SchemaRow]) -> str:
+    """
+    Format the rows as a table, the same as the data shown by spark.
+    """
+    names = rows[0].schema.names
+    values = [['null' if value is None else str(value) for value in row.as_tuple()] for row in rows]
+    widths = [max([len(name)] + [len(row_values[i]) for row_values in values]) for i, name in enumerate(names)]
+    separator = '+' + '+'.join(['-' * width for width in widths]) + '+'
+    lines = [separator, '|' + '|'.join([name.rjust(width) for name, width in zip(names, widths)]) + '|', separator]
+    lines.extend(['|' + '|'.join([value.rjust(width) for value, width in zip(row_values, widths)]) + '|' for row_values in values])
+    lines.append(separator)
+    return '\n'.join(lines)
+
+
 class StepFactory:
+    MAX_INCLUDE_DEPTH = 64
 
-    def __init__(self, reporter: ReportCollector, func_runner: FuncRunner):
+    def __init__(self, reporter: ReportCollector, func_runner: FuncRunner, parse_cache_dir: str = None):
         self.reporter = reporter
         self.func_runner = func_runner
+        self.parse_cache_dir = parse_cache_dir
 
     def create_from_sql(self, sql: str, includes: Dict[str, str] = None) -> List[Step]:
         includes = includes or {}
-        resolved_sql = self._resolve_include(sql, includes)
+        cache_key = ParsedSqlCache.key(sql, includes)
+        parsed = _parsed_sql_cache.get(cache_key, self.parse_cache_dir)
+        if parsed is None:
+            dependencies = []
+            resolved_sql = self._resolve_include(sql, includes, dependencies)
+            parsed = {'dependencies': dependencies, 'steps': self._parse_steps(resolved_sql)}
+            _parsed_sql_cache.put(cache_key, parsed, self.parse_cache_dir)
+
+        step_list = []
+        for step_type, step_name, condition, line_no, step_config_str, select_sql in parsed['steps']:
+            target_config = StepConfig(step_type, step_name, condition, line_no, step_config_str) if step_type is not None else None
+            step_list.append(Step(f'step-{len(step_list) + 1}', self.reporter, self.func_runner,
+                                  target_config=target_config, select_sql=select_sql))
+        self._collect_following_steps(step_list)
+        return step_list
+
+    def _collect_following_steps(self, steps: List[Step]):
+        for index, step in enumerate(steps):
+            if step.target_config is None or step.target_config.step_type not in [StepType.TEMP, StepType.CACHE, StepType.BROADCAST]:
+                continue
+            name = (step.target_config.name or '').lower()
+            for following_step in steps[index + 1:]:
+                step.following_steps.append(following_step)
+                if following_step.target_config is not None and (following_step.target_config.name or '').lower() == name:
+                    # the table is replaced by the following step
+                    break
+
+    def _parse_steps(self, resolved_sql: str) -> List[list]:
         lines = resolved_sql.split('\n')
 
         index = 0
         sql_parts = []
         step_list = []
-        step = Step(f'step-{len(step_list) + 1}', self.reporter, self.func_runner)
+        step = [None, None, None, None, None, None]
         while index < len(lines):
             line = lines[index].replace(";", '')
             line_stripped = line.strip()
-            if re.compile(StepConfig.STEP_CONFIG_PATTERN, flags=re.IGNORECASE).match(line_stripped):
+            if _STEP_CONFIG_PATTERN.match(line_stripped):
                 if len(sql_parts) > 0:
-                    step.select_sql = '\n'.join(sql_parts)
-                if step.target_config is not None:
+                    step[5] = '\n'.join(sql_parts)
+                if step[0] is not None:
                     step_list.append(step)
-                step = Step(f'step-{len(step_list) + 1}', self.reporter, self.func_runner)
                 sql_parts = []
-                target_config = StepConfig.from_config_line(line_stripped, index + 1)
-                step.target_config = target_config
+                config = StepConfig.from_config_line(line_stripped, index + 1)
+                step = [config.step_type, config.name, config.condition, config.line_no, config.step_config_str, None]
                 if index == len(lines) - 1:
                     step_list.append(step)
             elif index == len(lines) - 1:
                 if '' != line_stripped:
                     sql_parts.append(line)
                 if len(sql_parts) > 0:
-                    step.select_sql = '\n'.join(sql_parts)
+                    step[5] = '\n'.join(sql_parts)
                 step_list.append(step)
             elif '' != line_stripped:
                 sql_parts.append(line)
             index += 1
         return step_list
 
-    def _resolve_include(self, sql, includes: Dict[str, str]) -> str:
-        include_sql_pattern = r'^--\s*include\s*=\s*(.*\.sql)\s*$'
-        include_py_pattern = r'^--\s*include\s*=\s*(.*)\.(\w+|\*)$'
+    def _resolve_include(self, sql, includes: Dict[str, str], dependencies: List[dict] = None, depth: int = 0) -> str:
+        if depth > StepFactory.MAX_INCLUDE_DEPTH:
+            raise SqlProcessorException(f'too many levels of includes(max is {StepFactory.MAX_INCLUDE_DEPTH}), is there a circular include?')
+        dependencies = dependencies if dependencies is not None else []
+        if 'include' not in sql.lower():
+            return sql
         lines = sql.split('\n')
         resoloved_sqls = []
         for index, line in enumerate(lines):
             line = line.replace(";", '')
             line_stripped = line.strip()
-            if re.match(include_sql_pattern, line_stripped, flags=re.IGNORECASE):
-                matches = re.match(include_sql_pattern, line_stripped, flags=re.IGNORECASE)
-                if len(matches.groups()) != 1:
+            sql_matches = _INCLUDE_SQL_PATTERN.match(line_stripped)
+            py_matches = _INCLUDE_PY_PATTERN.match(line_stripped) if not sql_matches else None
+            if sql_matches:
+                if len(sql_matches.groups()) != 1:
                     raise SqlProcessorException(f'parse include config failed. must provide complete module name and the sql variable name.'
                                                 f'bug got config line {line_stripped}')
-                file = matches.group(1)
+                file = sql_matches.group(1)
                 if file in includes:
-                    resoloved_sqls.append(includes[file])
-                    continue
-
-                try:
-                    import importlib
-                    func_mod = importlib.import_module('common.file_reader')
-                    read_file_func = getattr(func_mod, 'read_file')
-                    resoloved_sqls.append(read_file_func(file))
-                except ModuleNotFoundError:
-                    logger.info(f'failed to import common.file_reader, will try default file reader')
-                    resoloved_sqls.append(SqlSnippetsReader.read_file(file))
-            elif re.match(include_py_pattern, line_stripped, flags=re.IGNORECASE):
-                matches = re.match(include_py_pattern, line_stripped, flags=re.IGNORECASE)
-                if len(matches.groups()) != 2:
+                    snippet = includes[file]
+                else:
+                    snippet, dependency = StepFactory.read_include_file(file)
+                    dependencies.append(dependency)
+                resoloved_sqls.append(self._resolve_include(snippet, includes, dependencies, depth + 1))
+            elif py_matches:
+                if len(py_matches.groups()) != 2:
                     raise SqlProcessorException(f'parse include config failed. must provide complete module name and the sql variable name.'
                                                 f'bug got config line {line_stripped}')
-                module = matches.group(1)
-                sql_name = matches.group(2)
-                import importlib
+                module = py_matches.group(1)
+                sql_name = py_matches.group(2)
                 snippet_mod = importlib.import_module(module)
-                resoloved_sqls.append(getattr(snippet_mod, sql_name))
+                snippet = getattr(snippet_mod, sql_name)
+                dependencies.append(IncludeDependency.of_module(module, sql_name, snippet))
+                resoloved_sqls.append(self._resolve_include(snippet, includes, dependencies, depth + 1))
             else:
                 resoloved_sqls.append(line)
-        resolved_sql = '\n'.join(resoloved_sqls)
-        if self._need_resolve(resolved_sql, include_sql_pattern, include_py_pattern):
-            return self._resolve_include(resolved_sql, includes)
-        return resolved_sql
-
-    def _need_resolve(self, resolved_sql, include_sql_pattern, include_py_pattern):
-        lines = resolved_sql.split('\n')
-        return any((self._match_sql_or_py_pattern(include_py_pattern, include_sql_pattern, line.replace(";", '').strip())
-                    for line in lines))
+        return '\n'.join(resoloved_sqls)
 
-    def _match_sql_or_py_pattern(self, include_py_pattern, include_sql_pattern, line):
-        return re.match(include_sql_pattern, line, flags=re.IGNORECASE) \
-               or re.match(include_py_pattern, line, flags=re.IGNORECASE)
+    @staticmethod
+    def read_include_file(file: str) -> Tuple[str, dict]:
+        try:
+            func_mod = importlib.import_module('common.file_reader')
+            read_file_func = getattr(func_mod, 'read_file')
+            content = read_file_func(file)
+            return content, IncludeDependency.of_content(file, content)
+        except ModuleNotFoundError:
+            logger.info(f'failed to import common.file_reader, will try default file reader')
+            file_path = SqlSnippetsReader.find_file(file)
+            return SqlSnippetsReader.read_file(file_path), IncludeDependency.of_file(file_path)
 
 
 class SqlSnippetsReader:
 
     @staticmethod
-    def read_file(file_name: str, base_path: str = None) -> str:
+    def find_file(file_name: str, base_path: str = None) -> str:
         possible_paths = [file_name]
         if base_path is not None:
             possible_paths.append(path.join(base_path, file_name))
@@ -414,8 +608,13 @@ class SqlSnippetsReader:
             if not path.exists(p):
                 logger.info(f'file not found, tried: {p}')
                 continue
-            logger.info(f'read file at path: {p}')
-            with open(p) as f:
-                return f.read()
+            return p
 
         raise FileNotFoundError(f'file not found: tried_paths={possible_paths}')
+
+    @staticmethod
+    def read_file(file_name: str, base_path: str = None) -> str:
+        p = SqlSnippetsReader.find_file(file_name, base_path)
+        logger.info(f'read file at path: {p}')
+        with open(p) as f:
+            return f.read()
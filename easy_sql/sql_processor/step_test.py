@@ -1,6 +1,14 @@
+import os
+import tempfile
+import time
 import unittest
+from types import SimpleNamespace
 
 from easy_sql.sql_processor import StepConfig, SqlProcessorException
+from easy_sql.logger import logger
+from easy_sql.sql_processor.backend.rdb import RdbTable
+from easy_sql.sql_processor.context import ProcessorContext, VarsContext, TemplatesContext
+from easy_sql.sql_processor.step import StepFactory, ParsedSqlCache, Step, _parsed_sql_cache
 
 
 class StepConfigTest(unittest.TestCase):
@@ -24,5 +32,130 @@ class StepConfigTest(unittest.TestCase):
             StepConfig.from_config_line('-- target=unknown_type', 0)
 
 
+class StepFactoryTest(unittest.TestCase):
+
+    def setUp(self):
+        # the parsed sql is cached in the process, which should not be shared by the tests
+        _parsed_sql_cache.clear()
+
+    def test_should_create_steps_with_includes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            include_file = os.path.join(temp_dir, 'included.sql')
+            with open(include_file, 'w') as f:
+                f.write('-- target=temp.included\nselect 1 as a;\n-- include=snippet.sql')
+            sql = f'''
+-- target=variables
+select 1 as a
+-- include={include_file}
+-- target=temp.final
+select * from included
+'''
+            steps = StepFactory(None, None).create_from_sql(sql, {'snippet.sql': '-- target=temp.snippet\nselect 2 as a'})
+            self.assertEqual([(step.id, step.target_config.step_type, step.target_config.name, step.select_sql) for step in steps], [
+                ('step-1', 'variables', None, 'select 1 as a'),
+                ('step-2', 'temp', 'included', 'select 1 as a'),
+                ('step-3', 'temp', 'snippet', 'select 2 as a'),
+                ('step-4', 'temp', 'final', 'select * from included'),
+            ])
+            cached_steps = StepFactory(None, None).create_from_sql(sql, {'snippet.sql': '-- target=temp.snippet\nselect 2 as a'})
+            self.assertEqual([repr(step) for step in cached_steps], [repr(step) for step in steps])
+            self.assertIsNot(cached_steps[0], steps[0])
+
+            time.sleep(0.01)
+            with open(include_file, 'w') as f:
+                f.write('-- target=temp.included\nselect 3 as a')
+            os.utime(include_file, (time.time() + 10, time.time() + 10))
+            steps = StepFactory(None, None).create_from_sql(sql, {'snippet.sql': '-- target=temp.snippet\nselect 2 as a'})
+            self.assertEqual([step.select_sql for step in steps], ['select 1 as a', 'select 3 as a', 'select * from included'])
+
+    def test_should_fail_for_circular_includes(self):
+        with self.assertRaises(SqlProcessorException):
+            StepFactory(None, None).create_from_sql('-- include=a.sql', {'a.sql': '-- include=b.sql', 'b.sql': '-- include=a.sql'})
+
+    def test_should_persist_parsed_sql_in_cache_dir(self):
+        sql = '-- target=temp.a\nselect 1 as a'
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # parsed in memory before, should still be persisted
+            StepFactory(None, None).create_from_sql(sql)
+            StepFactory(None, None, parse_cache_dir=temp_dir).create_from_sql(sql)
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, f'{ParsedSqlCache.key(sql, {})}.json')))
+            entry = ParsedSqlCache().get(ParsedSqlCache.key(sql, {}), temp_dir)
+            self.assertEqual(entry['steps'], [['temp', 'a', None, 1, '-- target=temp.a', 'select 1 as a']])
+
+
+def _recording_table(sql: str, executed_sqls: list) -> RdbTable:
+    from sqlalchemy import create_engine
+    conn = create_engine('sqlite://').connect()
+    conn.execute('create table t (a int, b text)')
+    conn.execute('insert into t values (1, "x"), (2, null), (3, "z")')
+    recording_conn = SimpleNamespace(execute=lambda sql, *args, **kwargs: executed_sqls.append(sql) or conn.execute(sql, *args, **kwargs))
+    return RdbTable(SimpleNamespace(sql_dialect=None, conn=recording_conn, is_pg=False), sql)
+
+
+class _ReportCollector:
+
+    def collect_report(self, step, status=None, message=None):
+        pass
+
+
+class StepTest(unittest.TestCase):
+
+    def test_should_count_references_of_temp_tables(self):
+        steps = StepFactory(None, None).create_from_sql('''
+-- target=temp.a
+select 1 as id
+-- target=temp.b
+select * from a
+-- target=temp.c
+select a.id, b.id as b from a join b on a.id = b.id
+-- target=temp.a
+select 2 as id
+-- target=output.db.t
+select * from a
+''')
+        context = ProcessorContext(VarsContext(), TemplatesContext())
+        self.assertEqual([steps[i].reference_count(context) for i in [0, 1, 2, 3]], [2, 1, 0, 1])
+
+        def should_materialize(step, value):
+            return step._should_materialize(ProcessorContext(VarsContext({'__materialize__': value}), TemplatesContext()))
+        self.assertEqual([should_materialize(steps[1], value) for value in ['auto', 'true', 'false']], [False, True, False])
+        self.assertTrue(should_materialize(steps[0], 'auto'))
+        self.assertFalse(steps[0]._should_materialize(context))
+
+    def test_should_count_references_with_templates_and_variables_resolved(self):
+        steps = StepFactory(None, None).create_from_sql('''
+-- target=temp.a
+select 1 as id
+-- target=temp.b
+select a from ${table} a
+-- target=temp.c
+with x as (select 1 as a) select a from @{read_a} union all select a from x
+''')
+        context = ProcessorContext(VarsContext({'table': 'a'}), TemplatesContext(templates={'read_a': 'a'}))
+        self.assertEqual(steps[0].reference_count(context), 2)
+
+    def test_should_evaluate_log_step_once(self):
+        executed_sqls = []
+        step = Step('1', _ReportCollector(), None, StepConfig('log', 'a', None, 1))
+        with self.assertLogs(logger, 'INFO') as logs:
+            step._write_for_log_step(_recording_table('select * from t order by a', executed_sqls))
+        self.assertEqual(len(executed_sqls), 1)
+        self.assertEqual(logs.records[-1].getMessage(), 'log for [a]: \n+-+----+\n|a|   b|\n+-+----+\n|1|   x|\n|2|null|\n|3|   z|\n+-+----+')
+
+    def test_should_evaluate_variables_step_once(self):
+        executed_sqls = []
+        step = Step('1', _ReportCollector(), None, StepConfig('variables', None, None, 1))
+        context = ProcessorContext(VarsContext(), TemplatesContext())
+        step.write(None, _recording_table('select * from t where a > 1 order by a', executed_sqls), context)
+        self.assertEqual(len(executed_sqls), 1)
+        self.assertEqual((context.vars['a'], context.vars['b']), ('2', 'null'))
+
+    def test_should_evaluate_check_step_once(self):
+        executed_sqls = []
+        step = Step('1', _ReportCollector(), None, StepConfig('check', 'a', None, 1))
+        with self.assertRaisesRegex(SqlProcessorException, 'check_data_count=0'):
+            step._write_for_check_step(_recording_table('select * from t where a > 3', executed_sqls), None)
+        self.assertEqual(len(executed_sqls), 1)
+
 if __name__ == '__main__':
     unittest.main()
@@ -4,7 +4,7 @@ import re
 import sys
 import unittest
 from datetime import datetime
-from typing import List, Tuple, Any, Dict, Callable, Union, Optional
+from typing import List, Tuple, Any, Dict, Callable, Union, Optional, Iterator
 
 import xlrd
 from bson import json_util
@@ -14,7 +14,7 @@ from xlrd.sheet import Sheet, Cell
 __all__ = ['SqlTester', 'TableData', 'TestCase', 'WorkPath', 'work_path', 'SqlReader', 'TableColumnTypes']
 
 from easy_sql.sql_processor import SqlProcessor
-from easy_sql.sql_processor.backend import Backend, SparkBackend, Row, Partition
+from easy_sql.sql_processor.backend import Backend, SparkBackend, Row, Partition, Table
 from easy_sql.sql_processor.backend.rdb import RdbBackend, Col
 from easy_sql.logger import logger
 
@@ -587,12 +587,12 @@ class TestCaseRunner:
         finally:
             backend.clean()
 
-    def verify_outputs(self, backend: Backend, case: TestCase):
+    def verify_outputs(self, backend: Backend, case: TestCase, batch_size: int = 1000):
         tempviews = backend.temp_tables()
         print('tempviews after test:', tempviews)
         for output in case.outputs:
             tempview_name = self.find_temp_view_for_output(case, output, tempviews)
-            actual_output, expected_output = self.get_data(backend, output, tempview_name)
+            actual_table, expected_table = self.get_output_tables(backend, output, tempview_name)
 
             def list_item_to_set(values: List[Union[List, Row]]):
                 result = []
@@ -601,9 +601,34 @@ class TestCaseRunner:
                 return result
 
             print('will verify equality for output: ', output.name)
-            print('expected output: ', list_item_to_set(expected_output))
-            print('actual output: ', list_item_to_set(actual_output))
-            self.unit_test_case.assertListEqual(list_item_to_set(expected_output), list_item_to_set(actual_output))
+            # the expected rows are defined in the test case and are fetched at first, then the actual output is streamed batch by batch,
+            # so that large outputs could be verified with bounded memory, with one query on the connection of the backend at a time
+            expected_rows = [row for rows in self._iter_row_batches(expected_table, batch_size) for row in rows]
+            start = 0
+            for actual_output in self._iter_row_batches(actual_table, batch_size):
+                expected_output = expected_rows[start:start + len(actual_output)]
+                start += len(actual_output)
+                print('expected output: ', list_item_to_set(expected_output))
+                print('actual output: ', list_item_to_set(actual_output))
+                self.unit_test_case.assertListEqual(list_item_to_set(expected_output), list_item_to_set(actual_output))
+            if start < len(expected_rows):
+                expected_output = expected_rows[start:]
+                print('expected output: ', list_item_to_set(expected_output))
+                print('actual output: ', [])
+                self.unit_test_case.assertListEqual(list_item_to_set(expected_output), [])
+
+    @staticmethod
+    def _iter_row_batches(table: Table, batch_size: int) -> Iterator[List[Row]]:
+        # backends may return batches of different sizes, re-batch rows to make batches of both sides comparable
+        batch = []
+        for rows in table.iter_batches(batch_size):
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
 
     def create_sql_processor(self, backend: Backend, case: TestCase, sql: str) -> SqlProcessor:
         sql_processor = self.sql_processor_creator(backend, sql, case)
@@ -616,15 +641,21 @@ class TestCaseRunner:
         return sql_processor
 
     def get_data(self, backend: Backend, output: TableData, tempview_name: str) -> Tuple[List[Row], List[Row]]:
+        actual_table, expected_table = self.get_output_tables(backend, output, tempview_name)
+        actual_output = [row for rows in actual_table.iter_batches() for row in rows]
+        expected_output = [row for rows in expected_table.iter_batches() for row in rows]
+        return actual_output, expected_output
+
+    def get_output_tables(self, backend: Backend, output: TableData, tempview_name: str) -> Tuple[Table, Table]:
         full_tempview_name = f"{backend.temp_schema}.{tempview_name}" if backend.is_bigquery_backend else tempview_name
         select_output_sql = f'select {", ".join(output.columns)} from {full_tempview_name} order by {", ".join(output.columns)}'
-        actual_output = backend.exec_sql(select_output_sql).collect()
+        actual_table = backend.exec_sql(select_output_sql)
 
         schema = self.table_column_types.column_types_to_schema(backend, output.columns, output.column_types)
         backend.create_temp_table_with_data(f'{full_tempview_name}__expected', output.values, schema)
         select_output_sql = f'select {", ".join(output.columns)} from {full_tempview_name}__expected order by {", ".join(output.columns)}'
-        expected_output = backend.exec_sql(select_output_sql).collect()
-        return actual_output, expected_output
+        expected_table = backend.exec_sql(select_output_sql)
+        return actual_table, expected_table
 
     def find_temp_view_for_output(self, case: TestCase, output: TableData, tempviews: List[str]) -> str:
         # tempview name format: {output_pure_table_name}_{md5(xxx)}
@@ -1,8 +1,9 @@
 import os.path
 import unittest
 from datetime import datetime
+from types import SimpleNamespace
 
-from easy_sql.sql_tester import TableColumnTypes, TestDataFile, SqlReader, work_path
+from easy_sql.sql_tester import TableColumnTypes, TestDataFile, SqlReader, work_path, TableData, TestCaseRunner
 
 
 class TableColumnTypesTest(unittest.TestCase):
@@ -69,3 +70,39 @@ class TestCaseParserTest(unittest.TestCase):
         self.assertEqual(input.column_types, ['int', 'string', 'date', 'date'])
         self.assertEqual(input.values, [[1, '1', datetime(2021, 1, 1, 0, 0), datetime(2021, 1, 1, 0, 0)]])
         self.assertEqual(case.outputs[0].values, [[1, '1', datetime(2021, 1, 1, 0, 0)], [1, '2', None], [1, '3', None]])
+
+
+class _StreamingTable:
+
+    def __init__(self, rows, active_queries):
+        self.rows, self.active_queries = rows, active_queries
+
+    def iter_batches(self, batch_size: int = 1000):
+        # only one query could be executed on the connection at a time
+        self.active_queries.append(self)
+        if len(self.active_queries) > 1:
+            raise Exception('another query is running on the connection')
+        for start in range(0, len(self.rows), batch_size):
+            yield self.rows[start:start + batch_size]
+        self.active_queries.remove(self)
+
+
+class TestCaseRunnerTest(unittest.TestCase):
+
+    def verify(self, actual_rows, expected_rows):
+        active_queries = []
+        runner = TestCaseRunner('test', False, None, None, None, None)
+        runner.find_temp_view_for_output = lambda case, output, tempviews: output.name
+        runner.get_output_tables = lambda backend, output, tempview_name: (_StreamingTable(actual_rows, active_queries),
+                                                                           _StreamingTable(expected_rows, active_queries))
+        case = SimpleNamespace(outputs=[TableData('t', ['a'], ['int'], [], [])])
+        runner.verify_outputs(SimpleNamespace(temp_tables=lambda: []), case, batch_size=2)
+
+    def test_should_verify_outputs_with_one_query_at_a_time(self):
+        self.verify([[1], [2], [3]], [[1], [2], [3]])
+        with self.assertRaises(AssertionError):
+            self.verify([[1], [2], [3]], [[1], [2], [4]])
+        with self.assertRaises(AssertionError):
+            self.verify([[1], [2]], [[1], [2], [3]])
+        with self.assertRaises(AssertionError):
+            self.verify([[1], [2], [3]], [[1], [2]])